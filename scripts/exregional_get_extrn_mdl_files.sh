@@ -31,6 +31,8 @@
 #    USHdir
 #
 #  platform:
+#    EXTRN_MDL_CACHE_DIR
+#    EXTRN_MDL_CACHE_MAX_SIZE_GB
 #    EXTRN_MDL_DATA_STORES
 #
 #  workflow:
@@ -211,6 +213,15 @@ if [ -n "${input_file_path:-}" ] ; then
   --input_file_path ${input_file_path}"
 fi
 
+if [ -n "${EXTRN_MDL_CACHE_DIR:-}" ] ; then
+  additional_flags="$additional_flags \
+  --cache_dir ${EXTRN_MDL_CACHE_DIR}"
+  if [ -n "${EXTRN_MDL_CACHE_MAX_SIZE_GB:-}" ] ; then
+    additional_flags="$additional_flags \
+  --cache_max_size ${EXTRN_MDL_CACHE_MAX_SIZE_GB}"
+  fi
+fi
+
 if [ $(boolify $SYMLINK_FIX_FILES) = "TRUE" ]; then
   additional_flags="$additional_flags \
   --symlink"
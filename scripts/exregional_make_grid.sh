@@ -486,6 +486,14 @@ echo "workflow: {CRES: ${CRES}}" | uw config realize \
   --output-file $GLOBAL_VAR_DEFNS_FP \
   --verbose
 
+# Update the shell versions of its sections to match, so that later jobs
+# can still source them without running uw.
+python3 $USHdir/create_var_defns_sh_files.py \
+  --path-to-defns ${GLOBAL_VAR_DEFNS_FP} || \
+print_err_msg_exit "\
+Call to script to write the shell versions of the sections of
+GLOBAL_VAR_DEFNS_FP failed."
+
 #
 #-----------------------------------------------------------------------
 #
@@ -6,11 +6,10 @@ import logging
 
 sys.path.append("../../ush")
 
-from python_utils import load_config_file
-
 from check_python_version import check_python_version
 
-from utils import calculate_core_hours, create_expts_dict, print_WE2E_summary, write_monitor_file
+from utils import calculate_core_hours, create_expts_dict, print_WE2E_summary, write_monitor_file,\
+                  load_monitor_file
 
 def setup_logging(debug: bool = False) -> None:
     """
@@ -64,7 +63,7 @@ if __name__ == "__main__":
     if args.expt_dir:
         yaml_file, expts_dict = create_expts_dict(args.expt_dir)
     elif args.yaml_file:
-        expts_dict = load_config_file(args.yaml_file)
+        expts_dict = load_monitor_file(args.yaml_file)
     else:
         raise ValueError(f'Bad arguments; run {__file__} -h for more information')
 
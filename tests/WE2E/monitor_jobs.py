@@ -6,15 +6,16 @@ import logging
 import time
 from textwrap import dedent
 from datetime import datetime
+from contextlib import ExitStack, closing
 
 sys.path.append("../../ush")
 
-from python_utils import load_config_file
-
 from check_python_version import check_python_version
 
 from utils import calculate_core_hours, write_monitor_file, update_expt_status,\
-                  update_expt_status_parallel, print_WE2E_summary
+                  print_WE2E_summary, poll_expt_status, RocotorunRunner,\
+                  ExptPollSchedule, RocotoJobsReader, MonitorStore,\
+                  monitor_store_file, load_monitor_file, export_monitor_file
 
 def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
                  mode: str = 'continuous', debug: bool = False) -> str:
@@ -22,7 +23,7 @@ def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
 
     Args:
         expts_dict  (dict): A dictionary containing the information needed to run one or more experiments. See example file ``monitor_jobs.yaml``.
-        monitor_file (str): [optional] Name of the file used to monitor experiment results. Default is ``monitor_jobs.yaml``. 
+        monitor_file (str): [optional] Name of the file used to monitor experiment results. Default is ``monitor_jobs.yaml``. While the experiments are monitored, their state is kept in a ``MonitorStore`` database with the same name and the ``.db`` extension, and the file is written from it when monitoring stops.
         procs        (int): [optional] The number of parallel processes to run
         mode         (str): [optional] Mode of job monitoring. Options: (1) ``'continuous'`` (default): monitor jobs continuously until complete or (2) ``'advance'``: increment jobs once, then quit.
         debug       (bool): [optional] Enable extra output for debugging
@@ -37,97 +38,129 @@ def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
         monitor_file = f'WE2E_tests_{monitor_start_string}.yaml'
     logging.info(f"Writing information for all experiments to {monitor_file}")
 
-    write_monitor_file(monitor_file,expts_dict)
-
-    # Perform initial setup for each experiment
-    logging.info("Checking tests available for monitoring...")
-
-    # Check that there are no duplicate directories; this avoids weird failures if someone
-    # cats multiple yaml files that have one or more duplicate run directories
-    logging.debug("Checking for duplicate working directories")
-    dirlist = []
-    for expt in expts_dict:
-         if expts_dict[expt]['expt_dir'] in dirlist:
-             raise ValueError(f"Found duplicate experiment directory \n    {expts_dict[expt]['expt_dir']}\nin experiments yaml file {monitor_file}; experiments can not share a working directory!")
-         else:
-             dirlist.append(expts_dict[expt]['expt_dir'])
-
-    if procs > 1:
-        print(f'Starting experiments in parallel with {procs} processes')
-        expts_dict = update_expt_status_parallel(expts_dict, procs, True, debug)
-    else:
+    # The store, the runner and the readers are closed however monitoring stops, e.g., with
+    # ctrl-c
+    with ExitStack() as stack:
+        # The state of the experiments is saved after each poll to the store, which only writes
+        # what changed; the monitor file is exported from it
+        store = stack.enter_context(closing(MonitorStore(monitor_store_file(monitor_file))))
+        store.save(expts_dict)
+
+        # Perform initial setup for each experiment
+        logging.info("Checking tests available for monitoring...")
+
+        # Check that there are no duplicate directories; this avoids weird failures if someone
+        # cats multiple yaml files that have one or more duplicate run directories
+        logging.debug("Checking for duplicate working directories")
+        dirlist = []
         for expt in expts_dict:
-            logging.info(f"Starting experiment {expt} running")
-            expts_dict[expt] = update_expt_status(expts_dict[expt], expt, True, debug)
-
-    write_monitor_file(monitor_file,expts_dict)
-
-    if mode != 'continuous':
-        logging.debug("All experiments have been updated")
-        return monitor_file
-    else:
-        logging.debug("Continuous mode: will monitor jobs until all are complete")
-
-    logging.info(f'Setup complete; monitoring {len(expts_dict)} experiments')
-    logging.info('Use ctrl-c to pause job submission/monitoring')
+             if expts_dict[expt]['expt_dir'] in dirlist:
+                 raise ValueError(f"Found duplicate experiment directory \n    {expts_dict[expt]['expt_dir']}\nin experiments yaml file {monitor_file}; experiments can not share a working directory!")
+             else:
+                 dirlist.append(expts_dict[expt]['expt_dir'])
+
+        # rocotorun is run for up to procs experiments at once by a single process; the databases
+        # are read here, where the readers are kept
+        runner = stack.enter_context(closing(RocotorunRunner(procs, debug=debug)))
+        # Each experiment's database is kept open, and only the jobs that changed are read from it
+        readers = {expt: stack.enter_context(closing(
+                       RocotoJobsReader(f"{expts_dict[expt]['expt_dir']}/FV3LAM_wflow.db")))
+                   for expt in expts_dict}
 
-    #Make a copy of experiment dictionary; will use this copy to monitor active experiments
-    running_expts = expts_dict.copy()
-
-    i = 0
-    while running_expts:
-        i += 1
         if procs > 1:
-            expts_dict = update_expt_status_parallel(expts_dict, procs)
-        else:
-            for expt in running_expts.copy():
-                expts_dict[expt] = update_expt_status(expts_dict[expt], expt)
-
-        for expt in running_expts.copy():
-            running_expts[expt] = expts_dict[expt]
-            if running_expts[expt]["status"] in ['DEAD','ERROR','COMPLETE']:
-                # If start_time is in dictionary, compute total walltime
-                walltimestr = ''
-                if running_expts[expt].get("start_time",{}) and not running_expts[expt].get("walltime",{}):
-                    end = datetime.now()
-                    start = datetime.strptime(running_expts[expt]["start_time"],'%Y%m%d%H%M%S')
-                    walltime = end - start
-                    walltimestr = f'Took {str(walltime)}; '
-                    running_expts[expt]["walltime"] = str(walltime)
-
-                logging.info(f'Experiment {expt} is {running_expts[expt]["status"]}')
-
-                # If failures, check how many experiments were successful
-                if debug:
-                    if running_expts[expt]["status"] != "COMPLETE":
-                        i=j=0
-                        for task in running_expts[expt]:
-                            # Skip non-task entries
-                            if task in ["expt_dir","status","start_time","walltime"]:
-                                continue
-                            j+=1
-                            if running_expts[expt][task]["status"] == "SUCCEEDED":
-                                i+=1
-                        logging.debug(f'{i} of {j} tasks were successful')
-                logging.info(f'{walltimestr}will no longer monitor.')
-                running_expts.pop(expt)
-                continue
-            logging.debug(f'Experiment {expt} status is {expts_dict[expt]["status"]}')
+            print(f'Starting experiments in parallel with {procs} processes')
+        started = runner.advance(expts_dict, {})
+        for expt in expts_dict:
+            if procs == 1:
+                logging.info(f"Starting experiment {expt} running")
+            expts_dict[expt] = update_expt_status(expts_dict[expt], expt, True, debug, submit=False,
+                                                  reader=readers[expt])
 
+        store.save(expts_dict)
         write_monitor_file(monitor_file,expts_dict)
-        endtime = datetime.now()
-        total_walltime = endtime - monitor_start
-
-        logging.debug(f"Finished loop {i}")
-        logging.debug(f"Walltime so far is {str(total_walltime)}")
-        #Slow things down just a tad between loops so experiments behave better
-        time.sleep(5)
 
-    logging.info(f'All {len(expts_dict)} experiments finished')
-    logging.info('Calculating core-hour usage and printing final summary')
-
-    # Calculate core hours and update yaml
-    expts_dict = calculate_core_hours(expts_dict)
+        if mode != 'continuous':
+            logging.debug("All experiments have been updated")
+            return monitor_file
+        else:
+            logging.debug("Continuous mode: will monitor jobs until all are complete")
+
+        logging.info(f'Setup complete; monitoring {len(expts_dict)} experiments')
+        logging.info('Use ctrl-c to pause job submission/monitoring')
+
+        #Make a copy of experiment dictionary; will use this copy to monitor active experiments
+        running_expts = expts_dict.copy()
+        # Each experiment is polled on its own schedule, less often while nothing changes
+        schedule = ExptPollSchedule(running_expts)
+        schedule.signatures.update(started)
+
+        i = 0
+        while running_expts:
+            due = schedule.due(time.monotonic())
+            if not due:
+                time.sleep(schedule.wait(time.monotonic()))
+                continue
+            i += 1
+            # Experiments that are already finished, e.g., in a resumed monitor file, are not
+            # advanced; poll_expt_status() leaves them as they are, and they are dropped below
+            advanced = runner.advance({expt: expts_dict[expt] for expt in due
+                                       if expts_dict[expt]["status"] not in ['DEAD','ERROR','COMPLETE']},
+                                      schedule.signatures)
+            polled = {expt: poll_expt_status(expts_dict[expt], expt, schedule.signatures.get(expt),
+                                             debug, readers[expt], advanced.get(expt))
+                      for expt in due}
+            now = time.monotonic()
+            for expt, (expt_dict, signature, changed) in polled.items():
+                expts_dict[expt] = expt_dict
+                schedule.polled(expt, signature, changed, expt_dict["status"], now)
+            logging.debug(f"Polled {len(due)} of {len(running_expts)} running experiments")
+
+            for expt in due:
+                running_expts[expt] = expts_dict[expt]
+                if running_expts[expt]["status"] in ['DEAD','ERROR','COMPLETE']:
+                    # If start_time is in dictionary, compute total walltime
+                    walltimestr = ''
+                    if running_expts[expt].get("start_time",{}) and not running_expts[expt].get("walltime",{}):
+                        end = datetime.now()
+                        start = datetime.strptime(running_expts[expt]["start_time"],'%Y%m%d%H%M%S')
+                        walltime = end - start
+                        walltimestr = f'Took {str(walltime)}; '
+                        running_expts[expt]["walltime"] = str(walltime)
+
+                    logging.info(f'Experiment {expt} is {running_expts[expt]["status"]}')
+
+                    # If failures, check how many experiments were successful
+                    if debug:
+                        if running_expts[expt]["status"] != "COMPLETE":
+                            i=j=0
+                            for task in running_expts[expt]:
+                                # Skip non-task entries
+                                if task in ["expt_dir","status","start_time","walltime"]:
+                                    continue
+                                j+=1
+                                if running_expts[expt][task]["status"] == "SUCCEEDED":
+                                    i+=1
+                            logging.debug(f'{i} of {j} tasks were successful')
+                    logging.info(f'{walltimestr}will no longer monitor.')
+                    running_expts.pop(expt)
+                    schedule.remove(expt)
+                    readers.pop(expt).close()
+                    continue
+                logging.debug(f'Experiment {expt} status is {expts_dict[expt]["status"]}')
+
+            store.save(expts_dict, [expt for expt, (_, _, changed) in polled.items() if changed])
+            endtime = datetime.now()
+            total_walltime = endtime - monitor_start
+
+            logging.debug(f"Finished loop {i}")
+            logging.debug(f"Walltime so far is {str(total_walltime)}")
+
+        logging.info(f'All {len(expts_dict)} experiments finished')
+        logging.info('Calculating core-hour usage and printing final summary')
+
+        # Calculate core hours and update yaml
+        expts_dict = calculate_core_hours(expts_dict)
+        store.save(expts_dict)
     write_monitor_file(monitor_file,expts_dict)
 
     #Call function to print summary
@@ -188,6 +221,10 @@ if __name__ == "__main__":
                         help='continuous: script will run continuously until all experiments are'\
                              'finished.'\
                              'advance: will only advance each experiment one step')
+    parser.add_argument('-e', '--export', action='store_true',
+                        help='Write the yaml file from the state of the experiments saved while '\
+                             'they were monitored, e.g., to check on them while monitor_jobs is '\
+                             'running in another shell, then quit')
     parser.add_argument('-d', '--debug', action='store_true',
                         help='Script will be run in debug mode with more verbose output. ' +
                              'WARNING: increased verbosity may run very slowly on some platforms')
@@ -196,8 +233,14 @@ if __name__ == "__main__":
 
     setup_logging(logfile,args.debug)
 
+    if args.export:
+        if not export_monitor_file(args.yaml_file):
+            sys.exit(f"No experiments saved in {monitor_store_file(args.yaml_file)}")
+        logging.info(f"Wrote {args.yaml_file}")
+        sys.exit()
+
     logging.debug(f"Loading configure file {args.yaml_file}")
-    expts_dict = load_config_file(args.yaml_file)
+    expts_dict = load_monitor_file(args.yaml_file)
 
     if args.procs < 1:
         raise ValueError('You can not have less than one parallel process; select a valid value for --procs')
@@ -208,6 +251,7 @@ if __name__ == "__main__":
         monitor_jobs(expts_dict=expts_dict,monitor_file=args.yaml_file,procs=args.procs,
                      mode=args.mode,debug=args.debug)
     except KeyboardInterrupt:
+        export_monitor_file(args.yaml_file)
         logging.info("\n\nUser interrupted monitor script; to resume monitoring jobs run:\n")
         logging.info(f"{__file__} -y={args.yaml_file} -p={args.procs}\n")
     except:
@@ -4,14 +4,16 @@
 import os
 import sys
 import glob
+import shutil
 import argparse
 import logging
+import tempfile
 from textwrap import dedent
 from datetime import datetime
 
 sys.path.insert(1, "../../ush")
 
-from generate_FV3LAM_wflow import generate_FV3LAM_wflow
+from generate_FV3LAM_wflow import generate_FV3LAM_wflow_batch
 from python_utils import (
     cfg_to_yaml_str,
     load_config_file,
@@ -19,7 +21,7 @@ from python_utils import (
 
 from check_python_version import check_python_version
 
-from monitor_jobs import monitor_jobs, write_monitor_file
+from monitor_jobs import monitor_jobs, write_monitor_file, export_monitor_file
 from utils import print_test_info
 
 def run_we2e_tests(homedir, args) -> None:
@@ -151,9 +153,12 @@ def run_we2e_tests(homedir, args) -> None:
     logging.debug(f"Loading machine defaults file {machine_file}")
     machine_defaults = load_config_file(machine_file)
 
-    # Set up dictionary for job monitoring yaml
-    if args.launch != "cron":
-        monitor_yaml = dict()
+    # Each test's config.yaml, and its log file until the experiment is generated, go in a
+    # directory of its own so that the experiments can be generated in parallel
+    work_dir = tempfile.mkdtemp(prefix="WE2E_generate_", dir=os.getcwd())
+    test_configs = dict()
+    start_times = dict()
+    use_cron = dict()
 
     for test in tests_to_run:
         #Starting with test yaml template, fill in user-specified and machine- and
@@ -223,33 +228,55 @@ def run_we2e_tests(homedir, args) -> None:
         logging.debug(f"Writing updated config.yaml for test {test_name}\n"\
                        "based on specified command-line arguments:\n")
         logging.debug(cfg_to_yaml_str(test_cfg))
-        with open(os.path.join(ushdir,"config.yaml"),"w", encoding="utf-8") as f:
+        test_dir = os.path.join(work_dir, test_name)
+        os.makedirs(test_dir)
+        test_configs[test_name] = os.path.join(test_dir, "config.yaml")
+        start_times[test_name] = starttime_string
+        use_cron[test_name] = test_cfg['workflow'].get('USE_CRON_TO_RELAUNCH', False)
+        with open(test_configs[test_name], "w", encoding="utf-8") as f:
             f.writelines(cfg_to_yaml_str(test_cfg))
 
-        logging.info(f"Calling workflow generation function for test {test_name}\n")
-        if args.quiet:
-            console_handler = logging.getLogger().handlers[1]
-            console_handler.setLevel(logging.WARNING)
-        expt_dir = generate_FV3LAM_wflow(ushdir,logfile=f"{ushdir}/log.generate_FV3LAM_wflow",
-                                         debug=args.debug)
-        if args.quiet:
-            if args.debug:
-                console_handler.setLevel(logging.DEBUG)
-            else:
-                console_handler.setLevel(logging.INFO)
-        logging.info(f"Workflow for test {test_name} successfully generated in\n{expt_dir}\n")
+    # Rewriting the crontab from several processes at once could lose lines
+    procs = 1 if any(use_cron.values()) else args.procs
+    logging.info(f"Generating {len(test_configs)} experiments using {procs} processes\n")
+    results = generate_FV3LAM_wflow_batch(ushdir, test_configs, procs=procs, machine=machine,
+                                          debug=args.debug, quiet=args.quiet)
+
+    # Set up dictionary for job monitoring yaml
+    monitor_yaml = dict()
+
+    failed = []
+    for result in results:
+        test_name = result["name"]
+        if result["error"] is not None:
+            failed.append(test_name)
+            logging.error(f"Workflow generation for test {test_name} failed after "\
+                          f"{result['seconds']:.1f} s; see the log file in\n"\
+                          f"{os.path.dirname(test_configs[test_name])}\n")
+            continue
+        expt_dir = result["expt_dir"]
+        shutil.rmtree(os.path.dirname(test_configs[test_name]))
+        logging.info(f"Workflow for test {test_name} successfully generated in "\
+                     f"{result['seconds']:.1f} s in\n{expt_dir}\n")
         # If this job is not using crontab, we need to add an entry to monitor.yaml
-        if 'USE_CRON_TO_RELAUNCH' not in test_cfg['workflow']:
-            test_cfg['workflow'].update({"USE_CRON_TO_RELAUNCH": False})
-        if not test_cfg['workflow']['USE_CRON_TO_RELAUNCH']:
+        if not use_cron[test_name]:
             logging.debug(f'Creating entry for job {test_name} in job monitoring dict')
-            workflow_id = f'{test_name}_{starttime_string}'
+            workflow_id = f'{test_name}_{start_times[test_name]}'
             monitor_yaml[workflow_id] = dict()
             monitor_yaml[workflow_id].update({"expt_dir": expt_dir})
             monitor_yaml[workflow_id].update({"status": "CREATED"})
-            monitor_yaml[workflow_id].update({"start_time": starttime_string})
-            # Make WORKFLOW_ID actually mean something
-            test_cfg['workflow'].update({"WORKFLOW_ID": workflow_id})
+            monitor_yaml[workflow_id].update({"start_time": start_times[test_name]})
+
+    timings = "\n".join(f"{result['name']:<60s}{result['seconds']:>8.1f} s" for result in results)
+    logging.info(f"Time taken to generate each experiment:\n{timings}\n")
+    if failed:
+        if monitor_yaml:
+            monitor_file = f'WE2E_tests_{starttime_string}.yaml'
+            write_monitor_file(monitor_file,monitor_yaml)
+            logging.info(f"Experiment file {monitor_file} created for the tests that were generated")
+        raise RuntimeError(f"Workflow generation failed for {len(failed)} tests: "\
+                           f"{', '.join(failed)}")
+    os.rmdir(work_dir)
 
     if args.launch != "cron":
         monitor_file = f'WE2E_tests_{starttime_string}.yaml'
@@ -263,6 +290,7 @@ def run_we2e_tests(homedir, args) -> None:
                 monitor_file = monitor_jobs(monitor_yaml, monitor_file=monitor_file, procs=args.procs,
                                             debug=args.debug)
             except KeyboardInterrupt:
+                export_monitor_file(monitor_file)
                 logging.info("\n\nUser interrupted monitor script; to resume monitoring jobs run:\n")
                 logging.info(f"./monitor_jobs.py -y={monitor_file} -p={args.procs}\n")
         else:
@@ -500,7 +528,8 @@ if __name__ == "__main__":
                     help='Suppress console output from workflow generation; this will help '\
                          'keep the screen uncluttered')
     ap.add_argument('-p', '--procs', type=int,
-                    help='Run resource-heavy tasks (such as calls to rocotorun) in parallel, '\
+                    help='Generate experiments and run resource-heavy tasks (such as calls to '\
+                         'rocotorun) in parallel, '\
                          'with provided number of parallel tasks', default=1)
     ap.add_argument('-l', '--launch', type=str, choices=['python', 'cron', 'none'],
                     help='Method for launching jobs. Valid values are:\n'\
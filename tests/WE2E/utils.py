@@ -4,15 +4,19 @@ A collection of utilities used by the various WE2E scripts
 """
 import os
 import re
+import asyncio
+import json
+import functools
 import sys
 import logging
 import subprocess
 import sqlite3
 import glob
 from textwrap import dedent
-from datetime import datetime
+from datetime import datetime, timedelta
 from contextlib import closing
-from multiprocessing import Pool
+from urllib.parse import quote
+from xml.etree import ElementTree
 
 sys.path.append("../../ush")
 
@@ -27,6 +31,14 @@ from python_utils import (
 REPORT_WIDTH = 100
 EXPT_COLUMN_WIDTH = 65
 TASK_COLUMN_WIDTH = 40
+# Shortest and longest time in seconds between two polls of an experiment by monitor_jobs()
+MIN_POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 60
+# Experiment statuses for which every submitted job has succeeded, so that it is checked for
+# unsubmitted jobs on every poll
+FINAL_CHECK_STATUSES = ["SUCCEEDED", "STALLED", "STUCK"]
+# Time in seconds after which a rocotorun run by RocotorunRunner is stopped
+ROCOTORUN_TIMEOUT = 600
 def print_WE2E_summary(expts_dict: dict, debug: bool = False):
     """Creates a summary of the specified experiment
 
@@ -189,34 +201,185 @@ def calculate_core_hours(expts_dict: dict) -> dict:
 def write_monitor_file(monitor_file: str, expts_dict: dict):
     """Writes status of tests to file
 
+    The file is written under a temporary name and then renamed, so a write that is interrupted
+    (e.g., with ``Ctrl+C``) or fails leaves the previous version of the file in place.
+
     Args:
         monitor_file  (str): File name
         expts_dict   (dict): Experiments being monitored
     Returns:
         None
-    Raises: 
-        KeyboardInterrupt: If a user attempts to disrupt program execution (e.g., with ``Ctrl+C``) while program is writing information to ``monitor_file``.  
     """
+    tmp_file = f"{monitor_file}.tmp"
     try:
-        with open(monitor_file,"w", encoding="utf-8") as f:
+        with open(tmp_file,"w", encoding="utf-8") as f:
             f.write("### WARNING ###\n")
             f.write("### THIS FILE IS AUTO_GENERATED AND REGULARLY OVER-WRITTEN BY WORKFLOW SCRIPTS\n")
             f.write("### EDITS MAY RESULT IN MISBEHAVIOR OF EXPERIMENTS RUNNING\n")
             f.writelines(cfg_to_yaml_str(expts_dict))
-    except KeyboardInterrupt:
-        logging.warning("\nRefusing to interrupt during file write; try again\n")
-        write_monitor_file(monitor_file,expts_dict)
-    except:
-        logging.fatal("\n********************************\n")
-        logging.fatal(f"WARNING WARNING WARNING\n")
-        logging.fatal("Failure occurred while writing monitor file {monitor_file}")
-        logging.fatal("File may be corrupt or invalid for re-run!!")
-        logging.fatal("\n********************************\n")
+        os.replace(tmp_file, monitor_file)
+    except BaseException:
+        logging.warning(f"Failed to write monitor file {monitor_file}; keeping its previous version")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
         raise
 
 
+def monitor_store_file(monitor_file: str) -> str:
+    """Returns the name of the ``MonitorStore`` database kept next to a monitor file"""
+    return f"{os.path.splitext(monitor_file)[0]}.db"
+
+
+class MonitorStore:
+    """
+    Keeps the state of the experiments being monitored in an SQLite database, with one row per
+    experiment and one per task. ``save()`` writes only the experiments and tasks that changed
+    since they were last saved or loaded, in a single transaction, so the database always holds
+    the state of the experiments after a complete save, even if the monitor is killed. The monitor
+    file is written from it with ``export_monitor_file()``; see also ``load_monitor_file()``.
+
+    Args:
+        db_file (str): Path to the database, which is created if it does not exist
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS experiments (
+            name TEXT PRIMARY KEY, position INTEGER, fields TEXT);
+        CREATE TABLE IF NOT EXISTS tasks (
+            experiment TEXT, task TEXT, position INTEGER, fields TEXT,
+            PRIMARY KEY (experiment, task));
+        """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript(self.SCHEMA)
+        # What is in the database: the fields of each experiment (under None) and of its tasks
+        self.saved = {}
+        self.load()
+
+    def close(self) -> None:
+        """Closes the database"""
+        self.connection.close()
+
+    def load(self) -> dict:
+        """
+        Reads the state of the experiments from the database
+
+        Returns:
+            The dictionary of experiment dictionaries, as written by ``write_monitor_file()``
+        """
+        expts_dict = {}
+        self.saved = {}
+        with closing(self.connection.cursor()) as cur:
+            for name, fields in cur.execute(
+                    "SELECT name,fields FROM experiments ORDER BY position"):
+                expts_dict[name] = json.loads(fields)
+                self.saved[name] = {None: json.loads(fields)}
+            for name, task, fields in cur.execute(
+                    "SELECT experiment,task,fields FROM tasks ORDER BY experiment,position"):
+                expts_dict[name][task] = json.loads(fields)
+                self.saved[name][task] = json.loads(fields)
+        return expts_dict
+
+    def save(self, expts_dict: dict, names: list = None) -> int:
+        """
+        Writes the experiments and tasks that changed to the database
+
+        Args:
+            expts_dict (dict): The dictionary of experiment dictionaries
+            names      (list): The experiments that may have changed. By default, all of them are
+                               compared with the database, and the experiments that are no longer
+                               in the dictionary are removed from it.
+        Returns:
+            The number of rows written or removed
+        """
+        experiment_rows, task_rows, removed = [], [], []
+        if names is None:
+            names = list(expts_dict)
+            removed = [name for name in self.saved if name not in expts_dict]
+        positions = {name: position for position, name in enumerate(expts_dict)}
+        for name in names:
+            saved = self.saved.setdefault(name, {})
+            fields = {}
+            position = 0
+            for key, value in expts_dict[name].items():
+                if not isinstance(value, dict):
+                    fields[key] = value
+                    continue
+                # Only the tasks that changed are copied and converted to JSON
+                if saved.get(key) != value:
+                    saved[key] = dict(value)
+                    task_rows.append((name, key, position, json.dumps(value, default=str)))
+                position += 1
+            if saved.get(None) != fields:
+                saved[None] = fields
+                experiment_rows.append((name, positions[name], json.dumps(fields, default=str)))
+            if len(saved) > position + 1:
+                for task in [task for task in saved if task is not None
+                             and not isinstance(expts_dict[name].get(task), dict)]:
+                    removed.append((name, task))
+                    del saved[task]
+
+        # A single transaction: it is written completely or not at all
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO experiments VALUES (?,?,?)", experiment_rows)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tasks VALUES (?,?,?,?)", task_rows)
+            for item in removed:
+                if isinstance(item, tuple):
+                    self.connection.execute(
+                        "DELETE FROM tasks WHERE experiment = ? AND task = ?", item)
+                else:
+                    self.connection.execute("DELETE FROM experiments WHERE name = ?", (item,))
+                    self.connection.execute("DELETE FROM tasks WHERE experiment = ?", (item,))
+                    del self.saved[item]
+        return len(experiment_rows) + len(task_rows) + len(removed)
+
+
+def export_monitor_file(monitor_file: str) -> bool:
+    """
+    Writes a monitor file from the state of the experiments in its ``MonitorStore`` database
+
+    Args:
+        monitor_file (str): Name of the monitor file
+    Returns:
+        Whether the file was written; it is not if the database does not hold any experiments
+    """
+    db_file = monitor_store_file(monitor_file)
+    if not os.path.exists(db_file):
+        return False
+    with closing(MonitorStore(db_file)) as store:
+        expts_dict = store.load()
+    if not expts_dict:
+        return False
+    write_monitor_file(monitor_file, expts_dict)
+    return True
+
+
+def load_monitor_file(monitor_file: str) -> dict:
+    """
+    Loads the experiments being monitored from a monitor file, or from its ``MonitorStore``
+    database if the database has been written to since the file was
+
+    Args:
+        monitor_file (str): Name of the monitor file
+    Returns:
+        The dictionary of experiment dictionaries
+    """
+    db_file = monitor_store_file(monitor_file)
+    if os.path.exists(db_file) and (not os.path.exists(monitor_file)
+                                    or os.stat(db_file).st_mtime_ns
+                                    > os.stat(monitor_file).st_mtime_ns):
+        logging.debug(f"Loading experiments from {db_file}, which is newer than {monitor_file}")
+        with closing(MonitorStore(db_file)) as store:
+            return store.load()
+    return load_config_file(monitor_file)
+
+
 def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool = False,
-                       submit: bool = True) -> dict:
+                       submit: bool = True, reader: "RocotoJobsReader" = None) -> dict:
     """
     This function reads the dictionary for a given experiment, runs the ``rocotorun`` command to update the experiment (by running new jobs and updating the status of previously submitted ones), and reads the Rocoto database (``.db``) file to update the status of each job in the experiment dictionary. The function then uses a simple set of rules to combine the statuses of every task into a useful summary status for the whole experiment and returns the updated experiment dictionary.
 
@@ -238,6 +401,7 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
         refresh (bool): If True, this flag will check an experiment status even if it is listed as DEAD, ERROR, or COMPLETE. Used for initial checks for experiments that may have been restarted.
         debug   (bool): Will capture all output from ``rocotorun``. This will allow information such as job cards and job submit messages to appear in the log files, but turning on this option can drastically slow down the testing process.
         submit  (bool): In addition to reading the Rocoto database (``.db``) file, the script will advance the workflow by calling ``rocotorun``. If simply generating a report, set this to False.
+        reader  (RocotoJobsReader): A reader kept open for the experiment's Rocoto database, which reads only the jobs that changed since its last read. By default, the whole database is read.
 
     Returns:
         expt: The updated experiment dictionary
@@ -252,29 +416,19 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
     if submit:
         if refresh:
             logging.debug(f"Updating database for experiment {name}")
-        if debug:
-            rocotorun_cmd = ["rocotorun", f"-w {rocoto_xml}", f"-d {rocoto_db}", "-v 10"]
-            p = subprocess.run(rocotorun_cmd, stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT, text=True)
-            logging.debug(p.stdout)
-
-            #Run rocotorun again to get around rocotobqserver proliferation issue
-            p = subprocess.run(rocotorun_cmd, stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT, text=True)
-            logging.debug(p.stdout)
-        else:
-            rocotorun_cmd = ["rocotorun", f"-w {rocoto_xml}", f"-d {rocoto_db}"]
-            subprocess.run(rocotorun_cmd)
-            #Run rocotorun again to get around rocotobqserver proliferation issue
-            subprocess.run(rocotorun_cmd)
+        run_rocotorun(rocoto_xml, rocoto_db, debug)
+        #Run rocotorun again to get around rocotobqserver proliferation issue
+        run_rocotorun(rocoto_xml, rocoto_db, debug)
 
     logging.debug(f"Reading database for experiment {name}, updating experiment dictionary")
     try:
-        # This section of code queries the "job" table of the rocoto database, returning a list
-        # of tuples containing the taskname, cycle, and state of each job respectively
-        with closing(sqlite3.connect(rocoto_db)) as connection:
-            with closing(connection.cursor()) as cur:
-                db = cur.execute('SELECT taskname,cycle,state,cores,duration from jobs').fetchall()
+        # This section of code queries the "job" table of the rocoto database, and stores each
+        # task's info in the experiment dictionary
+        if reader is None:
+            with closing(RocotoJobsReader(rocoto_db)) as one_time_reader:
+                one_time_reader.read(expt)
+        else:
+            reader.read(expt)
     except:
         # Some platforms (including Hera) can have a problem with rocoto jobs not submitting
         # properly due to build-ups of background processes. This will resolve over time as
@@ -286,17 +440,6 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
 
         return expt
 
-    for task in db:
-        # For each entry from rocoto database, store that task's info under a dictionary key named
-        # TASKNAME_CYCLE; cycle comes from the database in Unix Time (seconds), so convert to
-        # human-readable time
-        cycle = datetime.utcfromtimestamp(task[1]).strftime('%Y%m%d%H%M')
-        if f"{task[0]}_{cycle}" not in expt:
-            expt[f"{task[0]}_{cycle}"] = dict()
-        expt[f"{task[0]}_{cycle}"]["status"] = task[2]
-        expt[f"{task[0]}_{cycle}"]["cores"] = task[3]
-        expt[f"{task[0]}_{cycle}"]["walltime"] = task[4]
-
     statuses = list()
     for task in expt:
         # Skip non-task entries
@@ -351,46 +494,392 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
     # Final check for experiments where all tasks are "SUCCEEDED"; since the rocoto database does
     # not include info on jobs that have not been submitted yet, use rocotostat to check that
     # there are no un-submitted jobs remaining.
-    if expt["status"] in ["SUCCEEDED","STALLED","STUCK"]:
+    if expt["status"] in FINAL_CHECK_STATUSES:
         expt = compare_rocotostat(expt,name)
 
     return expt
 
-def update_expt_status_parallel(expts_dict: dict, procs: int, refresh: bool = False,
-                                debug: bool = False) -> dict:
+def run_rocotorun(rocoto_xml: str, rocoto_db: str, debug: bool = False) -> None:
     """
-    This function updates an entire set of experiments in parallel, drastically speeding up
-    the testing if given enough parallel processes. Given a dictionary of experiments, it will
-    pass each individual experiment dictionary to ``update_expt_status()``, making use
-    of the Python multiprocessing ``starmap()`` functionality to update the experiments in parallel.
+    Runs ``rocotorun`` once for an experiment, to submit the jobs that are ready and update the
+    status of the submitted ones in its Rocoto database
 
     Args:
-        expts_dict (dict): A dictionary containing information for all experiments
-        procs       (int): The number of parallel processes
-        refresh    (bool): "Refresh" flag to pass to ``update_expt_status()``. If True, this flag will check an experiment status even if it is listed as DEAD, ERROR, or COMPLETE. Used for initial checks for experiments that may have been restarted.
-        debug      (bool): Will capture all output from ``rocotorun``. This will allow information such as job cards and job submit messages to appear in the log files, but can drastically slow down the testing process.
+        rocoto_xml (str): Path to the Rocoto XML file of the experiment
+        rocoto_db  (str): Path to its Rocoto database (``.db``) file
+        debug     (bool): Capture all output from ``rocotorun`` in the log
+    Returns:
+        None
+    """
+    if debug:
+        p = subprocess.run(rocotorun_cmd(rocoto_xml, rocoto_db, debug), stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT, text=True)
+        logging.debug(p.stdout)
+    else:
+        subprocess.run(rocotorun_cmd(rocoto_xml, rocoto_db))
+
+def rocotorun_cmd(rocoto_xml: str, rocoto_db: str, debug: bool = False) -> list:
+    """Returns the ``rocotorun`` command for an experiment, verbose if ``debug`` is set"""
+    cmd = ["rocotorun", f"-w {rocoto_xml}", f"-d {rocoto_db}"]
+    if debug:
+        cmd.append("-v 10")
+    return cmd
+
+def rocoto_db_signature(rocoto_db: str) -> tuple:
+    """
+    Returns the modification time and size of a Rocoto database (``.db``) file and of its
+    write-ahead log, if any, which change whenever anything is written to the database
+
+    ``PRAGMA data_version`` on the connection of the experiment's ``RocotoJobsReader`` would also
+    tell whether the database changed, but the signature is preferred:
 
+    * It is taken where there is no connection: ``RocotorunRunner`` compares it before and after
+      ``rocotorun`` to decide whether to run ``rocotorun`` again, and the database does not exist
+      until the first ``rocotorun`` creates it, so it cannot be opened read-only yet.
+    * A ``data_version`` can only be compared with another one from the same connection, and the
+      reader opens a new connection when the database file is replaced.
+    * ``stat()`` takes no lock, while the pragma reads the database and fails with "database is
+      locked" while ``rocotorun`` is writing to it.
+
+    On a file system that records modification times to the second, a write in the same second
+    as the previous one that leaves the size unchanged is missed until the next write.
+
+    Args:
+        rocoto_db (str): Path to the Rocoto database file
     Returns:
-        expts_dict: The updated dictionary of experiment dictionaries
+        A tuple of a ``(mtime, size)`` pair for each file, or None for a file that does not exist
+    """
+    signature = []
+    for path in (rocoto_db, f"{rocoto_db}-wal"):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+class RocotoJobsReader:
     """
+    Reads the jobs of an experiment from its Rocoto database (``.db``) file into its experiment
+    dictionary, as ``update_expt_status()`` does, over a read-only connection that is kept open
+    between reads. The first read fetches the whole ``jobs`` table; later reads fetch only the rows
+    that can have changed: the rows added since the last read (beyond the largest ``rowid`` read),
+    and the rows of jobs that had not yet succeeded, which Rocoto updates in place. The tasks that
+    changed are updated in the dictionary, and the others are left alone.
+
+    Rocoto only rewrites the row of a job that succeeded if it is rewound or booted again. Rewinding
+    deletes the row and the job gets a new one, which is read; if the database is replaced or the
+    largest ``rowid`` read is reused, for another job or for the same job run again, the whole
+    table is read again.
 
-    args = []
-    # Define a tuple of arguments to pass to starmap
-    for expt in expts_dict:
-        args.append( (expts_dict[expt],expt,refresh,debug) )
+    Args:
+        rocoto_db (str): Path to the Rocoto database file
+    """
 
-    # call update_expt_status() in parallel
-    with Pool(processes=procs) as pool:
-        output = pool.starmap(update_expt_status, args)
+    # Jobs in this state are not read again
+    FINAL_STATE = "SUCCEEDED"
+
+    # Largest number of rowids bound in a single query; older SQLite libraries allow 999
+    MAX_VARIABLES = 500
+
+    COLUMNS = "rowid,taskname,cycle,state,cores,duration"
+
+    def __init__(self, rocoto_db: str):
+        self.rocoto_db = rocoto_db
+        self.connection = None
+        self.inode = None
+        self._start_over()
+
+    def _start_over(self) -> None:
+        """Forgets which rows have been read, so that the next read fetches the whole table"""
+        self.last_rowid = 0
+        self.last_job = None
+        self.live_rowids = set()
+
+    def _connect(self) -> None:
+        """Opens the database, or opens it again if the file has been replaced"""
+        inode = os.stat(self.rocoto_db).st_ino
+        if self.connection is not None and inode == self.inode:
+            return
+        self.close()
+        self.connection = sqlite3.connect(f"file:{quote(os.path.abspath(self.rocoto_db))}?mode=ro",
+                                          uri=True)
+        self.inode = inode
+
+    def close(self) -> None:
+        """Closes the connection to the database, if it is open"""
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self._start_over()
+
+    def read(self, expt: dict) -> int:
+        """
+        Stores the information of each job that changed since the last read under a key named
+        ``TASKNAME_CYCLE`` of an experiment dictionary
+
+        Args:
+            expt (dict): The dictionary of the experiment
+        Returns:
+            The number of rows read from the database
+        Raises:
+            OSError, sqlite3.Error: If the database cannot be read
+        """
+        self._connect()
+        with closing(self.connection.cursor()) as cur:
+            if self.last_rowid:
+                job = cur.execute("SELECT taskname,cycle,state FROM jobs WHERE rowid = ?",
+                                  (self.last_rowid,)).fetchone()
+                # A job that succeeded and was rewound may have its rowid back, but not its state
+                if job is None or job[:2] != self.last_job or (
+                        self.last_rowid not in self.live_rowids and job[2] != self.FINAL_STATE):
+                    logging.debug(f"Jobs were removed from {self.rocoto_db}; reading all jobs")
+                    self._start_over()
+            rows = cur.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE rowid > ?",
+                               (self.last_rowid,)).fetchall()
+            live = sorted(self.live_rowids)
+            for i in range(0, len(live), self.MAX_VARIABLES):
+                chunk = live[i:i + self.MAX_VARIABLES]
+                rows += cur.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE rowid IN "
+                                    f"({','.join('?' * len(chunk))})", chunk).fetchall()
+
+        # Rows of jobs that were removed are not returned
+        self.live_rowids.clear()
+        # In table order, as a whole read would be, so a newer row for a task wins
+        for rowid, taskname, cycle, state, cores, duration in sorted(rows):
+            # Cycle comes from the database in Unix Time (seconds), so convert to human-readable
+            # time
+            task = expt.setdefault(
+                f"{taskname}_{datetime.utcfromtimestamp(cycle).strftime('%Y%m%d%H%M')}", {})
+            task["status"] = state
+            task["cores"] = cores
+            task["walltime"] = duration
+            if state != self.FINAL_STATE:
+                self.live_rowids.add(rowid)
+            if rowid > self.last_rowid:
+                self.last_rowid = rowid
+                self.last_job = (taskname, cycle)
+        return len(rows)
+
+def task_statuses(expt: dict) -> dict:
+    """Returns the status of each task of an experiment dictionary"""
+    return {task: info["status"] for task, info in expt.items()
+            if task not in ["expt_dir","status","start_time","walltime"]}
+
+def advance_expt(expt: dict, signature: tuple = None, debug: bool = False) -> tuple:
+    """
+    Advances an experiment with ``rocotorun``; ``rocotorun`` is run a second time (to get around
+    the rocotobqserver proliferation issue) only if the first run wrote to the Rocoto database
 
-    # Update dictionary with output from all calls to update_expt_status()
-    i = 0
-    for expt in expts_dict:
-        expts_dict[expt] = output[i]
-        i += 1
+    Args:
+        expt       (dict): A dictionary containing the information for an individual experiment
+        signature (tuple): The ``rocoto_db_signature()`` of the database when it was last read,
+                           if it has been read
+        debug      (bool): Capture all output from ``rocotorun`` in the log
+    Returns:
+        The signature of the database after ``rocotorun``
+    """
+    rocoto_db = f"{expt['expt_dir']}/FV3LAM_wflow.db"
+    rocoto_xml = f"{expt['expt_dir']}/FV3LAM_wflow.xml"
 
-    return expts_dict
+    run_rocotorun(rocoto_xml, rocoto_db, debug)
+    new_signature = rocoto_db_signature(rocoto_db)
+    if new_signature != signature:
+        #Run rocotorun again to get around rocotobqserver proliferation issue
+        run_rocotorun(rocoto_xml, rocoto_db, debug)
+        new_signature = rocoto_db_signature(rocoto_db)
+    return new_signature
+
+def poll_expt_status(expt: dict, name: str, signature: tuple = None, debug: bool = False,
+                     reader: RocotoJobsReader = None, advanced: tuple = None) -> tuple:
+    """
+    Advances an experiment with ``advance_expt()`` and updates its dictionary, as
+    ``update_expt_status()`` does, but skips the work that cannot change it: the database is read
+    again only if it has been written to since it was last read, or if every submitted job has
+    succeeded and the experiment has to be checked for unsubmitted jobs.
 
+    Args:
+        expt       (dict): A dictionary containing the information for an individual experiment
+        name        (str): Name of the experiment; used for logging only
+        signature (tuple): The ``rocoto_db_signature()`` of the database when it was last read,
+                           if it has been read
+        debug      (bool): Capture all output from ``rocotorun`` in the log
+        reader (RocotoJobsReader): A reader kept open for the experiment's database, which reads
+                           only the jobs that changed since its last read
+        advanced  (tuple): The signature returned by ``advance_expt()`` if the experiment has
+                           already been advanced, e.g., by ``RocotorunRunner.advance()``
+    Returns:
+        A tuple of the updated experiment dictionary, the signature of its database when it was
+        last read, and whether the status of the experiment or any of its tasks changed
+    """
+    if expt["status"] in ['DEAD','ERROR','COMPLETE']:
+        return expt, signature, False
+
+    new_signature = advanced if advanced is not None else advance_expt(expt, signature, debug)
+    if (new_signature == signature and new_signature[0] is not None
+            and expt["status"] not in FINAL_CHECK_STATUSES):
+        logging.debug(f"Database for experiment {name} is unchanged")
+        return expt, signature, False
+
+    before = (expt["status"], task_statuses(expt))
+    expt = update_expt_status(expt, name, debug=debug, submit=False, reader=reader)
+    return expt, new_signature, (expt["status"], task_statuses(expt)) != before
+
+class ExptPollSchedule:
+    """
+    Decides when ``monitor_jobs()`` polls each experiment. An experiment is polled again after
+    ``MIN_POLL_INTERVAL`` seconds when the last poll changed it, or when every submitted job has
+    succeeded and only the final checks remain; every poll that changes nothing doubles the
+    interval, up to ``MAX_POLL_INTERVAL`` seconds, so that experiments waiting on long jobs in
+    the queue do not run ``rocotorun`` every few seconds.
+
+    Args:
+        names         (list): The names of the experiments to poll, which are all due at first
+        min_interval (float): The shortest time, in seconds, between two polls of an experiment
+        max_interval (float): The longest time, in seconds, between two polls of an experiment
+    """
+
+    def __init__(self, names: list, min_interval: float = MIN_POLL_INTERVAL,
+                 max_interval: float = MAX_POLL_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = {name: min_interval for name in names}
+        self.next_poll = {name: 0.0 for name in names}
+        self.signatures = {}
+
+    def due(self, now: float) -> list:
+        """Returns the names of the experiments due to be polled at a time (``time.monotonic()``)"""
+        return [name for name, next_poll in self.next_poll.items() if next_poll <= now]
+
+    def wait(self, now: float) -> float:
+        """Returns how long to wait, in seconds, for the next experiment to be due"""
+        return max(0.0, min(self.next_poll.values(), default=now) - now)
+
+    def polled(self, name: str, signature: tuple, changed: bool, status: str, now: float) -> None:
+        """Schedules the next poll of an experiment after it was polled
+
+        Args:
+            name       (str): Name of the experiment
+            signature (tuple): The signature of its database when it was last read
+            changed    (bool): Whether the poll changed the status of the experiment or its tasks
+            status      (str): The status of the experiment after the poll
+            now       (float): The time of the poll (``time.monotonic()``)
+        """
+        self.signatures[name] = signature
+        if changed or status in FINAL_CHECK_STATUSES:
+            self.interval[name] = self.min_interval
+        else:
+            self.interval[name] = min(2 * self.interval[name], self.max_interval)
+        self.next_poll[name] = now + self.interval[name]
+
+    def remove(self, name: str) -> None:
+        """Stops polling an experiment"""
+        self.interval.pop(name, None)
+        self.next_poll.pop(name, None)
+        self.signatures.pop(name, None)
+
+class RocotorunRunner:
+    """
+    Runs ``rocotorun`` for many experiments at once from a single process, as asyncio
+    subprocesses. ``rocotorun`` spends its time waiting on the batch system and the Rocoto database,
+    so no worker processes are needed to run it in parallel, and the experiment dictionaries are
+    not copied to and from them. The event loop is kept for the whole monitoring session; use
+    ``close()`` when done.
+
+    Args:
+        procs      (int): The largest number of ``rocotorun`` processes to run at once
+        timeout  (float): Time in seconds after which a ``rocotorun`` is stopped; the experiment is
+                          advanced again the next time it is polled
+        debug     (bool): Capture all output from ``rocotorun`` in the log, a line at a time as it
+                          is written
+    """
+
+    # Longest line of output from ``rocotorun -v 10`` that is logged, in bytes; asyncio reads up
+    # to 64 KiB by default
+    LINE_LIMIT = 2**20
+
+    def __init__(self, procs: int, timeout: float = ROCOTORUN_TIMEOUT, debug: bool = False):
+        self.procs = procs
+        self.timeout = timeout
+        self.debug = debug
+        self.loop = asyncio.new_event_loop()
+        # Before Python 3.8, only the subprocesses of the current event loop are waited for
+        asyncio.set_event_loop(self.loop)
+
+    def close(self) -> None:
+        """Closes the event loop"""
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    async def _log_output(self, proc, name: str) -> None:
+        """Logs the output of a ``rocotorun`` as it is written, then waits for it to finish"""
+        while proc.stdout is not None:
+            try:
+                line = await proc.stdout.readline()
+            except ValueError:
+                # The line is longer than LINE_LIMIT; what was read of it has been dropped, and
+                # its end is read as the next line
+                logging.debug(f"{name}: [line longer than {self.LINE_LIMIT} bytes dropped]")
+                continue
+            if not line:
+                break
+            logging.debug(f"{name}: {line.decode(errors='replace').rstrip()}")
+        await proc.wait()
+
+    async def _rocotorun(self, semaphore, name: str, rocoto_xml: str, rocoto_db: str) -> None:
+        """Runs ``rocotorun`` once for an experiment, as ``run_rocotorun()`` does"""
+        output = subprocess.PIPE if self.debug else None
+        async with semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                *rocotorun_cmd(rocoto_xml, rocoto_db, self.debug), stdout=output,
+                stderr=subprocess.STDOUT if self.debug else None, limit=self.LINE_LIMIT)
+            try:
+                await asyncio.wait_for(self._log_output(proc, name), self.timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"rocotorun for experiment {name} did not finish in "
+                                f"{self.timeout} s; stopping it")
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(proc.wait(), 10)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+
+    async def _advance(self, semaphore, name: str, expt: dict, signature: tuple) -> tuple:
+        """Advances an experiment, as ``advance_expt()`` does"""
+        rocoto_db = f"{expt['expt_dir']}/FV3LAM_wflow.db"
+        rocoto_xml = f"{expt['expt_dir']}/FV3LAM_wflow.xml"
+
+        await self._rocotorun(semaphore, name, rocoto_xml, rocoto_db)
+        new_signature = rocoto_db_signature(rocoto_db)
+        if new_signature != signature:
+            #Run rocotorun again to get around rocotobqserver proliferation issue
+            await self._rocotorun(semaphore, name, rocoto_xml, rocoto_db)
+            new_signature = rocoto_db_signature(rocoto_db)
+        return new_signature
+
+    async def _advance_all(self, expts_dict: dict, signatures: dict) -> dict:
+        """Advances a set of experiments concurrently"""
+        # Created here, in the event loop that uses it
+        semaphore = asyncio.Semaphore(self.procs)
+        output = await asyncio.gather(*(
+            self._advance(semaphore, name, expt, signatures.get(name))
+            for name, expt in expts_dict.items()))
+        return dict(zip(expts_dict, output))
+
+    def advance(self, expts_dict: dict, signatures: dict) -> dict:
+        """
+        Advances a set of experiments with ``rocotorun``, as ``advance_expt()`` does for each of
+        them, running up to ``procs`` ``rocotorun`` processes at once
+
+        Args:
+            expts_dict (dict): A dictionary containing information for the experiments to advance
+            signatures (dict): The signature of the database of each experiment when it was last
+                               read; experiments without one are advanced with two ``rocotorun``
+        Returns:
+            A dictionary of the signature of the database of each experiment after ``rocotorun``
+        """
+        return self.loop.run_until_complete(self._advance_all(expts_dict, signatures))
 
 
 def print_test_info(txtfile: str = "WE2E_test_info.txt") -> None:
@@ -489,18 +978,110 @@ def print_test_info(txtfile: str = "WE2E_test_info.txt") -> None:
             f.write("\n")
 
 
-def compare_rocotostat(expt_dict,name):
-    """Reads the dictionary showing the location of a given experiment, runs a ``rocotostat`` command
-    to get the full set of tasks for the experiment, and compares the two to see if there are any
-    unsubmitted tasks remaining.
+# A metatask variable in a task name or attribute
+ROCOTO_VAR = re.compile(r"#([^#\s]+)#")
+
+
+def rocoto_cycles(cycledef: str) -> list:
+    """
+    Returns the cycles of a Rocoto ``<cycledef>`` of the form ``start end interval``, as
+    ``YYYYMMDDHHMM`` strings
 
     Args:
-        expt_dict (dict): A dictionary containing the information for an individual experiment
-        name       (str): Name of the experiment
+        cycledef (str): The contents of the ``<cycledef>`` tag, with ``start`` and ``end`` in
+                        ``YYYYMMDDHHMM`` format and ``interval`` in ``[[[DD:]HH:]MM:]SS`` format
     Returns:
-        expt_dict: A dictionary containing the information for an individual experiment
+        A list of the cycles
+    Raises:
+        ValueError: If the ``<cycledef>`` has another form, e.g., the crontab-like one
+    """
+    fields = cycledef.split()
+    if len(fields) != 3 or not all(len(field) == 12 for field in fields[:2]):
+        raise ValueError(f"Unsupported cycledef: {cycledef}")
+    start, end = (datetime.strptime(field, "%Y%m%d%H%M") for field in fields[:2])
+    seconds = 0
+    for factor, value in zip((1, 60, 3600, 86400), reversed(fields[2].split(":"))):
+        seconds += factor * int(value)
+    if seconds <= 0:
+        raise ValueError(f"Unsupported cycledef: {cycledef}")
+    cycles = []
+    cycle = start
+    while cycle <= end:
+        cycles.append(cycle.strftime("%Y%m%d%H%M"))
+        cycle += timedelta(seconds=seconds)
+    return cycles
+
+
+def _expand_rocoto_tasks(element, variables: dict):
+    """
+    Yields the name and ``cycledefs`` attribute of each task in an element of a Rocoto XML,
+    expanding metatasks with their ``<var>`` values as Rocoto does
+
+    Args:
+        element   (Element): The ``<workflow>`` or a ``<metatask>`` element
+        variables    (dict): The values of the variables of the enclosing metatasks
+    """
+    def substitute(text):
+        return ROCOTO_VAR.sub(lambda match: variables.get(match.group(1), match.group(0)), text)
+
+    for child in element:
+        if child.tag == "task":
+            yield substitute(child.get("name")), substitute(child.get("cycledefs", ""))
+        elif child.tag == "metatask":
+            values = {var.get("name"): substitute(var.text or "").split()
+                      for var in child.findall("var")}
+            if len({len(value) for value in values.values()}) > 1:
+                raise ValueError(f"Variables of metatask {child.get('name')} differ in length")
+            for i in range(min((len(value) for value in values.values()), default=0)):
+                yield from _expand_rocoto_tasks(
+                    child, {**variables, **{var: value[i] for var, value in values.items()}})
+
+
+def rocoto_tasks(rocoto_xml: str) -> frozenset:
+    """
+    Returns every job that a Rocoto XML file defines, i.e., each of its tasks in each of the
+    cycles of its ``cycledefs``. The file is parsed once for each time it is modified.
+
+    Args:
+        rocoto_xml (str): Path to the Rocoto XML file
+    Returns:
+        A set of the ``TASKNAME_CYCLE`` keys of the jobs, as in the experiment dictionary (see
+        ``update_expt_status()``)
+    Raises:
+        ValueError: If the file uses a form of ``<cycledef>`` that is not supported
     """
+    return _rocoto_tasks(os.path.abspath(rocoto_xml), os.stat(rocoto_xml).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=256)
+def _rocoto_tasks(rocoto_xml: str, mtime_ns: int) -> frozenset:  # pylint: disable=unused-argument
+    """Expands the jobs of a version (modification time) of a Rocoto XML file"""
+    # The parser expands the entities declared in the file
+    workflow = ElementTree.parse(rocoto_xml).getroot()
+    groups = {}
+    for cycledef in workflow.findall("cycledef"):
+        groups.setdefault(cycledef.get("group"), []).extend(rocoto_cycles(cycledef.text or ""))
+    all_cycles = sorted({cycle for cycles in groups.values() for cycle in cycles})
+
+    jobs = set()
+    for name, cycledefs in _expand_rocoto_tasks(workflow, {}):
+        if cycledefs:
+            cycles = {cycle for group in cycledefs.split(",") for cycle in groups.get(group, [])}
+        else:
+            cycles = all_cycles
+        jobs.update(f"{name}_{cycle}" for cycle in cycles)
+    return frozenset(jobs)
+
 
+def rocotostat_tasks(expt_dict: dict) -> list:
+    """Runs ``rocotostat`` for an experiment and returns the ``TASKNAME_CYCLE`` of every job it
+    lists
+
+    Args:
+        expt_dict (dict): A dictionary containing the information for an individual experiment
+    Returns:
+        A list of the ``TASKNAME_CYCLE`` keys of the jobs, as in the experiment dictionary
+    """
     # Call rocotostat and store output
     rocoto_db = f"{expt_dict['expt_dir']}/FV3LAM_wflow.db"
     rocoto_xml = f"{expt_dict['expt_dir']}/FV3LAM_wflow.xml"
@@ -509,7 +1090,7 @@ def compare_rocotostat(expt_dict,name):
     rsout = p.stdout
 
     # Parse each line of rocotostat output, extracting relevant information
-    untracked_tasks = []
+    tasks = []
     for line in rsout.split('\n'):
         # Skip blank lines and dividing lines of '=====...'
         if not line:
@@ -525,14 +1106,32 @@ def compare_rocotostat(expt_dict,name):
 
         # As defined in update_expt_status(), the "task names" in the dictionary are a combination
         # of the task name and cycle
-        taskname = f'{line_array[1]}_{line_array[0]}'
+        tasks.append(f'{line_array[1]}_{line_array[0]}')
+    return tasks
 
-        # If we're already tracking this task, continue
-        if expt_dict.get(taskname):
-            continue
 
-        # Otherwise, extract information into dictionary of untracked tasks
-        untracked_tasks.append(taskname)
+def compare_rocotostat(expt_dict,name):
+    """Reads the dictionary showing the location of a given experiment, gets the full set of tasks
+    for the experiment from its Rocoto XML file with ``rocoto_tasks()``, and compares the two to see
+    if there are any unsubmitted tasks remaining. If the XML file cannot be expanded, the tasks are
+    listed with ``rocotostat`` instead.
+
+    Args:
+        expt_dict (dict): A dictionary containing the information for an individual experiment
+        name       (str): Name of the experiment
+    Returns:
+        expt_dict: A dictionary containing the information for an individual experiment
+    """
+
+    rocoto_xml = f"{expt_dict['expt_dir']}/FV3LAM_wflow.xml"
+    try:
+        tasks = rocoto_tasks(rocoto_xml)
+    except (OSError, ValueError, ElementTree.ParseError) as e:
+        logging.debug(f"Could not expand {rocoto_xml} ({e}); listing tasks with rocotostat")
+        tasks = rocotostat_tasks(expt_dict)
+
+    # The tasks we are not already tracking
+    untracked_tasks = sorted(task for task in tasks if not expt_dict.get(task))
 
     if untracked_tasks:
         # We want to give this a couple loops before reporting that it is "stuck"
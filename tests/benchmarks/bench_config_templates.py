@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark for rendering the Jinja2 templates in experiment configs with the shared template cache
+in ``python_utils.config_parser``.
+
+Each config is merged with ``config_defaults.yaml`` and a machine file, as ``setup()`` does, and
+its templates are rendered with ``extend_yaml``. The "cold" timings clear the shared environment
+and compiled-template cache before every run, so every template is compiled again, as was done
+before the cache was added. The "warm" timings reuse them, as when many experiments are generated
+in one process. With ``--setup``, the whole of ``setup()`` is timed the same way, writing the
+experiments under a temporary directory; this needs the full workflow environment (uwtools).
+
+Run it from the top of the repository:
+
+  .. code-block::
+
+    python tests/benchmarks/bench_config_templates.py --help
+"""
+
+import argparse
+import copy
+import glob
+import logging
+import os
+import sys
+import tempfile
+import time
+
+USHDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+sys.path.insert(0, USHDIR)
+
+# pylint: disable=wrong-import-position
+from python_utils import config_parser, load_config_file, update_dict
+
+
+def default_configs():
+    """The community config and the largest WE2E test config."""
+    we2e = glob.glob(
+        os.path.join(USHDIR, "..", "tests", "WE2E", "test_configs", "*", "config.*.yaml")
+    )
+    largest = max((path for path in we2e if not os.path.islink(path)), key=os.path.getsize)
+    return [os.path.join(USHDIR, "config.community.yaml"), largest]
+
+
+def clear_caches():
+    """Drops the shared Jinja2 environment and compiled templates."""
+    # pylint: disable=protected-access
+    config_parser._jinja_env.cache_clear()
+    config_parser._compile_template.cache_clear()
+    config_parser._template_fragments.cache_clear()
+
+
+def best_of(func, repeat, cold):
+    """Returns the best time, in seconds, of repeat calls of func."""
+    best = None
+    for _ in range(repeat):
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def merged_config(config, machine):
+    """Merges a user config with the defaults and a machine file."""
+    cfg = load_config_file(os.path.join(USHDIR, "config_defaults.yaml"))
+    update_dict(load_config_file(os.path.join(USHDIR, "machine", f"{machine}.yaml")), cfg)
+    update_dict(load_config_file(config), cfg)
+    cfg["user"]["HOMEdir"] = os.path.dirname(USHDIR)
+    cfg["workflow"]["EXPT_BASEDIR"] = tempfile.gettempdir()
+    return cfg
+
+
+def setup_runner(config, machine, tmp_dir):
+    """Returns a function that runs setup() for a config in tmp_dir."""
+    from setup import setup  # pylint: disable=import-outside-toplevel
+
+    cfg = load_config_file(config)
+    cfg.setdefault("user", {}).update({"MACHINE": machine.upper(), "ACCOUNT": "bench"})
+    cfg.setdefault("workflow", {}).update(
+        {"EXPT_BASEDIR": tmp_dir, "PREEXISTING_DIR_METHOD": "delete"}
+    )
+    config_fn = os.path.join(tmp_dir, os.path.basename(config))
+    with open(config_fn, "w", encoding="utf-8") as fn:
+        fn.write(config_parser.cfg_to_yaml_str(cfg))
+
+    def run():
+        setup(USHDIR, user_config_fn=config_fn)
+
+    return run
+
+
+def main(argv):
+    """Runs the benchmark and prints a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--configs",
+        nargs="+",
+        default=default_configs(),
+        help="User configs to time. default=the community config and the largest WE2E config",
+    )
+    parser.add_argument("--machine", default="hera", help="Machine file to use. default=hera")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs of each case; the best is kept. default=5"
+    )
+    parser.add_argument("--setup", action="store_true", help="Also time the whole of setup()")
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'config':<50s}{'case':<14s}{'cold':>10s}{'warm':>10s}{'speedup':>9s}")
+    for config in args.configs:
+        name = os.path.basename(config)[:48]
+        cfg = merged_config(config, args.machine)
+
+        def render(cfg=cfg):
+            config_parser.extend_yaml(copy.deepcopy(cfg))
+
+        cases = [("extend_yaml", render)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if args.setup:
+                cases.append(("setup()", setup_runner(config, args.machine, tmp_dir)))
+            for case, func in cases:
+                cold = best_of(func, args.repeat, cold=True)
+                warm = best_of(func, args.repeat, cold=False)
+                print(f"{name:<50s}{case:<14s}{cold:>9.3f}s{warm:>9.3f}s{cold / warm:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark for how long the scripts in ``ush`` take to start up.
+
+Each script with a ``__main__`` block is imported in a new interpreter with ``-X importtime``,
+which reports the time spent importing it and each of the modules it imports. The median over
+several runs is printed for each script, with the slowest module it imports, and the scripts that
+take longer than the budget are flagged; the benchmark exits with an error if there are any.
+
+Run it from the top of the repository:
+
+  .. code-block::
+
+    python tests/benchmarks/bench_import_time.py --help
+"""
+
+import argparse
+import compileall
+import glob
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+USHDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+
+
+def entry_points():
+    """The scripts in ush that can be run."""
+    scripts = []
+    for script in sorted(glob.glob(os.path.join(USHDIR, "*.py"))):
+        with open(script, encoding="utf-8") as fn:
+            if '__name__ == "__main__"' in fn.read():
+                scripts.append(os.path.basename(script)[:-3])
+    return scripts
+
+
+def import_times(module):
+    """Returns the cumulative import time, in ms, of each module that importing a module imports,
+    or None if it cannot be imported."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=USHDIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode:
+        return None
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s*\d+ \|\s*(\d+) \| *(\S+)$", line)
+        if match:
+            times[match.group(2)] = int(match.group(1)) / 1000
+    return times
+
+
+def main(argv):
+    """Runs the benchmark and prints the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--scripts", nargs="+", default=entry_points(), help="Scripts to time. default=all"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per script. default=5")
+    parser.add_argument(
+        "--budget", type=float, default=500, help="Time, in ms, each script may take. default=500"
+    )
+    args = parser.parse_args(argv)
+
+    # Do not time compiling them
+    compileall.compile_dir(USHDIR, maxlevels=1, quiet=1)
+
+    over = []
+    print(f"{'script':<40s}{'median':>10s}  slowest import")
+    for script in args.scripts:
+        runs = [import_times(script) for _ in range(args.repeat)]
+        if None in runs:
+            print(f"{script:<40s}{'cannot be imported':>28s}")
+            continue
+        median = statistics.median(times[script] for times in runs)
+        slowest = max(
+            (name for name in runs[0] if name != script), key=runs[0].get, default=""
+        )
+        flag = "  over budget" if median > args.budget else ""
+        print(f"{script:<40s}{median:>8.1f}ms  {slowest} ({runs[0].get(slowest, 0):.1f}ms){flag}")
+        if flag:
+            over.append(script)
+    if over:
+        sys.exit(f"{len(over)} scripts take longer than {args.budget:.0f}ms: {', '.join(over)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark comparing the in-process file placement in ``retrieve_data.copy_file`` with the
+``cp``/``ln -sf`` subprocesses it used to start for every file.
+
+Two file sets are timed: many small files, as when staging LBCs for a long forecast, and a few
+large files, as when staging ICs. Run it from the top of the repository:
+
+  .. code-block::
+
+    python tests/benchmarks/bench_retrieve_data_copy.py --help
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+
+import retrieve_data  # pylint: disable=wrong-import-position
+
+
+def subprocess_copy(source, destination, mode):
+    """Places a file the way retrieve_data.py did before, with a shell command."""
+    copy_cmd = {"copy": "cp", "symlink": "ln -sf", "hardlink": "ln -f"}[mode]
+    subprocess.run(f"{copy_cmd} {source} {destination}", check=True, shell=True)
+    return True
+
+
+def make_files(directory, count, size):
+    """Writes count files of size bytes and returns their paths."""
+    os.makedirs(directory)
+    block = os.urandom(min(size, 1024**2))
+    paths = []
+    for num in range(count):
+        path = os.path.join(directory, f"file{num:05d}.grib2")
+        with open(path, "wb") as fn:
+            remaining = size
+            while remaining > 0:
+                fn.write(block[:remaining])
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+
+def time_placement(place, paths, out_dir, mode, repeat):
+    """Returns the best time, in seconds, to place every file."""
+    best = None
+    for _ in range(repeat):
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir)
+        start = time.perf_counter()
+        for path in paths:
+            place(path, out_dir, mode)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    """Runs the benchmark and prints a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--small",
+        nargs=2,
+        type=int,
+        default=[500, 64 * 1024],
+        metavar=("COUNT", "BYTES"),
+        help="Number and size of the small files. default=500 65536",
+    )
+    parser.add_argument(
+        "--large",
+        nargs=2,
+        type=int,
+        default=[4, 256 * 1024**2],
+        metavar=("COUNT", "BYTES"),
+        help="Number and size of the large files. default=4 268435456",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs of each case; the best is kept. default=3"
+    )
+    parser.add_argument(
+        "--tmp_dir", help="Directory in which to write the files. default=system temp dir"
+    )
+    args = parser.parse_args(argv)
+
+    print(f"{'file set':<22s}{'mode':<10s}{'subprocess':>12s}{'in-process':>12s}{'speedup':>9s}")
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp:
+        for label, (count, size) in (("many small", args.small), ("few large", args.large)):
+            paths = make_files(os.path.join(tmp, label.replace(" ", "_")), count, size)
+            out_dir = os.path.join(tmp, "out")
+            name = f"{label} ({count}x{size // 1024}K)"
+            for mode in ("copy", "hardlink", "symlink"):
+                old = time_placement(subprocess_copy, paths, out_dir, mode, args.repeat)
+                new = time_placement(retrieve_data.copy_file, paths, out_dir, mode, args.repeat)
+                print(f"{name:<22s}{mode:<10s}{old:>11.3f}s{new:>11.3f}s{old / new:>8.1f}x")
+            shutil.rmtree(os.path.dirname(paths[0]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark for reading the jobs of an experiment from its Rocoto database.
+
+A synthetic database with the schema of Rocoto's ``jobs`` table is filled with succeeded jobs,
+as in a long cycled retrospective, and a few jobs that are still queued or running. Each poll
+first updates some of those jobs and adds new ones, as ``rocotorun`` would, and the jobs are then
+read into an experiment dictionary in two ways: by reading the whole table, which is how
+``update_expt_status()`` read it on every poll before ``RocotoJobsReader`` was added, and with a
+``RocotoJobsReader`` kept open across the polls, which reads only the rows that changed. The two
+dictionaries are checked against each other after the polls.
+
+Run it from the top of the repository:
+
+  .. code-block::
+
+    python tests/benchmarks/bench_rocoto_db.py --help
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+WE2EDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "WE2E"))
+sys.path.insert(0, os.path.join(WE2EDIR, "..", "..", "ush"))
+sys.path.insert(0, WE2EDIR)
+
+# pylint: disable=wrong-import-position
+from utils import RocotoJobsReader
+
+# The jobs table of a Rocoto database
+SCHEMA = """CREATE TABLE jobs (id INTEGER PRIMARY KEY, jobid VARCHAR(64), taskname VARCHAR(64),
+cycle DATETIME, cores INTEGER, state VARCHAR(64), native_state VARCHAR[64], exit_status INTEGER,
+tries INTEGER, nunknowns INTEGER, duration REAL)"""
+
+TASKS_PER_CYCLE = 50
+FIRST_CYCLE = 1560621600
+
+
+def job(row, state):
+    """The values of a job of the synthetic database; row numbers from 0 are in cycle order."""
+    cycle = FIRST_CYCLE + 3600 * (row // TASKS_PER_CYCLE)
+    return (f"{row}", f"task_{row % TASKS_PER_CYCLE}", cycle, 4, state, state, 0, 1, 0, 60.0)
+
+
+def insert_jobs(connection, rows, state):
+    """Adds jobs to the synthetic database."""
+    connection.executemany(
+        "INSERT INTO jobs (jobid,taskname,cycle,cores,state,native_state,exit_status,tries,"
+        "nunknowns,duration) VALUES (?,?,?,?,?,?,?,?,?,?)",
+        (job(row, state) for row in rows),
+    )
+    connection.commit()
+
+
+def poll_once(connection, rows, live, changes):
+    """Finishes the oldest live jobs and queues as many new ones, as rocotorun would."""
+    connection.execute(
+        "UPDATE jobs SET state = 'SUCCEEDED' WHERE id IN "
+        "(SELECT id FROM jobs WHERE state != 'SUCCEEDED' ORDER BY id LIMIT ?)",
+        (changes,),
+    )
+    connection.execute(
+        "UPDATE jobs SET state = 'RUNNING' WHERE id IN "
+        "(SELECT id FROM jobs WHERE state = 'QUEUED' ORDER BY id LIMIT ?)",
+        (changes,),
+    )
+    insert_jobs(connection, range(rows + live, rows + live + changes), "QUEUED")
+    return rows + changes
+
+
+def main(argv):
+    """Runs the benchmark and prints the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Sizes of the jobs table to time. default=10000 100000 1000000",
+    )
+    parser.add_argument(
+        "--live", type=int, default=100, help="Jobs that are queued or running. default=100"
+    )
+    parser.add_argument(
+        "--changes", type=int, default=10, help="Jobs that change at each poll. default=10"
+    )
+    parser.add_argument("--polls", type=int, default=10, help="Polls to time. default=10")
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10s}{'size':>10s}{'whole':>12s}{'changed':>12s}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rocoto_db = os.path.join(tmp_dir, "FV3LAM_wflow.db")
+            with closing(sqlite3.connect(rocoto_db)) as connection:
+                connection.execute(SCHEMA)
+                insert_jobs(connection, range(rows), "SUCCEEDED")
+                insert_jobs(connection, range(rows, rows + args.live), "QUEUED")
+
+                whole_expt, changed_expt = {}, {}
+                whole_time = changed_time = 0.0
+                with closing(RocotoJobsReader(rocoto_db)) as reader:
+                    reader.read(changed_expt)
+                    finished = rows
+                    for _ in range(args.polls):
+                        finished = poll_once(connection, finished, args.live, args.changes)
+
+                        start = time.perf_counter()
+                        with closing(RocotoJobsReader(rocoto_db)) as whole_reader:
+                            whole_reader.read(whole_expt)
+                        whole_time += time.perf_counter() - start
+
+                        start = time.perf_counter()
+                        reader.read(changed_expt)
+                        changed_time += time.perf_counter() - start
+
+            size = os.path.getsize(rocoto_db) / 2**20
+            whole_ms = 1000 * whole_time / args.polls
+            changed_ms = 1000 * changed_time / args.polls
+            print(
+                f"{rows:>10d}{size:>8.1f}MB{whole_ms:>10.2f}ms{changed_ms:>10.2f}ms"
+                f"{whole_time / changed_time:>8.0f}x"
+            )
+            if whole_expt != changed_expt:
+                print("The experiment dictionaries differ")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark for loading shell config scripts with ``load_shell_config``.
+
+Each WE2E test config is merged with ``config_defaults.yaml``, as ``setup()`` does, and written
+as a ``var_defns.sh``-style script with ``cfg_to_shell_str``. The scripts are then loaded with the
+native parser, and by sourcing them in a bash subshell (``subshell=True``), which is how scripts
+the parser could not read as INI files were loaded before it was added. The parsed values are
+checked against the ones the subshell finds.
+
+Run it from the top of the repository:
+
+  .. code-block::
+
+    python tests/benchmarks/bench_shell_config.py --help
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+USHDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+sys.path.insert(0, USHDIR)
+
+# pylint: disable=wrong-import-position
+from python_utils import (
+    cfg_to_shell_str,
+    config_parser,
+    flatten_dict,
+    load_config_file,
+    load_shell_config,
+    update_dict,
+)
+
+
+def default_configs():
+    """All the WE2E test configs."""
+    return sorted(
+        path
+        for path in glob.glob(
+            os.path.join(USHDIR, "..", "tests", "WE2E", "test_configs", "*", "config.*.yaml")
+        )
+        if not os.path.islink(path)
+    )
+
+
+def write_scripts(configs, tmp_dir):
+    """Writes each config, merged with the defaults, as a shell script in tmp_dir."""
+    scripts = []
+    for config in configs:
+        cfg = load_config_file(os.path.join(USHDIR, "config_defaults.yaml"))
+        update_dict(load_config_file(config), cfg)
+        script = os.path.join(tmp_dir, f"{os.path.basename(config)[:-5]}.sh")
+        with open(script, "w", encoding="utf-8") as fn:
+            fn.write(cfg_to_shell_str(cfg))
+        scripts.append(script)
+    return scripts
+
+
+def time_loads(scripts):
+    """Returns the time, in seconds, to load all the scripts, and what they load to."""
+    start = time.perf_counter()
+    loaded = [load_shell_config(script) for script in scripts]
+    return time.perf_counter() - start, loaded
+
+
+def mismatches(parsed, sourced):
+    """Counts the variables that the parser and the subshell load differently."""
+    count = 0
+    for name, value in flatten_dict(parsed).items():
+        expected = sourced.get(name)
+        # the subshell cannot tell unset variables from empty strings, and strips quotes that
+        # are part of the values
+        if isinstance(value, str) and expected in (value.strip("\"'"), None if value == "" else ""):
+            continue
+        count += value != expected
+    return count
+
+
+def main(argv):
+    """Runs the benchmark and prints the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--configs",
+        nargs="+",
+        default=default_configs(),
+        help="User configs to write as scripts. default=all the WE2E test configs",
+    )
+    parser.add_argument(
+        "--subshell", action="store_true", help="Also time sourcing them in a bash subshell"
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scripts = write_scripts(args.configs, tmp_dir)
+        size = sum(os.path.getsize(script) for script in scripts)
+        print(f"{len(scripts)} scripts, {size / 1024:.0f} KiB")
+
+        parsed_time, parsed = time_loads(scripts)
+        per_script = 1000 * parsed_time / len(scripts)
+        print(f"{'parser':<10s}{parsed_time:>9.3f}s{per_script:>9.2f}ms/script")
+        if not args.subshell:
+            return
+
+        # pylint: disable=protected-access
+        start = time.perf_counter()
+        sourced = [config_parser._source_shell_config(script) for script in scripts]
+        sourced_time = time.perf_counter() - start
+        per_script = 1000 * sourced_time / len(scripts)
+        print(
+            f"{'subshell':<10s}{sourced_time:>9.3f}s{per_script:>9.2f}ms/script"
+            f"{sourced_time / parsed_time:>8.1f}x"
+        )
+        bad = sum(mismatches(*loads) for loads in zip(parsed, sourced))
+        print(f"{bad} variables loaded differently")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
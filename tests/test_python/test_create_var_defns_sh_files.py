@@ -0,0 +1,54 @@
+""" Tests for create_var_defns_sh_files.py """
+
+import os
+import subprocess
+import tempfile
+import unittest
+
+from python_utils import cfg_to_yaml_str
+
+from create_var_defns_sh_files import create_var_defns_sh_files, var_defns_sh_dir
+
+class Testing(unittest.TestCase):
+    """ Define the tests"""
+    def test_create_var_defns_sh_files(self):
+
+        """ Test that the flat sections are written as shell files that
+        source_yaml sources instead of running uw, and that the others are
+        left to uw"""
+        cfg = {
+            "workflow": {
+                "CCPP_PHYS_SUITE": "FV3_GFS_v16",
+                "FCST_LEN_HRS": 6,
+                "CYCL_HRS": [0, 12],
+                "PREDEF_GRID_NAME": None,
+                "DEBUG": False,
+                "EXPTDIR": "/path/to/expt dir",
+            },
+            "task_run_fcst": {"LAYOUT_X": "{{ workflow.LAYOUT_X }}"},
+            "fixed_files": {"MAPPING": {"a": "b"}},
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            var_defns_fp = os.path.join(tmp_dir, "var_defns.yaml")
+            with open(var_defns_fp, "w", encoding="utf-8") as fn:
+                fn.write(cfg_to_yaml_str(cfg))
+
+            written = create_var_defns_sh_files(var_defns_fp)
+            self.assertEqual(written, ["workflow"])
+            self.assertEqual(os.listdir(var_defns_sh_dir(var_defns_fp)), ["workflow.sh"])
+
+            ushdir = os.path.join(os.path.dirname(__file__), "..", "..", "ush")
+            script = f"""
+                . {ushdir}/bash_utils/source_yaml.sh
+                uw() {{ echo "uw called" >&2; }}
+                source_yaml {var_defns_fp} workflow
+                echo "$CCPP_PHYS_SUITE|$FCST_LEN_HRS|${{CYCL_HRS[1]}}|$PREDEF_GRID_NAME|$DEBUG"
+                echo "$EXPTDIR"
+            """
+            out = subprocess.run(
+                ["bash", "-c", script], capture_output=True, text=True, check=True
+            )
+            self.assertEqual(
+                out.stdout.splitlines(), ["FV3_GFS_v16|6|12||False", "/path/to/expt dir"]
+            )
+            self.assertEqual(out.stderr, "")
@@ -26,8 +26,9 @@ class Testing(unittest.TestCase):
         submitted. """
 
         # run workflows in separate process to avoid conflict between community and nco settings
-        def run_workflow(USHdir, logfile):
-            p = Process(target=generate_FV3LAM_wflow, args=(USHdir, logfile))
+        def run_workflow(USHdir, logfile, incremental=False):
+            p = Process(target=generate_FV3LAM_wflow, args=(USHdir, logfile),
+                        kwargs={"incremental": incremental})
             p.start()
             p.join()
             exit_code = p.exitcode
@@ -46,6 +47,13 @@ class Testing(unittest.TestCase):
         )
         run_workflow(USHdir, logfile)
 
+        # regenerating it unchanged leaves the generated files alone
+        expt_dir = os.path.join(USHdir, "..", "..", "expt_dirs", "test_community")
+        wflow_xml = os.path.join(expt_dir, "FV3LAM_wflow.xml")
+        mtime = os.stat(wflow_xml).st_mtime_ns
+        run_workflow(USHdir, logfile, incremental=True)
+        self.assertEqual(os.stat(wflow_xml).st_mtime_ns, mtime)
+
     def setUp(self):
         define_macos_utilities()
         set_env_var("DEBUG", False)
@@ -0,0 +1,86 @@
+""" Tests for the modules that the scripts in ush import when they start up """
+
+import ast
+import glob
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+USHDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+
+# Slow modules that python_utils only imports when they are used
+LAZY_MODULES = ["jinja2", "yaml", "configparser", "argparse", "xml.dom.minidom", "urllib.request"]
+
+
+def imported_modules(module):
+    """Imports a module in a new interpreter and lists the modules it imports, with -X importtime
+
+    Args:
+        module (str): The module to import
+    Returns:
+        A set of the names of the modules imported, and the output of the interpreter if it
+        failed
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=USHDIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    modules = set()
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s*\d+ \|\s*\d+ \| *(\S+)$", line)
+        if match:
+            modules.add(match.group(1))
+    return modules, proc.stderr if proc.returncode else None
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests"""
+
+    def test_python_utils_imports(self):
+        """ Test that importing python_utils leaves its slow dependencies
+        to the functions that need them"""
+        modules, error = imported_modules("python_utils")
+        self.assertIsNone(error)
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_static_exports(self):
+        """ Test that the imports python_utils has for static analysis, with
+        the ones it does up front, are all the functions it exports"""
+        with open(os.path.join(USHDIR, "python_utils", "__init__.py"), encoding="utf-8") as fn:
+            tree = ast.parse(fn.read())
+        eager = [alias.name for node in tree.body
+                 if isinstance(node, ast.ImportFrom) and node.level
+                 for alias in node.names]
+        static = [alias.name for node in tree.body
+                  if isinstance(node, ast.If) and getattr(node.test, "id", None) == "TYPE_CHECKING"
+                  for imp in node.body for alias in imp.names]
+        # pylint: disable=import-outside-toplevel
+        sys.path.insert(0, USHDIR)
+        try:
+            import python_utils
+        finally:
+            sys.path.remove(USHDIR)
+        self.assertEqual(sorted(eager + static), sorted(python_utils.__all__))
+
+    def test_entry_point_imports(self):
+        """ Test that no script in ush imports jinja2 when it starts up; see
+        tests/benchmarks/bench_import_time.py for how long they take"""
+        for script in sorted(glob.glob(os.path.join(USHDIR, "*.py"))):
+            with open(script, encoding="utf-8") as fn:
+                if '__name__ == "__main__"' not in fn.read():
+                    continue
+            name = os.path.basename(script)[:-3]
+            with self.subTest(script=name):
+                modules, error = imported_modules(name)
+                missing = re.search(r"No module named '([^']+)'", error or "")
+                if missing:
+                    self.skipTest(f"{missing.group(1)} is not installed")
+                self.assertIsNone(error)
+                # Only needed to render templates
+                self.assertNotIn("jinja2", modules)
@@ -13,12 +13,18 @@ loaded first before executing unit tests.
 
 #pylint: disable=invalid-name
 
+import datetime
+import io
 import unittest
 import glob
 import tempfile
 import os
+from unittest import mock
+
+import yaml
 
 import python_utils as util
+from python_utils import config_parser
 
 
 class Testing(unittest.TestCase):
@@ -217,6 +223,162 @@ class Testing(unittest.TestCase):
             "regional_workflow", util.get_ini_value(cfg, "regional_workflow", "repo_url")
         )
 
+    def test_cfg_to_stream(self):
+        """ Test that configs are written to streams as they are converted,
+        the same as to strings"""
+        cfg = {
+            "workflow": {"CYCL_HRS": [0, 12], "DESC": 'a "b" <c>', "EMPTY": None},
+            "rocoto": {"tasks": {}},
+        }
+        for fmt in ["shell", "ini", "json", "yaml", "xml"]:
+            stream = io.StringIO()
+            getattr(util, f"cfg_to_{fmt}_stream")(cfg, stream)
+            if fmt == "yaml":
+                self.assertEqual(yaml.safe_load(stream.getvalue()), cfg)
+            else:
+                self.assertEqual(
+                    stream.getvalue(), getattr(util, f"cfg_to_{fmt}_str")(cfg)
+                )
+        self.assertIn('<DESC>a "b" &lt;c&gt;</DESC>', stream.getvalue())
+        self.assertIn("    <tasks/>", stream.getvalue())
+        with self.assertRaisesRegex(ValueError, "mem#mem#"):
+            util.cfg_to_xml_str({"task_mem#mem#": {"walltime": 1}})
+
+    def test_load_shell_config(self):
+        """ Test that shell config scripts are parsed without running them,
+        and sourced in a subshell only when they cannot be"""
+        cfg = {
+            "workflow": {"CYCL_HRS": list(range(6)), "EXPTDIR": "/expt dir", "N": None},
+            "task_run_fcst": {"LAYOUT_X": 5, "DO_SPP": False},
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = os.path.join(tmp_dir, "var_defns.sh")
+            with open(config, "w", encoding="utf-8") as fn:
+                fn.write('export TOP="a \\"b\\"" ; ARR=([0]="x y" [1]=z) # comment\n')
+                fn.write(util.cfg_to_shell_str(cfg))
+            cfg["workflow"]["N"] = ""
+            cfg.update({"TOP": 'a "b"', "ARR": ["x y", "z"]})
+            self.assertEqual(util.load_shell_config(config), cfg)
+
+            flat = util.load_shell_config(
+                os.path.join(self.ushdir, "python_utils", "test_data", "var_defns.sh")
+            )
+            self.assertEqual(flat["FCST_LEN_HRS"], 12)
+
+            with open(config, "w", encoding="utf-8") as fn:
+                fn.write("A=1\nB=${A}2\n")
+            with self.assertRaisesRegex(ValueError, "line 2"):
+                util.load_shell_config(config, subshell=False)
+            self.assertEqual(util.load_shell_config(config)["B"], 12)
+            self.assertEqual(util.load_config_file(config)["B"], 12)
+
+    def test_extend_yaml(self):
+        """ Test that templates are rendered in one pass whatever order
+        they reference each other in, and that templates that cannot be
+        filled are left in place and reported"""
+        cfg = {
+            "workflow": {
+                "EXPTDIR": "{{ [workflow.EXPT_BASEDIR, EXPT_SUBDIR]|path_join }}",
+                "LOGDIR": "{{ EXPTDIR }}/log",
+                "EXPT_BASEDIR": "{{ user.HOMEdir }}/expt_dirs",
+                "EXPT_SUBDIR": "test",
+                "NLOGS": "{{ 2 * task.NPROCS }}",
+                "FILES": ["{{ LOGDIR }}/a", "{{ CYCLE }}/b"],
+                "ID": "{{ '007' | string }}",
+                "NESTED": '{{ "{{ EXPT_SUBDIR }}" }}{% raw %}{% endraw %}',
+            },
+            "task": {
+                "NPROCS": "{{ parent.user.NNODES * 2 }}",
+                "A": "{{ B }}",
+                "B": "{{ A }}",
+                "SELF": "{{ SELF }}",
+            },
+            "user": {"HOMEdir": "/home", "NNODES": 3},
+        }
+        resolver = util.extend_yaml(cfg)
+        workflow = cfg["workflow"]
+        self.assertEqual(workflow["EXPTDIR"], "/home/expt_dirs/test")
+        self.assertEqual(workflow["LOGDIR"], "/home/expt_dirs/test/log")
+        self.assertEqual(workflow["NLOGS"], 12)
+        self.assertEqual(workflow["FILES"], ["/home/expt_dirs/test/log/a", "{{ CYCLE }}/b"])
+        self.assertEqual(workflow["ID"], "007")
+        self.assertEqual(workflow["NESTED"], "test")
+        self.assertEqual(cfg["task"]["A"], "{{ B }}")
+        self.assertEqual(cfg["task"]["SELF"], "{{ SELF }}")
+        self.assertEqual(resolver.cycles, [["task.A", "task.B", "task.A"]])
+        self.assertEqual(
+            [(path, template) for path, template, _ in resolver.undefined],
+            [("workflow.FILES", "{{ CYCLE }}")],
+        )
+
+        # Once the missing value is set, only what was left is rendered
+        workflow["CYCLE"] = "{{ EXPT_SUBDIR }}"
+        workflow["LOGDIR"] = "changed"
+        resolver.retry()
+        self.assertEqual(workflow["FILES"], ["/home/expt_dirs/test/log/a", "test/b"])
+        self.assertEqual(workflow["LOGDIR"], "changed")
+        self.assertEqual(resolver.cycles, [["task.A", "task.B", "task.A"]])
+        self.assertEqual(resolver.undefined, [])
+
+    def test_load_yaml_config_cache(self):
+        """ Test that parsed YAML configs are cached on disk, that callers
+        get their own copy, and that changed or time-dependent files are
+        parsed again"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, "cache")
+            config = os.path.join(tmp_dir, "config.yaml")
+            with open(config, "w", encoding="utf-8") as fn:
+                fn.write("task:\n  NPROCS: 4\n  DATES: [2019-06-15]\n")
+            with mock.patch.dict(os.environ, {"SRW_CONFIG_CACHE_DIR": cache_dir}):
+                cfg = util.load_config_file(config)
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+                cfg["task"]["NPROCS"] = 8
+                self.assertEqual(util.load_yaml_config(config)["task"]["NPROCS"], 4)
+
+                # Another process finds it on disk
+                config_parser.clear_config_cache()
+                cfg = util.load_yaml_config(config)
+                self.assertEqual(cfg["task"]["DATES"], [datetime.date(2019, 6, 15)])
+
+                with open(config, "w", encoding="utf-8") as fn:
+                    fn.write("task:\n  NPROCS: 16\n")
+                os.utime(config, ns=(0, 0))
+                self.assertEqual(util.load_yaml_config(config), {"task": {"NPROCS": 16}})
+
+                stamped = os.path.join(tmp_dir, "stamped.yaml")
+                with open(stamped, "w", encoding="utf-8") as fn:
+                    fn.write("id: !nowtimestamp\n")
+                self.assertTrue(util.load_yaml_config(stamped)["id"].startswith("id_"))
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_config_schema(self):
+        """ Test that a config is checked against the valid values in one
+        pass that reports every invalid variable"""
+        schema = util.ConfigSchema({
+            "valid_vals_RUN_ENVIR": ["nco", "community"],
+            "valid_vals_VX_FIELDS": ["APCP", "REFC"],
+            "valid_vals_DO_SPPT": [True, False],
+            "valid_vals_DT_SUBHOURLY_POST_MNTS": [0, 1, 5],
+        })
+        cfg = {
+            "user": {"RUN_ENVIR": "nco"},
+            "workflow": {"DT_SUBHOURLY_POST_MNTS": None},
+            "global": {"DO_SPPT": "yes"},
+            "verification": {"VX_FIELDS": ["APCP", "RETOP"]},
+            "task_run_post": {"DT_SUBHOURLY_POST_MNTS": 5},
+        }
+        self.assertEqual(schema.validate(cfg)[0].splitlines()[2].strip(), "DO_SPPT = yes")
+        self.assertIn("VX_FIELDS = ['APCP', 'RETOP']", schema.validate(cfg)[1])
+        self.assertEqual(len(schema.validate(cfg)), 2)
+
+        cfg["global"]["DO_SPPT"] = False
+        cfg["verification"]["VX_FIELDS"] = ["REFC"]
+        self.assertEqual(schema.validate(cfg), [])
+
+        schema = util.load_config_schema(os.path.join(self.ushdir, "valid_param_vals.yaml"))
+        self.assertTrue(schema.allows("CCPP_PHYS_SUITE", "FV3_GFS_v16"))
+        self.assertFalse(schema.allows("CCPP_PHYS_SUITE", ["FV3_GFS_v16"]))
+
     def test_print_msg(self):
         """ Test that a bool is returned from print_info_msg"""
         self.assertEqual(util.print_info_msg("Hello World!", verbose=False), False)
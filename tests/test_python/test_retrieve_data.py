@@ -1,3 +1,4 @@
+# pylint: disable=too-many-lines
 """
 Functional test suite for gathering data using retreve_data.py.
 
@@ -17,16 +18,102 @@ To run a single test:
 
 To ensure all output is printed for debugging or to monitor test progress,
 omit the "-b" flag.
+
+The LocalTesting class covers behavior that can be checked offline against a
+local http.server stand-in, and runs with the unit tests.
 """
+import argparse
+import contextlib
 import datetime
+import functools
 import glob
+import hashlib
+import http.server
+import io
 import os
+import tarfile
 import tempfile
+import threading
 import unittest
 
+import yaml
+
 import retrieve_data
 
 
+class LocalHandler(http.server.SimpleHTTPRequestHandler):
+
+    """Serves files from a directory over keep-alive connections, honoring
+    single Range requests. The first ``throttle`` requests for each path are
+    answered with HTTP 503."""
+
+    protocol_version = "HTTP/1.1"
+    throttle = 0
+    seen = {}
+    connections = 0
+
+    def setup(self):
+        LocalHandler.connections += 1
+        super().setup()
+
+    def throttled(self):
+        """Count the request and send a 503 if it should be throttled."""
+        count = self.seen.get(self.path, 0)
+        self.seen[self.path] = count + 1
+        if count < self.throttle:
+            self.send_error(503)
+            return True
+        return False
+
+    def send_file(self, with_body):
+        """Send the requested file, or the part of it in a Range header."""
+        if self.throttled():
+            return
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as fn:
+            data = fn.read()
+        status, start, end = 200, 0, len(data) - 1
+        if self.headers.get("Range"):
+            first, _, last = self.headers["Range"].split("=")[1].partition("-")
+            start = int(first)
+            end = min(int(last), end) if last else end
+            if start >= len(data):
+                self.send_error(416)
+                return
+            status = 206
+        body = data[start : end + 1]
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.send_file(with_body=True)
+
+    def do_HEAD(self):
+        self.send_file(with_body=False)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def start_local_server(directory, handler=LocalHandler):
+    """Start a threaded HTTP server for directory and return (server, url)."""
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(handler, directory=directory),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
 @unittest.skipIf(os.environ.get("UNIT_TEST") == "true", "Skipping functional tests")
 class FunctionalTesting(unittest.TestCase):
 
@@ -493,3 +580,527 @@ class FunctionalTesting(unittest.TestCase):
 
             # Testing that there is no failure
             retrieve_data.main(args)
+
+
+class LocalTesting(unittest.TestCase):
+
+    """Offline tests for retrieve_data using a local HTTP server."""
+
+    def setUp(self):
+        self.config = os.path.join(
+            os.path.dirname(__file__), "..", "..", "parm", "data_locations.yml"
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.src_dir = os.path.join(self.tmp_dir.name, "src")
+        self.out_dir = os.path.join(self.tmp_dir.name, "out")
+        os.makedirs(self.src_dir)
+        os.makedirs(self.out_dir)
+        for fhr in range(0, 7):
+            with open(
+                os.path.join(self.src_dir, f"hrrr.t12z.wrfprsf{fhr:02d}.grib2"), "wb"
+            ) as fn:
+                fn.write(os.urandom(1024) * (fhr + 1))
+        LocalHandler.throttle = 0
+        LocalHandler.seen = {}
+        LocalHandler.connections = 0
+        self.server, self.url = start_local_server(self.src_dir)
+        self.orig_backoff = retrieve_data.BACKOFF_SECONDS
+        retrieve_data.BACKOFF_SECONDS = 0.01
+
+    def tearDown(self):
+        retrieve_data.BACKOFF_SECONDS = self.orig_backoff
+        retrieve_data.HTTP_POOL.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def local_args(self, *extra):
+        """Arguments for retrieving HRRR LBCS from the local server."""
+        # fmt: off
+        return [
+            '--file_set', 'fcst',
+            '--config', self.config,
+            '--cycle_date', '2022062512',
+            '--data_stores', 'disk',
+            '--data_type', 'HRRR',
+            '--fcst_hrs', '0', '6', '1',
+            '--output_path', self.out_dir,
+            '--ics_or_lbcs', 'LBCS',
+            '--input_file_path', self.url,
+            *extra,
+        ]
+        # fmt: on
+
+    def test_concurrent_download_with_throttling(self):
+        """Throttled requests are retried and every file arrives intact."""
+        LocalHandler.throttle = 2
+        cla = retrieve_data.parse_args(self.local_args("--max_host_connections", "3"))
+        file_templates = retrieve_data.get_file_templates(
+            cla, cla.config["HRRR"], data_store="aws"
+        )
+        unavailable = retrieve_data.get_requested_files(
+            cla,
+            file_templates=file_templates,
+            input_locs=self.url,
+            method="download",
+        )
+        self.assertEqual(unavailable, [])
+        for fhr in range(0, 7):
+            name = f"hrrr.t12z.wrfprsf{fhr:02d}.grib2"
+            with open(os.path.join(self.src_dir, name), "rb") as src, open(
+                os.path.join(self.out_dir, name), "rb"
+            ) as out:
+                self.assertEqual(src.read(), out.read())
+
+    def test_unavailable_download(self):
+        """Missing files are reported in submission order."""
+        cla = retrieve_data.parse_args(self.local_args("--fcst_hrs", "7", "9", "1"))
+        unavailable = retrieve_data.get_requested_files(
+            cla,
+            file_templates=["hrrr.t{hh}z.wrfprsf{fcst_hr:02d}.grib2"],
+            input_locs=self.url,
+            method="download",
+        )
+        self.assertEqual(
+            unavailable,
+            [f"{self.url}/hrrr.t12z.wrfprsf{fhr:02d}.grib2" for fhr in (7, 8, 9)],
+        )
+
+    def test_connection_reuse(self):
+        """Serial downloads from one host share a single connection."""
+        pool = retrieve_data.ConnectionPool()
+        for fhr in range(0, 7):
+            url = f"{self.url}/hrrr.t12z.wrfprsf{fhr:02d}.grib2"
+            self.assertTrue(retrieve_data.download_file(url, self.out_dir, pool=pool))
+        pool.close()
+        self.assertEqual(LocalHandler.connections, 1)
+
+    def test_resume_partial_download(self):
+        """A partial file is completed with a Range request."""
+        name = "hrrr.t12z.wrfprsf03.grib2"
+        with open(os.path.join(self.src_dir, name), "rb") as fn:
+            data = fn.read()
+        with open(os.path.join(self.out_dir, name), "wb") as fn:
+            fn.write(data[:1000])
+        self.assertTrue(retrieve_data.download_file(f"{self.url}/{name}", self.out_dir))
+        with open(os.path.join(self.out_dir, name), "rb") as fn:
+            self.assertEqual(fn.read(), data)
+        # A complete file is left alone
+        self.assertTrue(retrieve_data.download_file(f"{self.url}/{name}", self.out_dir))
+        with open(os.path.join(self.out_dir, name), "rb") as fn:
+            self.assertEqual(fn.read(), data)
+
+    def test_check_file(self):
+        """check_file uses HEAD requests and reports missing files."""
+        self.assertTrue(
+            retrieve_data.check_file(f"{self.url}/hrrr.t12z.wrfprsf00.grib2")
+        )
+        self.assertFalse(
+            retrieve_data.check_file(f"{self.url}/hrrr.t12z.wrfprsf99.grib2")
+        )
+        self.assertEqual(os.listdir(self.out_dir), [])
+
+    def test_grib_subset_download(self):
+        """Only the messages selected through the .idx file are fetched,
+        with adjacent messages merged into one Range request."""
+        messages = [
+            ("PRES", "surface"),
+            ("TMP", "500 mb"),
+            ("TMP", "2 m above ground"),
+            ("UGRD", "10 m above ground"),
+            ("VGRD", "10 m above ground"),
+            ("HGT", "500 mb"),
+        ]
+        name = "hrrr.t12z.wrfprsf01.grib2"
+        chunks = [os.urandom(100 + 10 * num) for num in range(len(messages))]
+        index, offset = [], 0
+        for num, ((var, lev), chunk) in enumerate(zip(messages, chunks)):
+            index.append(f"{num + 1}:{offset}:d=2022062512:{var}:{lev}:1 hour fcst:")
+            offset += len(chunk)
+        with open(os.path.join(self.src_dir, name), "wb") as fn:
+            fn.write(b"".join(chunks))
+        with open(os.path.join(self.src_dir, f"{name}.idx"), "w", encoding="utf-8") as fn:
+            fn.write("\n".join(index) + "\n")
+
+        ranges = retrieve_data.grib_byte_ranges(
+            retrieve_data.parse_grib_index("\n".join(index)),
+            variables=["TMP", "UGRD", "HGT"],
+        )
+        self.assertEqual(len(ranges), 2)
+        self.assertIsNone(ranges[-1][1])
+
+        self.assertTrue(
+            retrieve_data.download_grib_subset(
+                f"{self.url}/{name}",
+                self.out_dir,
+                variables=["TMP", "UGRD", "HGT"],
+                levels=["500 mb", "10 m above ground"],
+            )
+        )
+        with open(os.path.join(self.out_dir, name), "rb") as fn:
+            self.assertEqual(fn.read(), chunks[1] + chunks[3] + chunks[5])
+
+        # Without an index, the whole file is downloaded
+        name = "hrrr.t12z.wrfprsf02.grib2"
+        self.assertTrue(
+            retrieve_data.download_grib_subset(
+                f"{self.url}/{name}", self.out_dir, variables=["TMP"]
+            )
+        )
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.out_dir, name)),
+            os.path.getsize(os.path.join(self.src_dir, name)),
+        )
+
+    def test_cache_shared_between_outputs(self):
+        """A second retrieval of the same files is served from the cache
+        by hard links, without changing the times of the files placed
+        before, and eviction removes the least recently used files to
+        keep the cache within its limit."""
+        cache = retrieve_data.DataCache(os.path.join(self.tmp_dir.name, "cache"))
+        cla = retrieve_data.parse_args(self.local_args())
+        templates = ["hrrr.t{hh}z.wrfprsf{fcst_hr:02d}.grib2"]
+        first = os.path.join(self.tmp_dir.name, "expt1", "hrrr.t12z.wrfprsf00.grib2")
+        for out in ("expt1", "expt2"):
+            if out == "expt2":
+                os.utime(first, (0, 0))
+            cla.output_path = os.path.join(self.tmp_dir.name, out)
+            unavailable = retrieve_data.get_requested_files(
+                cla,
+                file_templates=templates,
+                input_locs=self.url,
+                method="download",
+                cache=cache,
+                data_store="aws",
+            )
+            self.assertEqual(unavailable, [])
+
+        for fhr in range(0, 7):
+            name = f"hrrr.t12z.wrfprsf{fhr:02d}.grib2"
+            self.assertEqual(LocalHandler.seen[f"/{name}"], 1)
+            self.assertTrue(
+                os.path.samefile(
+                    os.path.join(self.tmp_dir.name, "expt1", name),
+                    os.path.join(self.tmp_dir.name, "expt2", name),
+                )
+            )
+
+        self.assertEqual(os.stat(first).st_mtime, 0)
+
+        # The file used longest ago is evicted first
+        old_key = retrieve_data.DataCache.key("aws", f"{self.url}/hrrr.t12z.wrfprsf03.grib2")
+        os.utime(cache.used_path(old_key), (0, 0))
+        sizes = {
+            name: os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(cache.objects_dir)
+            for name in names
+        }
+        cache.max_size = sum(sizes.values()) - 1
+        cache.evict()
+        self.assertFalse(os.path.exists(cache.object_path(old_key)))
+        self.assertFalse(os.path.exists(cache.used_path(old_key)))
+
+        cache.max_size = 8 * 1024
+        cache.evict()
+        sizes = [
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(cache.objects_dir)
+            for name in names
+        ]
+        self.assertLessEqual(sum(sizes), cache.max_size)
+        self.assertGreater(len(sizes), 0)
+
+    def test_parallel_members(self):
+        """Members and forecast hours are retrieved on a thread pool
+        without changing the working directory, and missing files are
+        reported in member, forecast hour order."""
+        for mem in (1, 2, 3):
+            mem_dir = os.path.join(self.src_dir, f"mem{mem:03d}")
+            os.makedirs(mem_dir)
+            for fhr in range(0, 7):
+                if (mem, fhr) in ((2, 5), (3, 1)):
+                    continue
+                name = os.path.join(mem_dir, f"gdas.t12z.f{fhr:03d}.nc")
+                with open(name, "w", encoding="utf-8") as fn:
+                    fn.write(f"{mem} {fhr}")
+        # The working directory may have been removed by other tests, so
+        # it is compared by inode rather than by path
+        cwd = os.stat(".")
+        cla = retrieve_data.parse_args(
+            self.local_args("--members", "1", "3", "--workers", "8")
+        )
+        cla.output_path = os.path.join(self.out_dir, "mem{mem:03d}")
+        unavailable = retrieve_data.get_requested_files(
+            cla,
+            file_templates=["gdas.t{hh}z.f{fcst_hr:03d}.nc"],
+            input_locs=os.path.join(self.src_dir, "mem{mem:03d}"),
+            method="disk",
+        )
+        self.assertTrue(os.path.samestat(os.stat("."), cwd))
+        self.assertEqual(
+            unavailable,
+            [
+                os.path.join(self.src_dir, "mem002", "gdas.t12z.f005.nc"),
+                os.path.join(self.src_dir, "mem003", "gdas.t12z.f001.nc"),
+            ],
+        )
+        self.assertEqual(
+            len(glob.glob(os.path.join(self.out_dir, "mem*", "*.nc"))), 3 * 7 - 2
+        )
+
+    def test_compiled_template(self):
+        """Compiled templates render the same paths as str.format."""
+        cycle = datetime.datetime(2022, 9, 3, 13)
+        tmpl = "/{yyyymmdd}/{bin6}_{hh_even}/mem{mem:03d}/f{fcst_hr:03d}.{jjj}.{ens_group}"
+        rendered = retrieve_data.compile_template(tmpl).render_all(
+            cycle, members=[1, 2], fcst_hrs=[0, 6, 12], ens_group=1
+        )
+        expected = [
+            tmpl.format(
+                yyyymmdd="20220903", bin6="12-17", hh_even="12", mem=mem,
+                fcst_hr=fhr, jjj="246", ens_group=1,
+            )
+            for mem in (1, 2)
+            for fhr in (0, 6, 12)
+        ]
+        self.assertEqual(rendered, expected)
+        self.assertEqual(
+            retrieve_data.fill_template(tmpl, cycle, mem=2, fcst_hr=6, ens_group=1),
+            expected[4],
+        )
+        self.assertEqual(
+            retrieve_data.fill_template("{yyyymmddhh}{mem}", cycle), "2022090313"
+        )
+        with self.assertRaises(KeyError):
+            retrieve_data.fill_template("{unknown}", cycle)
+
+    def test_cycle_dates(self):
+        """Several cycles are retrieved in one run, files shared between
+        cycles are downloaded once, and each cycle gets a summary file."""
+        config = os.path.join(self.tmp_dir.name, "data_locations.yml")
+        with open(config, "w", encoding="utf-8") as fn:
+            fn.write(
+                "HRRR:\n"
+                "  aws:\n"
+                "    protocol: download\n"
+                f"    url: {self.url}\n"
+                "    file_names:\n"
+                "      anl: ['hrrr.t{hh_even}z.wrfprsf00.grib2']\n"
+                "      fcst: ['hrrr.t{hh_even}z.wrfprsf{fcst_hr:02d}.grib2']\n"
+            )
+        out_tmpl = os.path.join(self.out_dir, "{yyyymmddhh}")
+        args = self.local_args(
+            "--config", config,
+            "--data_stores", "aws",
+            "--cycle_dates", "2022062512", "2022062513", "1",
+            "--output_path", out_tmpl,
+            "--summary_file", "summary.sh",
+        )
+        retrieve_data.main(args)
+        self.assertEqual(set(LocalHandler.seen.values()), {1})
+        self.assertEqual(len(LocalHandler.seen), 7)
+        for cycle in ("2022062512", "2022062513"):
+            out = out_tmpl.format(yyyymmddhh=cycle)
+            self.assertEqual(len(glob.glob(os.path.join(out, "*.grib2"))), 7)
+            with open(os.path.join(out, "summary.sh"), encoding="utf-8") as fn:
+                self.assertIn(f"EXTRN_MDL_CDATE={cycle}", fn.read())
+
+        # Cycles must not share an output path
+        with self.assertRaises(argparse.ArgumentTypeError):
+            retrieve_data.parse_args(
+                self.local_args("--cycle_dates", "2022062512", "2022062600", "6")
+            )
+
+    def test_manifest_skips_unchanged_files(self):
+        """A rerun skips the files in the manifest that are unchanged, and
+        the manifest holds the checksum computed during the download."""
+        cla = retrieve_data.parse_args(self.local_args())
+        kwargs = {
+            "file_templates": ["hrrr.t{hh}z.wrfprsf{fcst_hr:02d}.grib2"],
+            "input_locs": self.url,
+            "method": "download",
+            "manifest": retrieve_data.Manifest(),
+        }
+        self.assertEqual(retrieve_data.get_requested_files(cla, **kwargs), [])
+
+        name = "hrrr.t12z.wrfprsf02.grib2"
+        with open(os.path.join(self.out_dir, retrieve_data.MANIFEST_NAME), encoding="utf-8") as fn:
+            entries = {entry["name"]: entry for entry in yaml.safe_load(fn)}
+        self.assertEqual(len(entries), 7)
+        with open(os.path.join(self.src_dir, name), "rb") as fn:
+            self.assertEqual(entries[name]["sha256"], hashlib.sha256(fn.read()).hexdigest())
+
+        # A changed file is retrieved again; the others are skipped.
+        with open(os.path.join(self.out_dir, name), "ab") as fn:
+            fn.write(b"corrupt")
+        kwargs["manifest"] = retrieve_data.Manifest()
+        self.assertEqual(retrieve_data.get_requested_files(cla, **kwargs), [])
+        self.assertEqual(
+            {path for path, count in LocalHandler.seen.items() if count > 1}, {f"/{name}"}
+        )
+        with open(os.path.join(self.src_dir, name), "rb") as src, open(
+            os.path.join(self.out_dir, name), "rb"
+        ) as out:
+            self.assertEqual(src.read(), out.read())
+
+    def test_copy_file_modes(self):
+        """Files are copied, hard linked or symlinked in-process."""
+        source = os.path.join(self.src_dir, "hrrr.t12z.wrfprsf03.grib2")
+        dest = os.path.join(self.out_dir, "hrrr.t12z.wrfprsf03.grib2")
+        with open(source, "rb") as fn:
+            data = fn.read()
+        for mode in ("copy", "hardlink", "symlink", "copy"):
+            self.assertTrue(retrieve_data.copy_file(source, self.out_dir, mode))
+            with open(dest, "rb") as fn:
+                self.assertEqual(fn.read(), data)
+            self.assertEqual(os.path.islink(dest), mode == "symlink")
+            self.assertEqual(os.path.samefile(source, dest), mode != "copy")
+        self.assertFalse(
+            retrieve_data.copy_file(os.path.join(self.src_dir, "missing"), self.out_dir)
+        )
+        self.assertEqual(os.listdir(self.out_dir), ["hrrr.t12z.wrfprsf03.grib2"])
+
+
+FAKE_HSI = """#!/usr/bin/env python3
+import os, shutil, sys
+root = os.environ["FAKE_HPSS_ROOT"]
+with open(os.environ["FAKE_HPSS_LOG"], "a") as log:
+    log.write("hsi " + " ".join(sys.argv[1:]) + "\\n")
+args = [arg for arg in sys.argv[1:] if arg != "-P"]
+path = os.path.join(root, args[-1].lstrip("/"))
+if args[0] == "ls":
+    if not os.path.exists(path):
+        sys.exit(72)
+    print("\\n".join(os.path.join(args[-1], name) for name in os.listdir(path)))
+elif args[0] == "get":
+    shutil.copy(path, os.path.basename(path))
+"""
+
+FAKE_HTAR = """#!/usr/bin/env python3
+import fnmatch, os, sys, tarfile
+root = os.environ["FAKE_HPSS_ROOT"]
+with open(os.environ["FAKE_HPSS_LOG"], "a") as log:
+    log.write("htar " + " ".join(sys.argv[1:]) + "\\n")
+archive, wanted = sys.argv[2], sys.argv[3:]
+with tarfile.open(os.path.join(root, archive.lstrip("/"))) as tar:
+    members = [m for m in tar.getmembers() if any(fnmatch.fnmatch(m.name, w) for w in wanted)]
+    tar.extractall(members=members)
+sys.exit(0 if len(members) >= len(wanted) else 1)
+"""
+
+
+class HPSSTesting(unittest.TestCase):
+
+    """Offline tests for HPSS retrieval using fake hsi and htar tools."""
+
+    def setUp(self):
+        self.config = os.path.join(
+            os.path.dirname(__file__), "..", "..", "parm", "data_locations.yml"
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        tmp = self.tmp_dir.name
+        bin_dir = os.path.join(tmp, "bin")
+        os.makedirs(bin_dir)
+        for name, script in (("hsi", FAKE_HSI), ("htar", FAKE_HTAR)):
+            with open(os.path.join(bin_dir, name), "w", encoding="utf-8") as fn:
+                fn.write(script)
+            os.chmod(os.path.join(bin_dir, name), 0o755)
+        self.log = os.path.join(tmp, "hpss.log")
+        self.orig_env = dict(os.environ)
+        os.environ["PATH"] = f"{bin_dir}:{os.environ['PATH']}"
+        os.environ["FAKE_HPSS_ROOT"] = os.path.join(tmp, "hpss")
+        os.environ["FAKE_HPSS_LOG"] = self.log
+        retrieve_data._HPSS_LISTINGS.clear()  # pylint: disable=protected-access
+
+        # Two GDAS ensemble group archives for one cycle
+        hpss_dir = os.path.join(
+            tmp, "hpss", "NCEPPROD/5year/hpssprod/runhistory/rh2022/202205/20220525"
+        )
+        os.makedirs(hpss_dir)
+        for grp, mems in ((1, range(1, 11)), (2, range(11, 13))):
+            tar_path = os.path.join(
+                hpss_dir, f"com_gfs_prod_enkfgdas.20220525_12.enkfgdas_grp{grp}.tar"
+            )
+            with tarfile.open(tar_path, "w") as tar:
+                for mem in mems:
+                    for fhr in (6, 9):
+                        for kind in ("atm", "sfc"):
+                            name = (
+                                f"./enkfgdas.20220525/12/atmos/mem{mem:03d}/"
+                                f"gdas.t12z.{kind}f{fhr:03d}.nc"
+                            )
+                            data = f"{name}\n".encode()
+                            info = tarfile.TarInfo(name)
+                            info.size = len(data)
+                            tar.addfile(info, io.BytesIO(data))
+        self.out_tmpl = os.path.join(tmp, "out", "mem{mem:03d}")
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.orig_env)
+        self.tmp_dir.cleanup()
+
+    def gdas_args(self, *extra):
+        """Arguments for retrieving GDAS members 1-12 from HPSS."""
+        # fmt: off
+        return [
+            '--file_set', 'anl',
+            '--config', self.config,
+            '--cycle_date', '2022052512',
+            '--data_stores', 'hpss',
+            '--data_type', 'GDAS',
+            '--fcst_hrs', '6', '9', '3',
+            '--output_path', self.out_tmpl,
+            '--ics_or_lbcs', 'ICS',
+            '--file_fmt', 'netcdf',
+            '--members', '1', '12',
+            *extra,
+        ]
+        # fmt: on
+
+    def calls(self, tool):
+        """Invocations of a fake tool."""
+        with open(self.log, encoding="utf-8") as fn:
+            return [line for line in fn if line.startswith(tool)]
+
+    def test_one_htar_per_archive(self):
+        """All members of both ensemble groups come from one htar call per
+        archive and one hsi listing."""
+        retrieve_data.main(self.gdas_args())
+        self.assertEqual(len(self.calls("hsi")), 1)
+        self.assertEqual(len(self.calls("htar")), 2)
+        for mem in range(1, 13):
+            out = self.out_tmpl.format(mem=mem)
+            self.assertEqual(
+                sorted(os.path.basename(path) for path in glob.glob(os.path.join(out, "*.nc"))),
+                sorted(
+                    f"gdas.t12z.{kind}f{fhr:03d}.nc"
+                    for kind in ("atm", "sfc")
+                    for fhr in (6, 9)
+                ),
+            )
+        self.assertFalse(glob.glob(os.path.join(self.tmp_dir.name, "out", "*", ".hpss*")))
+
+    def test_dry_run(self):
+        """A dry run lists the archives without extracting anything."""
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            retrieve_data.main(self.gdas_args("--dry_run"))
+        self.assertIn("HPSS retrieval plan: 2 archive(s)", out.getvalue())
+        self.assertEqual(self.calls("htar"), [])
+        self.assertFalse(os.path.exists(self.out_tmpl.format(mem=1)))
+
+    def test_missing_files(self):
+        """Files missing from every archive are reported."""
+        cla = retrieve_data.parse_args(self.gdas_args("--fcst_hrs", "6", "12", "3"))
+        store_specs = cla.config["GDAS"]["hpss"]
+        file_names = retrieve_data.get_file_templates(cla, cla.config["GDAS"], "hpss")
+        unavailable = retrieve_data.hpss_requested_files(cla, file_names, store_specs)
+        self.assertEqual(len(unavailable), 12 * 2)
+        self.assertTrue(all("f012" in path for path in unavailable))
+
+    def test_rerun_skips_present_files(self):
+        """Files recorded in the manifest are not extracted again."""
+        retrieve_data.main(self.gdas_args())
+        retrieve_data._HPSS_LISTINGS.clear()  # pylint: disable=protected-access
+        retrieve_data.main(self.gdas_args())
+        self.assertEqual(len(self.calls("htar")), 2)
@@ -0,0 +1,199 @@
+""" Tests for the utilities of the WE2E scripts in tests/WE2E/utils.py"""
+
+#pylint: disable=invalid-name
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import closing
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "WE2E"))
+
+# tests/WE2E is on the path only once the tests run
+# pylint: disable=wrong-import-position,import-error
+from utils import (MonitorStore, RocotoJobsReader, RocotorunRunner, rocoto_cycles,
+                   rocoto_tasks)
+
+# The jobs table of a Rocoto database
+ROCOTO_JOBS = """CREATE TABLE jobs (id INTEGER PRIMARY KEY, jobid VARCHAR(64), taskname VARCHAR(64),
+cycle DATETIME, cores INTEGER, state VARCHAR(64), native_state VARCHAR[64], exit_status INTEGER,
+tries INTEGER, nunknowns INTEGER, duration REAL)"""
+
+# A Rocoto XML laid out as generate_FV3LAM_wflow.py writes it, with the nested metatasks of
+# parm/wflow/post.yaml for two ensemble members and the forecast hours of a long forecast
+ROCOTO_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE workflow [
+  <!ENTITY PREFIX "run">
+  <!ENTITY LOGDIR "/expt/log">
+]>
+<workflow realtime="F" scheduler="slurm" cyclethrottle="200" taskthrottle="1000">
+  <cycledef group="at_start">201906151800 201906151800 06:00:00</cycledef>
+  <cycledef group="forecast">201906151800 201906161200 06:00:00</cycledef>
+  <cycledef group="long_forecast">201906151800 201906161800 24:00:00</cycledef>
+  <log><cyclestr>&LOGDIR;/FV3LAM_wflow.@Y@m@d@H.log</cyclestr></log>
+  <task name="make_grid" cycledefs="at_start" maxtries="2">
+    <command>make_grid</command>
+  </task>
+  <metatask name="run_ensemble">
+    <var name="mem">001 002</var>
+    <task name="&PREFIX;_fcst_mem#mem#" cycledefs="forecast,long_forecast" maxtries="1">
+      <command>run_fcst</command>
+    </task>
+  </metatask>
+  <metatask name="run_ens_post">
+    <var name="mem">001 002</var>
+    <metatask name="run_post_mem#mem#_all_fhrs">
+      <var name="fhr">000 001 002</var>
+      <var name="cycledef">forecast forecast long_forecast</var>
+      <task name="run_post_mem#mem#_f#fhr#" cycledefs="#cycledef#" maxtries="2">
+        <command>run_post</command>
+        <dependency><taskdep task="&PREFIX;_fcst_mem#mem#"/></dependency>
+      </task>
+    </metatask>
+  </metatask>
+  <task name="everywhere" maxtries="1">
+    <command>everywhere</command>
+  </task>
+</workflow>
+"""
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests"""
+
+    def test_rocoto_cycles(self):
+        """ Test that the cycles of a cycledef are listed, and that the
+        crontab-like form is refused"""
+        self.assertEqual(
+            rocoto_cycles("201906151800 201906161200 06:00:00"),
+            ["201906151800", "201906160000", "201906160600", "201906161200"],
+        )
+        self.assertEqual(rocoto_cycles("202001010000 202001010100 30:00"),
+                         ["202001010000", "202001010030", "202001010100"])
+        with self.assertRaises(ValueError):
+            rocoto_cycles("00 */6 15-16 06 2019 *")
+
+    def test_rocoto_tasks(self):
+        """ Test that the metatasks and cycledef groups of a Rocoto XML
+        expand to the jobs Rocoto would run"""
+        forecast = ["201906151800", "201906160000", "201906160600", "201906161200"]
+        long_forecast = ["201906151800", "201906161800"]
+        expected = {"make_grid_201906151800"}
+        for mem in ["001", "002"]:
+            expected.update(f"run_fcst_mem{mem}_{cycle}"
+                            for cycle in set(forecast + long_forecast))
+            for fhr, cycles in [("000", forecast), ("001", forecast), ("002", long_forecast)]:
+                expected.update(f"run_post_mem{mem}_f{fhr}_{cycle}" for cycle in cycles)
+        # A task without cycledefs runs at every cycle
+        expected.update(f"everywhere_{cycle}" for cycle in set(forecast + long_forecast))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rocoto_xml = os.path.join(tmp_dir, "FV3LAM_wflow.xml")
+            with open(rocoto_xml, "w", encoding="utf-8") as xml_file:
+                xml_file.write(ROCOTO_XML)
+            self.assertEqual(rocoto_tasks(rocoto_xml), expected)
+            self.assertEqual(len(expected), 36)
+
+            # The file is expanded again once it is modified
+            with open(rocoto_xml, "w", encoding="utf-8") as xml_file:
+                xml_file.write(ROCOTO_XML.replace(">001 002<", ">001<"))
+            os.utime(rocoto_xml, ns=(0, 0))
+            self.assertEqual(
+                rocoto_tasks(rocoto_xml),
+                {job for job in expected if "mem002" not in job},
+            )
+
+    def test_rocoto_jobs_reader(self):
+        """ Test that the reader follows the jobs that Rocoto updates in
+        place, removes, and adds again under a rowid that was used"""
+
+        def add_job(taskname, cycle, state):
+            connection.execute(
+                "INSERT INTO jobs (taskname,cycle,cores,state,duration) VALUES (?,?,4,?,60.0)",
+                (taskname, cycle, state))
+            connection.commit()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rocoto_db = os.path.join(tmp_dir, "FV3LAM_wflow.db")
+            with closing(sqlite3.connect(rocoto_db)) as connection, \
+                    closing(RocotoJobsReader(rocoto_db)) as reader:
+                connection.execute(ROCOTO_JOBS)
+                # 2019-06-15 18:00 UTC
+                add_job("make_grid", 1560621600, "SUCCEEDED")
+                add_job("make_orog", 1560621600, "RUNNING")
+                expt = {}
+                self.assertEqual(reader.read(expt), 2)
+                self.assertEqual(expt["make_orog_201906151800"]["status"], "RUNNING")
+
+                # A job that is updated in place is read again, alone
+                connection.execute("UPDATE jobs SET state = 'SUCCEEDED' WHERE rowid = 2")
+                connection.commit()
+                self.assertEqual(reader.read(expt), 1)
+                self.assertEqual(expt["make_orog_201906151800"]["status"], "SUCCEEDED")
+                self.assertEqual(reader.read(expt), 0)
+
+                # The last job is removed and its rowid is used by another
+                # one, so the whole table is read again
+                connection.execute("DELETE FROM jobs WHERE rowid = 2")
+                add_job("make_sfc_climo", 1560621600, "QUEUED")
+                self.assertEqual(reader.read(expt), 2)
+                self.assertEqual(expt["make_sfc_climo_201906151800"]["status"], "QUEUED")
+
+                # The last job succeeds, then is rewound and queued again
+                # under the same rowid
+                connection.execute("UPDATE jobs SET state = 'SUCCEEDED' WHERE rowid = 2")
+                connection.commit()
+                self.assertEqual(reader.read(expt), 1)
+                connection.execute("DELETE FROM jobs WHERE rowid = 2")
+                add_job("make_sfc_climo", 1560621600, "QUEUED")
+                reader.read(expt)
+                self.assertEqual(expt["make_sfc_climo_201906151800"]["status"], "QUEUED")
+
+    def test_monitor_store(self):
+        """ Test that the store writes only what changed, and that what
+        it loads is what was saved, after tasks are removed too"""
+        expts_dict = {
+            "expt1": {
+                "expt_dir": "/expt/expt1",
+                "status": "RUNNING",
+                "make_grid_201906151800": {"status": "SUCCEEDED", "cores": 1, "walltime": 60.0},
+                "make_orog_201906151800": {"status": "RUNNING", "cores": 4, "walltime": 0.0},
+            },
+            "expt2": {"expt_dir": "/expt/expt2", "status": "CREATED"},
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, "WE2E_tests.db")
+            with closing(MonitorStore(db_file)) as store:
+                self.assertEqual(store.save(expts_dict), 4)
+                self.assertEqual(store.save(expts_dict), 0)
+
+                # A task is rewound, so it is no longer in the experiment
+                del expts_dict["expt1"]["make_orog_201906151800"]
+                expts_dict["expt1"]["make_grid_201906151800"]["status"] = "QUEUED"
+                self.assertEqual(store.save(expts_dict, names=["expt1"]), 2)
+                self.assertEqual(store.load(), expts_dict)
+                self.assertEqual(store.save(expts_dict), 0)
+
+            # What was saved is there when the database is opened again
+            with closing(MonitorStore(db_file)) as store:
+                self.assertEqual(store.load(), expts_dict)
+                self.assertEqual(list(store.load()), ["expt1", "expt2"])
+
+    def test_rocotorun_runner_long_lines(self):
+        """ Test that a line of rocotorun output longer than the runner
+        reads is dropped, and the rest of the output is still logged"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rocotorun = os.path.join(tmp_dir, "rocotorun")
+            with open(rocotorun, "w", encoding="utf-8") as script:
+                script.write("#!/bin/sh\nprintf '%0100000d\\n' 0\necho done\n")
+            os.chmod(rocotorun, 0o755)
+            with mock.patch.dict(os.environ, {"PATH": f"{tmp_dir}:{os.environ['PATH']}"}), \
+                    closing(RocotorunRunner(1, debug=True)) as runner, \
+                    self.assertLogs(level="DEBUG") as logs:
+                runner.LINE_LIMIT = 1024
+                signatures = runner.advance({"expt": {"expt_dir": tmp_dir}}, {})
+        self.assertEqual(list(signatures), ["expt"])
+        self.assertIn("DEBUG:root:expt: [line longer than 1024 bytes dropped]", logs.output)
+        self.assertIn("DEBUG:root:expt: done", logs.output)
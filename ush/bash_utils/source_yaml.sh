@@ -19,10 +19,18 @@ Usage:
   section:   optional subsection of yaml
 "
   fi
-  local section
+  local section sh_file
   yaml_file=$1
   section=$2
 
+  # Source the shell version of the section written next to the YAML file
+  # by create_var_defns_sh_files.py, unless the YAML file has changed since.
+  sh_file="${yaml_file%.*}_sh/${section}.sh"
+  if [ -n "${section}" ] && [ "${sh_file}" -nt "${yaml_file}" ] ; then
+    source "${sh_file}"
+    return
+  fi
+
   while read -r line ; do
 
 
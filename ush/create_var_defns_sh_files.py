@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Pre-renders each section of the experiment's ``var_defns.yaml`` as a shell file that
+``source_yaml`` can source directly, instead of starting ``uw config realize`` for the section in
+every job.
+"""
+import argparse
+import logging
+import os
+import re
+import shlex
+import sys
+
+from python_utils import load_config_file
+
+# Strings that uw config realize would render as Jinja2 templates
+TEMPLATE_MARKERS = ("{{", "{%", "{#")
+
+
+def var_defns_sh_dir(var_defns_fp):
+    """Returns the directory holding the shell file for each section of a var_defns file
+
+    Args:
+        var_defns_fp (str): Path to the var_defns YAML file
+    Returns:
+        The path of the ``<name>_sh`` directory next to it
+    """
+    return f"{os.path.splitext(var_defns_fp)[0]}_sh"
+
+
+def section_to_sh_lines(section):
+    """Returns the lines that ``source_yaml`` sources for a section of var_defns
+
+    Each ``KEY=value`` line is the one ``uw config realize --output-format sh`` writes for the key,
+    with the same edits ``source_yaml`` makes to it before sourcing it: quoted lists become bash
+    arrays, and commas, double quotes and the first ``None`` are removed.
+
+    Args:
+        section (dict): A section of the var_defns file
+    Returns:
+        A list of lines, or None if the section has values whose lines cannot be reproduced here
+        (nested sections, templates that uw would render, values spanning several lines, or lines
+        that do not parse on their own), in which case ``source_yaml`` keeps using uw
+    """
+    if not isinstance(section, dict):
+        return None
+    lines = []
+    for key, value in section.items():
+        if isinstance(value, dict):
+            return None
+        value = str(value)
+        if "\n" in value or any(marker in value for marker in TEMPLATE_MARKERS):
+            return None
+        line = f"{key}={shlex.quote(value)}"
+        line = re.sub(r"='\[(.*)\]'", r"=(\1)", line, count=1)
+        line = line.replace(",", "").replace('"', "").replace("None", "", 1)
+        try:
+            # source_yaml sources each line on its own, so a line left with unbalanced quotes
+            # only loses that variable there, but would break the rest of a sourced file
+            shlex.split(line)
+        except ValueError:
+            return None
+        lines.append(line)
+    return lines
+
+
+def create_var_defns_sh_files(var_defns_fp):
+    """Writes a shell file for each section of var_defns that ``source_yaml`` can source directly
+
+    The files are written to the directory given by ``var_defns_sh_dir``, after the YAML file, so
+    they are newer than it until the YAML file is changed again; ``source_yaml`` goes back to uw
+    for a section when its file is missing or older than the YAML file.
+
+    Args:
+        var_defns_fp (str): Path to the var_defns YAML file
+    Returns:
+        A list of the sections written
+    """
+    cfg = load_config_file(var_defns_fp)
+    sh_dir = var_defns_sh_dir(var_defns_fp)
+    os.makedirs(sh_dir, exist_ok=True)
+
+    written = []
+    for name, section in cfg.items():
+        lines = section_to_sh_lines(section)
+        sh_fp = os.path.join(sh_dir, f"{name}.sh")
+        if lines is None:
+            logging.debug(f"Section {name} of {var_defns_fp} will be sourced with uw")
+            if os.path.exists(sh_fp):
+                os.remove(sh_fp)
+            continue
+        tmp_fp = f"{sh_fp}.tmp"
+        with open(tmp_fp, "w", encoding="utf-8") as sh_file:
+            sh_file.write(f"# Section {name} of {var_defns_fp}; generated by {__file__}\n")
+            sh_file.writelines(f"{line}\n" for line in lines)
+        os.replace(tmp_fp, sh_fp)
+        written.append(name)
+
+    for sh_fn in os.listdir(sh_dir):
+        if sh_fn.endswith(".sh") and sh_fn[:-3] not in cfg:
+            os.remove(os.path.join(sh_dir, sh_fn))
+    return written
+
+
+def _parse_args(argv):
+    """Parses command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Pre-render the sections of var_defns.yaml as shell files."
+    )
+
+    parser.add_argument(
+        "-p",
+        "--path-to-defns",
+        dest="path_to_defns",
+        required=True,
+        help="Path to var_defns file.",
+    )
+
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    create_var_defns_sh_files(args.path_to_defns)
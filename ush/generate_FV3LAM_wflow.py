@@ -5,12 +5,18 @@ User interface to create an experiment directory consistent with the user-define
 file.
 """
 
-# pylint: disable=invalid-name
+# pylint: disable=invalid-name,too-many-lines
 
 import argparse
+import glob
+import hashlib
+import json
 import logging
 import os
 import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from stat import S_IXUSR
 from string import Template
 from textwrap import dedent
@@ -31,26 +37,112 @@ from python_utils import (
     cfg_to_yaml_str,
     find_pattern_in_str,
     flatten_dict,
+    load_config_file,
 )
 
 from setup import setup
-from set_fv3nml_sfc_climo_filenames import set_fv3nml_sfc_climo_filenames
+from set_fv3nml_sfc_climo_filenames import (
+    set_fv3nml_sfc_climo_filenames,
+    NEEDED_VARS as SFC_CLIMO_VARS,
+)
 from get_crontab_contents import add_crontab_line
 from check_python_version import check_python_version
 
+# Digests of the inputs of each generated file, kept in the experiment directory
+ARTIFACT_INPUTS_FN = "generate_FV3LAM_wflow_inputs.yaml"
+
+
+class ArtifactInputs:
+    """
+    Tracks the inputs that each artifact of an experiment (the Rocoto XML, the namelists, the
+    fixed files, ...) is generated from, so that an experiment can be regenerated incrementally.
+
+    A digest of each artifact's inputs is kept in ``ARTIFACT_INPUTS_FN`` in the experiment
+    directory. In incremental mode, an artifact whose digest matches the one recorded when it
+    was last generated, and whose outputs all exist, is skipped.
+    """
+
+    def __init__(self, exptdir, incremental=False):
+        self.path = os.path.join(exptdir, ARTIFACT_INPUTS_FN)
+        self.incremental = incremental
+        self.recorded = {}
+        if incremental and os.path.exists(self.path):
+            self.recorded = load_config_file(self.path) or {}
+        self.digests = {}
+        self.generated = []
+        self.skipped = []
+
+    def changed(self, name, outputs, values=None, files=(), stat_files=()):
+        """
+        Returns whether an artifact needs to be generated, and notes the digest of its inputs
+
+        Args:
+            name       (str) : The name of the artifact
+            outputs    (list): The paths it writes
+            values           : The settings it is generated from; anything JSON can serialize
+            files      (list): Files it reads, compared by content
+            stat_files (list): Large files it reads, compared by size and modification time
+        Returns:
+            False if the artifact is unchanged since it was last generated, True otherwise
+        """
+        digest = hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode())
+        for path in files:
+            digest.update(path.encode())
+            try:
+                with open(path, "rb") as input_file:
+                    digest.update(hashlib.sha256(input_file.read()).digest())
+            except OSError:
+                digest.update(b"missing")
+        for path in stat_files:
+            try:
+                stat = os.stat(path)
+                digest.update(f"{path} {stat.st_size} {stat.st_mtime_ns}".encode())
+            except OSError:
+                digest.update(f"{path} missing".encode())
+        self.digests[name] = digest.hexdigest()
+
+        if (
+            self.incremental
+            and self.recorded.get(name) == self.digests[name]
+            and all(os.path.lexists(path) for path in outputs)
+        ):
+            self.skipped.append(name)
+            return False
+        self.generated.append(name)
+        return True
+
+    def save(self):
+        """Records the digests of the inputs of the artifacts generated or skipped"""
+        with open(self.path, "w", encoding="utf-8") as inputs_file:
+            inputs_file.write(cfg_to_yaml_str(self.digests))
+
+    def report(self):
+        """Returns a summary of the artifacts generated and skipped"""
+        return dedent(
+            f"""
+            Artifacts generated: {", ".join(self.generated) or "none"}
+            Artifacts skipped as unchanged: {", ".join(self.skipped) or "none"}"""
+        )
+
+
 # pylint: disable=too-many-locals,too-many-branches, too-many-statements
 def generate_FV3LAM_wflow(
         ushdir,
         logfile: str = "log.generate_FV3LAM_wflow",
-        debug: bool = False) -> str:
+        debug: bool = False,
+        user_config_fn: str = "config.yaml",
+        incremental: bool = False) -> str:
     """
     Sets up a forecast experiment and creates a workflow (according to the parameters specified 
     in the configuration file)
 
     Args:
-        ushdir  (str) : The full path of the ``ush/`` directory where this script is located
-        logfile (str) : The name of the file where logging is written
-        debug   (bool): Enable extra output for debugging
+        ushdir         (str) : The full path of the ``ush/`` directory where this script is located
+        logfile        (str) : The name of the file where logging is written
+        debug          (bool): Enable extra output for debugging
+        user_config_fn (str) : The user configuration file, relative to ``ushdir`` or absolute
+        incremental    (bool): Regenerate an existing experiment, rewriting only the artifacts
+                               whose inputs have changed (see ``ArtifactInputs``)
     Returns:
         EXPTDIR (str) : The full path of the directory where this experiment has been generated
     """
@@ -71,7 +163,9 @@ def generate_FV3LAM_wflow(
 
     # The setup function reads the user configuration file and fills in
     # non-user-specified values from config_defaults.yaml
-    expt_config = setup(ushdir,debug=debug)
+    expt_config = setup(ushdir, user_config_fn=user_config_fn, debug=debug,
+                        incremental=incremental)
+    artifacts = ArtifactInputs(expt_config["workflow"]["EXPTDIR"], incremental)
 
     #
     # -----------------------------------------------------------------------
@@ -98,12 +192,14 @@ def generate_FV3LAM_wflow(
     #
     # -----------------------------------------------------------------------
     #
-    if expt_config["platform"]["WORKFLOW_MANAGER"] == "rocoto":
-
-        template_xml_fp = os.path.join(
-            expt_config["user"]["PARMdir"],
-            wflow_xml_fn,
-        )
+    template_xml_fp = os.path.join(
+        expt_config["user"]["PARMdir"],
+        wflow_xml_fn,
+    )
+    rocoto_yaml_fp = expt_config["workflow"]["ROCOTO_YAML_FP"]
+    if expt_config["platform"]["WORKFLOW_MANAGER"] == "rocoto" and artifacts.changed(
+        "rocoto_xml", [wflow_xml_fp], files=[template_xml_fp, rocoto_yaml_fp]
+    ):
 
         log_info(
             f"""
@@ -114,7 +210,6 @@ def generate_FV3LAM_wflow(
         #
         # Call the python script to generate the experiment's XML file
         #
-        rocoto_yaml_fp = expt_config["workflow"]["ROCOTO_YAML_FP"]
         render(
             input_file = template_xml_fp,
             output_file = wflow_xml_fp,
@@ -182,7 +277,15 @@ def generate_FV3LAM_wflow(
     #
     # Copy or symlink fix files
     #
-    if SYMLINK_FIX_FILES:
+    fixam_files = [os.path.join(FIXgsm, fn) for fn in FIXgsm_FILES_TO_COPY_TO_FIXam]
+    if not artifacts.changed(
+        "fix_am",
+        [FIXam],
+        values=[SYMLINK_FIX_FILES, FIXgsm, FIXam],
+        stat_files=[] if SYMLINK_FIX_FILES else fixam_files,
+    ):
+        log_info("Fixed files in FIXam are up to date", verbose=debug)
+    elif SYMLINK_FIX_FILES:
         log_info(
             f"""
             Symlinking fixed files from system directory (FIXgsm) to a subdirectory (FIXam):
@@ -217,7 +320,16 @@ def generate_FV3LAM_wflow(
     #
     # -----------------------------------------------------------------------
     #
-    if USE_MERRA_CLIMO:
+    merra_files = sorted(
+        glob.glob(os.path.join(FIXaer, "merra2.aerclim*.nc"))
+        + glob.glob(os.path.join(FIXlut, "optics*.dat"))
+    ) if USE_MERRA_CLIMO else []
+    if USE_MERRA_CLIMO and artifacts.changed(
+        "fix_clim",
+        [FIXclim],
+        values=[SYMLINK_FIX_FILES, FIXaer, FIXlut, FIXclim],
+        stat_files=merra_files,
+    ):
         log_info(
             f"""
             Copying MERRA2 aerosol climatology data files from system directory
@@ -244,51 +356,60 @@ def generate_FV3LAM_wflow(
     #
     # -----------------------------------------------------------------------
     #
-    log_info(
-        """
-        Copying templates of various input files to the experiment directory...""",
-        verbose=debug,
-    )
+    templates = {
+        DATA_TABLE_TMPL_FP: DATA_TABLE_FP,
+        FIELD_TABLE_TMPL_FP: FIELD_TABLE_FP,
+        CCPP_PHYS_SUITE_IN_CCPP_FP: CCPP_PHYS_SUITE_FP,
+        FIELD_DICT_IN_UWM_FP: FIELD_DICT_FP,
+    }
+    if artifacts.changed(
+        "input_file_templates", list(templates.values()), values=templates, files=list(templates)
+    ):
+        log_info(
+            """
+            Copying templates of various input files to the experiment directory...""",
+            verbose=debug,
+        )
 
-    log_info(
-        """
-        Copying the template data table file to the experiment directory...""",
-        verbose=debug,
-    )
-    cp_vrfy(DATA_TABLE_TMPL_FP, DATA_TABLE_FP)
+        log_info(
+            """
+            Copying the template data table file to the experiment directory...""",
+            verbose=debug,
+        )
+        cp_vrfy(DATA_TABLE_TMPL_FP, DATA_TABLE_FP)
 
-    log_info(
-        """
-        Copying the template field table file to the experiment directory...""",
-        verbose=debug,
-    )
-    cp_vrfy(FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP)
+        log_info(
+            """
+            Copying the template field table file to the experiment directory...""",
+            verbose=debug,
+        )
+        cp_vrfy(FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP)
 
-    #
-    # Copy the CCPP physics suite definition file from its location in the
-    # clone of the FV3 code repository to the experiment directory (EXPT-
-    # DIR).
-    #
-    log_info(
-        """
-        Copying the CCPP physics suite definition XML file from its location in
-        the forecast model directory structure to the experiment directory...""",
-        verbose=debug,
-    )
-    cp_vrfy(CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP)
-    #
-    # Copy the field dictionary file from its location in the
-    # clone of the FV3 code repository to the experiment directory (EXPT-
-    # DIR).
-    #
-    log_info(
-        """
-        Copying the field dictionary file from its location in the
-        forecast model directory structure to the experiment
-        directory...""",
-        verbose=debug,
-    )
-    cp_vrfy(FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP)
+        #
+        # Copy the CCPP physics suite definition file from its location in the
+        # clone of the FV3 code repository to the experiment directory (EXPT-
+        # DIR).
+        #
+        log_info(
+            """
+            Copying the CCPP physics suite definition XML file from its location in
+            the forecast model directory structure to the experiment directory...""",
+            verbose=debug,
+        )
+        cp_vrfy(CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP)
+        #
+        # Copy the field dictionary file from its location in the
+        # clone of the FV3 code repository to the experiment directory (EXPT-
+        # DIR).
+        #
+        log_info(
+            """
+            Copying the field dictionary file from its location in the
+            forecast model directory structure to the experiment
+            directory...""",
+            verbose=debug,
+        )
+        cp_vrfy(FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP)
     #
     # -----------------------------------------------------------------------
     #
@@ -511,33 +632,47 @@ def generate_FV3LAM_wflow(
     # -----------------------------------------------------------------------
     #
 
-    physics_cfg = get_yaml_config(FV3_NML_YAML_CONFIG_FP)
-    base_namelist = get_nml_config(FV3_NML_BASE_SUITE_FP)
-    base_namelist.update_values(physics_cfg[CCPP_PHYS_SUITE])
-    base_namelist.update_values(settings)
-    for sect, values in base_namelist.copy().items():
-        if not values:
-            del base_namelist[sect]
-            continue
-        for k, v in values.copy().items():
-            if v is None:
-                del base_namelist[sect][k]
-    base_namelist.dump(FV3_NML_FP)
-    #
-    # If not running the TN_MAKE_GRID task (which implies the workflow will
-    # use pregenerated grid files), set the namelist variables specifying
-    # the paths to surface climatology files.  These files are located in
-    # (or have symlinks that point to them) in the FIXlam directory.
-    #
-    # Note that if running the TN_MAKE_GRID task, this action usually cannot
-    # be performed here but must be performed in that task because the names
-    # of the surface climatology files depend on the CRES parameter (which is
-    # the C-resolution of the grid), and this parameter is in most workflow
-    # configurations is not known until the grid is created.
-    #
-    if not expt_config['rocoto']['tasks'].get('task_make_grid'):
+    # The surface climatology file names are set below when not running the
+    # TN_MAKE_GRID task; see there.
+    set_sfc_climo = not expt_config['rocoto']['tasks'].get('task_make_grid')
+    flat_config = flatten_dict(expt_config)
+    nml_values = {
+        "suite": CCPP_PHYS_SUITE,
+        "settings": settings,
+        "sfc_climo": {var: flat_config.get(var) for var in SFC_CLIMO_VARS}
+        if set_sfc_climo else None,
+    }
+    nml_files = [FV3_NML_YAML_CONFIG_FP, FV3_NML_BASE_SUITE_FP]
+    if set_sfc_climo:
+        nml_files.append(os.path.join(PARMdir, "fixed_files_mapping.yaml"))
+    if artifacts.changed("fv3_nml", [FV3_NML_FP], values=nml_values, files=nml_files):
+        physics_cfg = get_yaml_config(FV3_NML_YAML_CONFIG_FP)
+        base_namelist = get_nml_config(FV3_NML_BASE_SUITE_FP)
+        base_namelist.update_values(physics_cfg[CCPP_PHYS_SUITE])
+        base_namelist.update_values(settings)
+        for sect, values in base_namelist.copy().items():
+            if not values:
+                del base_namelist[sect]
+                continue
+            for k, v in values.copy().items():
+                if v is None:
+                    del base_namelist[sect][k]
+        base_namelist.dump(FV3_NML_FP)
+        #
+        # If not running the TN_MAKE_GRID task (which implies the workflow will
+        # use pregenerated grid files), set the namelist variables specifying
+        # the paths to surface climatology files.  These files are located in
+        # (or have symlinks that point to them) in the FIXlam directory.
+        #
+        # Note that if running the TN_MAKE_GRID task, this action usually cannot
+        # be performed here but must be performed in that task because the names
+        # of the surface climatology files depend on the CRES parameter (which is
+        # the C-resolution of the grid), and this parameter is in most workflow
+        # configurations is not known until the grid is created.
+        #
+        if set_sfc_climo:
 
-        set_fv3nml_sfc_climo_filenames(flatten_dict(expt_config), debug)
+            set_fv3nml_sfc_climo_filenames(flat_config, debug)
 
     #
     # -----------------------------------------------------------------------
@@ -650,7 +785,9 @@ def generate_FV3LAM_wflow(
     #
     #-----------------------------------------------------------------------
     #
-    if any((DO_SPP, DO_SPPT, DO_SHUM, DO_SKEB, DO_LSM_SPP)):
+    if any((DO_SPP, DO_SPPT, DO_SHUM, DO_SKEB, DO_LSM_SPP)) and artifacts.changed(
+        "fv3_nml_stoch", [FV3_NML_STOCH_FP], values=settings, files=[FV3_NML_FP]
+    ):
         realize(
             input_config=FV3_NML_FP,
             input_format="nml",
@@ -668,7 +805,7 @@ def generate_FV3LAM_wflow(
     #
     # -----------------------------------------------------------------------
     #
-    cp_vrfy(os.path.join(ushdir, EXPT_CONFIG_FN), EXPTDIR)
+    cp_vrfy(os.path.join(ushdir, user_config_fn), os.path.join(EXPTDIR, EXPT_CONFIG_FN))
 
     #
     # -----------------------------------------------------------------------
@@ -718,6 +855,11 @@ def generate_FV3LAM_wflow(
         )
         # pylint: enable=line-too-long
 
+    # Record what each artifact was generated from, for the next
+    # incremental regeneration
+    artifacts.save()
+    log_info(artifacts.report(), verbose=debug or incremental)
+
     # If we got to this point everything was successful: move the log
     # file to the experiment directory.
     mv_vrfy(logfile, EXPTDIR)
@@ -725,6 +867,135 @@ def generate_FV3LAM_wflow(
     return EXPTDIR
 
 
+def load_shared_configs(ushdir: str, machine: str = None) -> None:
+    """
+    Loads the config files that every experiment reads, so that experiments generated afterwards
+    in this process, or in worker processes forked from it, get them from the parsed-config cache
+
+    Args:
+        ushdir  (str): The full path of the ``ush/`` directory where this script is located
+        machine (str): The machine whose machine file is also loaded
+    Returns:
+        None
+    """
+    parmdir = os.path.join(ushdir, os.pardir, "parm")
+    config_files = [
+        os.path.join(ushdir, fn)
+        for fn in (
+            "config_defaults.yaml",
+            "constants.yaml",
+            "predef_grid_params.yaml",
+            "valid_param_vals.yaml",
+        )
+    ]
+    config_files.append(os.path.join(parmdir, "fixed_files_mapping.yaml"))
+    config_files.extend(sorted(glob.glob(os.path.join(parmdir, "wflow", "*.yaml"))))
+    if machine:
+        config_files.append(os.path.join(ushdir, "machine", f"{machine.lower()}.yaml"))
+    for config_file in config_files:
+        load_config_file(config_file)
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def _generate_one(ushdir, name, user_config_fn, debug, console_level, cwd):
+    """
+    Generates one experiment of a batch, logging to the file ``log.generate_FV3LAM_wflow`` next to
+    its config file and to the screen at console_level with lines prefixed by its name. The root
+    logger's handlers and the working directory are restored afterwards, so experiments generated
+    one after another in the same process do not share either.
+
+    Returns:
+        A dict with the experiment's ``name``, ``expt_dir`` (None if generation failed), ``error``
+        (the traceback of the failure, or None) and ``seconds`` taken
+    """
+    root = logging.getLogger()
+    saved_handlers = root.handlers[:]
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter(f"{name}: %(levelname)-8s %(message)s"))
+    root.handlers = [console]
+
+    logfile = os.path.join(os.path.dirname(user_config_fn), "log.generate_FV3LAM_wflow")
+    result = {"name": name, "expt_dir": None, "error": None}
+    start = time.perf_counter()
+    try:
+        os.chdir(cwd)
+        result["expt_dir"] = generate_FV3LAM_wflow(
+            ushdir, logfile=logfile, debug=debug, user_config_fn=user_config_fn
+        )
+    except Exception:  # pylint: disable=broad-except
+        logging.exception(f"Experiment generation failed; see {logfile}")
+        result["error"] = traceback.format_exc()
+    finally:
+        for handler in root.handlers:
+            handler.close()
+        root.handlers = saved_handlers
+        os.chdir(cwd)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def generate_FV3LAM_wflow_batch(
+        ushdir: str,
+        configs: dict,
+        procs: int = 1,
+        machine: str = None,
+        debug: bool = False,
+        quiet: bool = False) -> list:
+    """
+    Generates several experiments, loading the config files they all read only once. With
+    ``procs > 1`` the experiments are generated in a pool of worker processes.
+
+    Each experiment is given its own user config file, and its log file,
+    ``log.generate_FV3LAM_wflow``, is written next to it and moved to the experiment directory
+    once it has been generated; keep each config file in its own directory. A failure is
+    recorded in the experiment's result instead of stopping the others.
+
+    Args:
+        ushdir  (str) : The full path of the ``ush/`` directory where this script is located
+        configs (dict): The full path of each experiment's user config file, by experiment name
+        procs   (int) : The number of experiments to generate at once
+        machine (str) : The machine, whose machine file is loaded with the shared configs
+        debug   (bool): Enable extra output for debugging
+        quiet   (bool): Only print warnings and errors to the screen
+    Returns:
+        A list of dicts, in the order of ``configs``, each with the experiment's ``name``,
+        ``expt_dir`` (None if generation failed), ``error`` (the traceback of the failure, or None)
+        and the ``seconds`` taken to generate it
+    """
+
+    if debug:
+        console_level = logging.DEBUG
+    elif quiet or procs > 1:
+        console_level = logging.WARNING
+    else:
+        console_level = logging.INFO
+    cwd = os.getcwd()
+
+    load_shared_configs(ushdir, machine)
+    jobs = [
+        (ushdir, name, config_fn, debug, console_level, cwd)
+        for name, config_fn in configs.items()
+    ]
+    if procs <= 1 or len(jobs) <= 1:
+        return [_generate_one(*job) for job in jobs]
+
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=min(procs, len(jobs)),
+        initializer=load_shared_configs,
+        initargs=(ushdir, machine),
+    ) as executor:
+        futures = {executor.submit(_generate_one, *job): job[1] for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            status = "generated" if result["error"] is None else "FAILED"
+            logging.info(f"{result['name']}: {status} in {result['seconds']:.1f} s")
+    return [results[name] for name in configs]
+
+
 def setup_logging(logfile: str = "log.generate_FV3LAM_wflow", debug: bool = False) -> None:
     """
     Sets up logging, printing high-priority (INFO and higher) messages to screen and printing all
@@ -772,6 +1043,9 @@ if __name__ == "__main__":
 
     parser.add_argument('-d', '--debug', action='store_true',
                         help='Script will be run in debug mode with more verbose output')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Regenerate an existing experiment, rewriting only the files whose '\
+                             'inputs have changed')
     pargs = parser.parse_args()
 
     USHdir = os.path.dirname(os.path.abspath(__file__))
@@ -780,7 +1054,8 @@ if __name__ == "__main__":
     # Call the generate_FV3LAM_wflow function defined above to generate the
     # experiment/workflow.
     try:
-        expt_dir = generate_FV3LAM_wflow(USHdir, wflow_logfile, pargs.debug)
+        expt_dir = generate_FV3LAM_wflow(USHdir, wflow_logfile, pargs.debug,
+                                         incremental=pargs.incremental)
     except: # pylint: disable=bare-except
         logging.exception(
             dedent(
@@ -1,51 +1,151 @@
-from .misc import uppercase, lowercase, find_pattern_in_str, find_pattern_in_file
+"""
+Utilities shared by the scripts in ``ush``.
+
+The functions are imported from their modules the first time they are used, so a script only
+pays for importing the modules it uses, and their dependencies (e.g., ``yaml`` and ``jinja2`` for
+the config parser).
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+# Importing a module binds its name in the package, so the functions with the same name as their
+# module are imported up front; these modules are small
 from .check_for_preexist_dir_file import check_for_preexist_dir_file
 from .check_var_valid_value import check_var_valid_value
 from .create_symlink_to_file import create_symlink_to_file
 from .define_macos_utilities import define_macos_utilities
-from .environment import (
-    str_to_date,
-    date_to_str,
-    str_to_type,
-    type_to_str,
-    list_to_str,
-    str_to_list,
-    set_env_var,
-    get_env_var,
-    import_vars,
-    export_vars,
-)
-from .filesys_cmds_vrfy import (
-    cmd_vrfy,
-    cp_vrfy,
-    mv_vrfy,
-    rm_vrfy,
-    ln_vrfy,
-    mkdir_vrfy,
-    cd_vrfy,
-)
 from .print_input_args import print_input_args
-from .print_msg import print_info_msg, print_err_msg_exit, log_info
 from .run_command import run_command
-from .xml_parser import load_xml_file, has_tag_with_value
-from .config_parser import (
-    load_json_config,
-    cfg_to_json_str,
-    load_ini_config,
-    cfg_to_ini_str,
-    get_ini_value,
-    load_config_file,
-    load_shell_config,
-    cfg_to_shell_str,
-    load_xml_config,
-    cfg_to_xml_str,
-    flatten_dict,
-    structure_dict,
-    check_structure_dict,
-    update_dict,
-    cfg_main,
-    load_config_file,
-    load_yaml_config,
-    cfg_to_yaml_str,
-    extend_yaml,
-)
+
+# The functions of the other modules
+_EXPORTS = {
+    "misc": ("uppercase", "lowercase", "find_pattern_in_str", "find_pattern_in_file"),
+    "environment": (
+        "str_to_date",
+        "date_to_str",
+        "str_to_type",
+        "type_to_str",
+        "list_to_str",
+        "str_to_list",
+        "set_env_var",
+        "get_env_var",
+        "import_vars",
+        "export_vars",
+    ),
+    "filesys_cmds_vrfy": (
+        "cmd_vrfy",
+        "cp_vrfy",
+        "mv_vrfy",
+        "rm_vrfy",
+        "ln_vrfy",
+        "mkdir_vrfy",
+        "cd_vrfy",
+    ),
+    "print_msg": ("print_info_msg", "print_err_msg_exit", "log_info"),
+    "xml_parser": ("load_xml_file", "has_tag_with_value"),
+    "config_parser": (
+        "load_json_config",
+        "cfg_to_json_str",
+        "cfg_to_json_stream",
+        "load_ini_config",
+        "cfg_to_ini_str",
+        "cfg_to_ini_stream",
+        "get_ini_value",
+        "load_config_file",
+        "load_shell_config",
+        "cfg_to_shell_str",
+        "cfg_to_shell_stream",
+        "load_xml_config",
+        "cfg_to_xml_str",
+        "cfg_to_xml_stream",
+        "flatten_dict",
+        "structure_dict",
+        "check_structure_dict",
+        "update_dict",
+        "cfg_main",
+        "load_yaml_config",
+        "cfg_to_yaml_str",
+        "cfg_to_yaml_stream",
+        "extend_yaml",
+    ),
+    "config_schema": ("ConfigSchema", "load_config_schema"),
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+if TYPE_CHECKING:
+    # The same names, for static analysis (e.g., pylint), which cannot see through __getattr__
+    from .misc import uppercase, lowercase, find_pattern_in_str, find_pattern_in_file
+    from .environment import (
+        str_to_date,
+        date_to_str,
+        str_to_type,
+        type_to_str,
+        list_to_str,
+        str_to_list,
+        set_env_var,
+        get_env_var,
+        import_vars,
+        export_vars,
+    )
+    from .filesys_cmds_vrfy import (
+        cmd_vrfy,
+        cp_vrfy,
+        mv_vrfy,
+        rm_vrfy,
+        ln_vrfy,
+        mkdir_vrfy,
+        cd_vrfy,
+    )
+    from .print_msg import print_info_msg, print_err_msg_exit, log_info
+    from .xml_parser import load_xml_file, has_tag_with_value
+    from .config_parser import (
+        load_json_config,
+        cfg_to_json_str,
+        cfg_to_json_stream,
+        load_ini_config,
+        cfg_to_ini_str,
+        cfg_to_ini_stream,
+        get_ini_value,
+        load_config_file,
+        load_shell_config,
+        cfg_to_shell_str,
+        cfg_to_shell_stream,
+        load_xml_config,
+        cfg_to_xml_str,
+        cfg_to_xml_stream,
+        flatten_dict,
+        structure_dict,
+        check_structure_dict,
+        update_dict,
+        cfg_main,
+        load_yaml_config,
+        cfg_to_yaml_str,
+        cfg_to_yaml_stream,
+        extend_yaml,
+    )
+    from .config_schema import ConfigSchema, load_config_schema
+
+__all__ = [
+    "check_for_preexist_dir_file",
+    "check_var_valid_value",
+    "create_symlink_to_file",
+    "define_macos_utilities",
+    "print_input_args",
+    "run_command",
+    *_MODULES,
+]
+
+
+def __getattr__(name):
+    """Imports a function from its module when it is first used"""
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_MODULES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
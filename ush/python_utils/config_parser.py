@@ -18,15 +18,21 @@ returned by ``load_config`` to make queries.
 import argparse
 import configparser
 import datetime
+import functools
+import hashlib
+import io
 import json
 import os
 import pathlib
+import pickle
 import re
+import shlex
+import sys
+import tempfile
+from collections.abc import Mapping
 from textwrap import dedent
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 
-import jinja2
 #
 # Note: yaml may not be available in which case we suppress
 # the exception, so that we can have other functionality
@@ -43,19 +49,126 @@ from .run_command import run_command
 ##########
 # YAML
 ##########
+# Bump when a change to the loader would give different data for an unchanged file, so that
+# parsed configs cached by an older version are not used.
+CONFIG_CACHE_VERSION = 1
+
+# Parsed YAML configs, keyed on absolute path, as (stamp, pickled data)
+_parsed_configs = {}
+
+
+def _config_cache_dir():
+    """
+    Returns the directory in which parsed YAML configs are cached between processes, or None if
+    that cache is turned off. It is set by ``SRW_CONFIG_CACHE_DIR``; an empty value turns the
+    cache off. The default is ``srw_app/configs`` in the user's cache directory.
+    """
+
+    cache_dir = os.environ.get("SRW_CONFIG_CACHE_DIR")
+    if cache_dir is None:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        cache_dir = os.path.join(base, "srw_app", "configs")
+    return cache_dir or None
+
+
+def _cache_path(cache_dir, config_file):
+    """Returns the path of the cache entry for a config file."""
+
+    name = hashlib.sha256(config_file.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{name}.pickle")
+
+
+def _read_cached_config(config_file, stamp):
+    """
+    Returns the pickled data cached on disk for a config file, or None if there is none or it
+    was cached for another version of the file.
+    """
+
+    cache_dir = _config_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        with open(_cache_path(cache_dir, config_file), "rb") as f:
+            if pickle.load(f) != (config_file, stamp):
+                return None
+            return f.read()
+    except Exception:  # pylint: disable=broad-except
+        # A missing, unreadable or truncated entry is parsed again
+        return None
+
+
+def _write_cached_config(config_file, stamp, data):
+    """
+    Caches the pickled data for a config file on disk. The entry is written to a temporary file
+    and renamed, so concurrent readers never see part of it. Failures are ignored.
+    """
+
+    cache_dir = _config_cache_dir()
+    if cache_dir is None:
+        return
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((config_file, stamp), f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(data)
+            os.replace(tmp_path, _cache_path(cache_dir, config_file))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def clear_config_cache():
+    """
+    Forgets the YAML configs parsed in this process, so the next load of each one reads it from
+    the cache on disk, as another process would. The cache on disk is kept.
+    """
+    _parsed_configs.clear()
+
+
 def load_yaml_config(config_file):
     """
     Safe loads a YAML file
 
+    The parsed data is cached, in this process and on disk (see ``_config_cache_dir``), keyed on
+    the file's path, modification time and size, so a file that has not changed is only parsed
+    once. Every call returns a new copy, which the caller is free to modify. Files that use tags
+    whose value depends on when or where they are loaded (``!startstopfreq``, ``!nowtimestamp``)
+    are never cached.
+
     Args:
         config_file: Configuration file to parse
     Returns:
         cfg: A Python object containing the config file data
     """
 
-    with open(config_file, "r") as f:
-        cfg = yaml.safe_load(f)
+    config_file = os.path.abspath(config_file)
+    stat = os.stat(config_file)
+    stamp = (stat.st_mtime_ns, stat.st_size, CONFIG_CACHE_VERSION, yaml.__version__)
+
+    cached = _parsed_configs.get(config_file)
+    if cached is not None and cached[0] == stamp:
+        return pickle.loads(cached[1])
+
+    data = _read_cached_config(config_file, stamp)
+    if data is not None:
+        _parsed_configs[config_file] = (stamp, data)
+        return pickle.loads(data)
 
+    with open(config_file, "r") as f:
+        loader = _SafeLoader(f)
+        try:
+            cfg = loader.get_single_data()
+        finally:
+            loader.dispose()
+
+    if not getattr(loader, "uncacheable", False):
+        data = pickle.dumps(cfg, protocol=pickle.HIGHEST_PROTOCOL)
+        _parsed_configs[config_file] = (stamp, data)
+        _write_cached_config(config_file, stamp, data)
     return cfg
 
 
@@ -82,6 +195,10 @@ try:
 
     yaml.add_representer(str, _str_presenter)
 
+    # The libyaml emitter, when PyYAML was built with it, with the same representers as Dumper
+    _Dumper = getattr(yaml, "CDumper", yaml.Dumper)
+    _Dumper.add_representer(str, _str_presenter)
+
 except NameError:
     pass
 
@@ -95,6 +212,18 @@ def cfg_to_yaml_str(cfg):
         cfg, sort_keys=False, default_flow_style=False
     )
 
+
+def cfg_to_yaml_stream(cfg, stream):
+    """
+    Writes the contents of a config file as YAML to a stream, as it is emitted
+
+    Args:
+        cfg    (dict): The config
+        stream       : A file object to write to
+    """
+
+    yaml.dump(cfg, stream, Dumper=_Dumper, sort_keys=False, default_flow_style=False)
+
 def cycstr(loader, node):
 
     """
@@ -118,8 +247,7 @@ def include(filepaths):
         abs_path = filepath
         if not os.path.isabs(filepath):
             abs_path = os.path.join(os.path.dirname(srw_path), filepath)
-        with open(abs_path, 'r') as fp:
-            contents = yaml.load(fp, Loader=yaml.SafeLoader)
+        contents = load_yaml_config(abs_path)
         for key, value in contents.items():
             cfg[key] = value
     return yaml.dump(cfg, sort_keys=False)
@@ -143,18 +271,24 @@ def startstopfreq(loader, node):
     # Try to fill the values from environment values, default to the
     # value provided in the entry.
     start, stop, freq = (os.environ.get(arg, arg) for arg in args)
+    loader.uncacheable = True
 
     return f'{start}00 {stop}00 {freq}:00:00'
 
 def _nowtimestamp(loader, node):
+    loader.uncacheable = True
     return "id_" + str(int(datetime.datetime.now().timestamp()))
 
 try:
-    yaml.add_constructor("!cycstr", cycstr, Loader=yaml.SafeLoader)
-    yaml.add_constructor("!include", include, Loader=yaml.SafeLoader)
-    yaml.add_constructor("!join_str", join_str, Loader=yaml.SafeLoader)
-    yaml.add_constructor("!startstopfreq", startstopfreq, Loader=yaml.SafeLoader)
-    yaml.add_constructor("!nowtimestamp", _nowtimestamp ,Loader=yaml.SafeLoader)
+    # The C (libyaml) loader is several times faster; fall back to the pure Python one when
+    # PyYAML was built without it.
+    _SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    for _loader in {yaml.SafeLoader, _SafeLoader}:
+        yaml.add_constructor("!cycstr", cycstr, Loader=_loader)
+        yaml.add_constructor("!include", include, Loader=_loader)
+        yaml.add_constructor("!join_str", join_str, Loader=_loader)
+        yaml.add_constructor("!startstopfreq", startstopfreq, Loader=_loader)
+        yaml.add_constructor("!nowtimestamp", _nowtimestamp, Loader=_loader)
 except NameError:
     pass
 
@@ -176,102 +310,358 @@ def days_ago(arg):
     return (datetime.date.today() -
             datetime.timedelta(days=arg)).strftime("%Y%m%d00")
 
-def extend_yaml(yaml_dict, full_dict=None, parent=None):
+# Number of times a value is rendered when its templates render to more
+# templates
+MAX_TEMPLATE_DEPTH = 10
+
+# Number of compiled templates kept for reuse
+TEMPLATE_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def _jinja_env():
     """
-    Updates ``yaml_dict`` in place by rendering any existing Jinja2 templates
-    that exist in a value.
+    Returns the Jinja2 environment, with the filters used in the SRW
+    configs, that is shared by every template
     """
 
-    if full_dict is None:
-        full_dict = yaml_dict
+    # jinja2 is slow to import, and only needed to render templates
+    import jinja2  # pylint: disable=import-outside-toplevel
 
-    if parent is None:
-        full_dict = yaml_dict
+    j2env = jinja2.Environment(
+        loader=jinja2.BaseLoader, undefined=jinja2.StrictUndefined
+    )
+    j2env.filters["path_join"] = path_join
+    j2env.filters["days_ago"] = days_ago
+    j2env.filters["include"] = include
+    return j2env
 
-    if not isinstance(yaml_dict, dict):
-        return
 
-    for k, val in yaml_dict.items():
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _compile_template(template):
+    """
+    Returns the compiled Jinja2 template for a source string. Compiled
+    templates are kept, so each distinct template is compiled once per
+    process however many configs use it.
+    """
 
-        if isinstance(val, dict):
-            extend_yaml(val, full_dict, yaml_dict)
-        else:
+    return _jinja_env().from_string(template)
+
+
+def _has_template(value):
+    # A cheap check that skips the values without templates before any
+    # parsing is done
+    return isinstance(value, str) and "{" in value and ("{{" in value or "{%" in value)
+
+
+def _holds_template(value):
+    # Whether a config value, an XML element or a list of values holds a
+    # template
+    if isinstance(value, ET.Element):
+        value = value.text
+    return _has_template(value) or (isinstance(value, list) and any(map(_has_template, value)))
+
+
+_FRAGMENT_RE = re.compile(r"{{[^}]*}}|\S")
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _template_fragments(v_str):
+    """
+    Splits a string into the templates that are rendered separately.
+
+    Expressions (``{% %}``) make the whole string a single template.
+    Otherwise, each double curly brace template is rendered on its own, so
+    that some can be left un-filled when they are not yet set. For
+    example, we can save cycle-dependent templates to fill in at run time.
+    """
+
+    if "{%" in v_str:
+        return (v_str,)
+    return tuple(m.group() for m in _FRAGMENT_RE.finditer(v_str) if "{{" in m.group())
+
+
+class _ConfigView(Mapping):
+    """
+    A read-only view of a dict in a config that renders the templates in
+    its values the first time they are looked up.
+    """
+
+    def __init__(self, resolver, node):
+        self._resolver = resolver
+        self._node = node
+
+    def __getitem__(self, key):
+        return self._resolver.value(self._node, key)
+
+    def __iter__(self):
+        return iter(self._node)
+
+    def __len__(self):
+        return len(self._node)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class _Scope(_ConfigView):
+    """
+    The names available to a template in a dict of the config: the keys
+    of the dict, the top-level keys of the config and ``parent``, the dict
+    that holds this one.
+    """
+
+    def __init__(self, resolver, node, parent):
+        super().__init__(resolver, node)
+        self._parent = parent
+
+    def __contains__(self, key):
+        return (
+            key == "parent"
+            or key in self._node
+            or key in self._resolver.cfg
+            or key in self._resolver.env.globals
+        )
+
+    def __getitem__(self, key):
+        if key == "parent":
+            return None if self._parent is None else self._resolver.view(self._parent)
+        if key in self._node:
+            return self._resolver.value(self._node, key)
+        if key in self._resolver.cfg:
+            return self._resolver.value(self._resolver.cfg, key)
+        return self._resolver.env.globals[key]
+
+    def __iter__(self):
+        return iter({"parent": None, **self._node, **self._resolver.cfg})
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class TemplateResolver:
+    """
+    Renders the Jinja2 templates in the values of a config in a single pass.
+
+    The config is scanned once for values that hold templates. Each one is
+    then rendered with a scope that looks up the values it references,
+    rendering any of those that hold templates first. References are
+    followed depth first, so values are rendered in dependency order,
+    however they are ordered in the file. Templates are compiled once per
+    process in a shared environment, however many values and configs use
+    them.
+
+    A template can use the keys of its own dict, the top-level keys of the
+    config (e.g., ``workflow.EXPTDIR``) and ``parent``, the dict holding
+    its own. Templates that cannot be filled yet are left as they are.
+    References to values that are not defined are collected in
+    ``undefined``, and chains of values that reference each other in
+    ``cycles``. Once values the unrendered templates reference have been
+    set, ``retry`` renders those templates without scanning the config
+    again.
+
+    Args:
+        cfg (dict): The config to render, updated in place
+    """
+
+    def __init__(self, cfg):
+        from jinja2.exceptions import UndefinedError  # pylint: disable=import-outside-toplevel
+
+        self.cfg = cfg
+        self.env = _jinja_env()
+        self.undefined_error = UndefinedError
+        self.cycles = []
+        self.undefined = []
+        self._parents = {}
+        self._paths = {}
+        self._pending = set()
+        self._left = set()
+        self._active = []
+        self._scan(cfg, None, "")
+
+    def _scan(self, node, parent, path):
+        if id(node) in self._paths:
+            # Aliased dicts are rendered where they first appear
+            return
+        self._paths[id(node)] = path
+        self._parents[id(node)] = parent
+        for key, val in node.items():
+            if isinstance(val, dict):
+                self._scan(val, node, f"{path}.{key}" if path else str(key))
+            elif _holds_template(val):
+                self._pending.add((id(node), key))
+
+    def path(self, node_id, key):
+        """
+        Returns the dotted path to a value in the config, given the ``id``
+        of the dict holding it and its key
+        """
+
+        path = self._paths.get(node_id, "")
+        return f"{path}.{key}" if path else str(key)
+
+    def view(self, node):
+        """
+        Returns a view of a dict in the config that renders values as
+        they are looked up
+        """
+
+        return _ConfigView(self, node)
+
+    def value(self, node, key):
+        """
+        Returns a value from a dict in the config, rendering its templates
+        first if that has not been done yet.
+        """
+
+        if (id(node), key) in self._pending:
+            self._render_value(node, key)
+        val = node[key]
+        return self.view(val) if isinstance(val, dict) else val
+
+    def resolve(self, node=None):
+        """
+        Renders all the templates in a dict of the config and the dicts
+        it holds, in place.
 
-            if not isinstance(val, list):
-                val = [val]
+        Args:
+            node (dict): A dict in the config. Defaults to the whole config.
+        Returns:
+            The resolver, with ``cycles`` and ``undefined`` filled in
+        """
 
-            for v_idx, v in enumerate(val):
-                # Save a bit of compute and only do this part for strings that
-                # contain the jinja double brackets.
-                v_str = str(v.text) if isinstance(v, ET.Element) else str(v)
+        node = self.cfg if node is None else node
+        for key, val in list(node.items()):
+            if isinstance(val, dict):
+                self.resolve(val)
+            elif (id(node), key) in self._pending:
+                self._render_value(node, key)
+        return self
+
+    def retry(self):
+        """
+        Renders again the templates that were left unrendered, e.g., after
+        the values they reference have been set. Values added to the config
+        since it was scanned are not rendered.
+
+        Returns:
+            The resolver, with ``cycles`` and ``undefined`` filled in anew
+        """
+
+        self.cycles = []
+        self.undefined = []
+        self._pending, self._left = self._left, set()
+        self.resolve()
+        self._pending.clear()
+        return self
+
+    def report(self):
+        """
+        Returns a description of the templates that were left unrendered
+        """
+
+        lines = []
+        for cycle in self.cycles:
+            lines.append(f"Circular reference: {' -> '.join(cycle)}")
+        for path, template, message in self.undefined:
+            lines.append(f"Undefined in {path}: {template} ({message})")
+        return "\n".join(lines)
+
+    def _render_value(self, node, key):
+        token = (id(node), key)
+        if token in self._active:
+            # A value that references itself is a placeholder that is set
+            # later on, so only longer chains are reported.
+            cycle = [self.path(*item) for item in self._active[self._active.index(token):]]
+            if len(cycle) > 1 and not any(set(cycle) == set(seen) for seen in self.cycles):
+                self.cycles.append(cycle + cycle[:1])
+            return
+        self._active.append(token)
+        try:
+            val = node[key]
+            items = val if isinstance(val, list) else [val]
+            for v_idx, v in enumerate(items):
+                v_str = v.text if isinstance(v, ET.Element) else v
+                # A template may render to another template, which is
+                # rendered in turn.
+                for _ in range(MAX_TEMPLATE_DEPTH):
+                    if not _has_template(v_str):
+                        break
+                    rendered = self._render_str(node, key, v_str)
+                    if rendered == v_str:
+                        break
+                    v_str = rendered
+                if v_str is (v.text if isinstance(v, ET.Element) else v):
+                    continue
                 if isinstance(v, ET.Element):
-                    print('ELEMENT VSTR', v_str, v.text, yaml_dict)
-                is_a_template = any((ele for ele in ["{{", "{%"] if ele in v_str))
-                if is_a_template:
-                    # Find expressions first, and process them as a single template
-                    # if they exist
-                    # Find individual double curly brace template in the string
-                    # otherwise. We need one substitution template at a time so that
-                    # we can opt to leave some un-filled when they are not yet set.
-                    # For example, we can save cycle-dependent templates to fill in
-                    # at run time.
-                    if "{%" in v_str:
-                        templates = [v_str]
-                    else:
-                        # Separates out all the double curly bracket pairs
-                        templates = [m.group() for m in
-                                re.finditer(r"{{[^}]*}}|\S", v_str)  if '{{'
-                                in m.group()]
-                    data = []
-                    for template in templates:
-                        j2env = jinja2.Environment(
-                            loader=jinja2.BaseLoader, undefined=jinja2.StrictUndefined
-                        )
-                        j2env.filters["path_join"] = path_join
-                        j2env.filters["days_ago"] = days_ago
-                        j2env.filters["include"] = include
-                        try:
-                            j2tmpl = j2env.from_string(template)
-                        except:
-                            print(f"ERROR filling template: {template}, {v_str}")
-                            raise
-                        try:
-                            # Fill in a template that has the appropriate variables
-                            # set.
-                            template = j2tmpl.render(parent=parent, **yaml_dict, **full_dict)
-                        except jinja2.exceptions.UndefinedError as e:
-                            # Leave a templated field as-is in the resulting dict
-                            pass
-                        except ValueError:
-                            pass
-                        except TypeError:
-                            pass
-                        except ZeroDivisionError:
-                            pass
-                        except:
-                            print(f"{k}: {template}")
-                            raise
-
-                        data.append(template)
-
-                    convert_type = True
-                    for tmpl, rendered in zip(templates, data):
-                        v_str = v_str.replace(tmpl, rendered)
-                        if "string" in tmpl:
-                            convert_type = False
-
-                    if convert_type:
-                        v_str = str_to_type(v_str, return_string=2)
-
-                    if isinstance(v, ET.Element):
-                        print('Replacing ET text with', v_str)
-                        v.text = v_str
-                    elif isinstance(yaml_dict[k], list):
-                        yaml_dict[k][v_idx] = v_str
-                    else:
-                        # Put the full template line back together as it was,
-                        # filled or not
-                        yaml_dict[k] = v_str
+                    v.text = v_str
+                elif isinstance(val, list):
+                    val[v_idx] = v_str
+                else:
+                    node[key] = v_str
+        finally:
+            self._active.pop()
+            self._pending.discard(token)
+        if _holds_template(node[key]):
+            self._left.add(token)
+
+    def _render_str(self, node, key, v_str):
+        if node is self.cfg or "parent" in node or node.keys() & self.cfg.keys():
+            # Names are ambiguous in this dict, so its templates are left
+            # as they are.
+            return v_str
+        scope = _Scope(self, node, self._parents.get(id(node)))
+
+        templates = _template_fragments(v_str)
+        convert_type = True
+        for template in templates:
+            rendered = self._render_template(node, key, template, v_str, scope)
+            v_str = v_str.replace(template, rendered)
+            if "string" in template:
+                convert_type = False
+
+        if convert_type:
+            v_str = str_to_type(v_str, return_string=2)
+        return v_str
+
+    def _render_template(self, node, key, template, v_str, scope):
+        try:
+            j2tmpl = _compile_template(template)
+        except:
+            print(f"ERROR filling template: {template}, {v_str}")
+            raise
+        try:
+            # Fill in a template that has the appropriate variables set.
+            context = j2tmpl.new_context(scope, shared=True)
+            return self.env.concat(j2tmpl.root_render_func(context))
+        except self.undefined_error as e:
+            # Leave a templated field as-is in the resulting dict
+            self.undefined.append((self.path(id(node), key), template, str(e)))
+        except (ValueError, TypeError, ZeroDivisionError):
+            pass
+        except:
+            print(f"{key}: {template}")
+            raise
+        return template
+
+
+def extend_yaml(yaml_dict, full_dict=None, parent=None):
+    """
+    Updates ``yaml_dict`` in place by rendering any existing Jinja2 templates
+    that exist in a value. See ``TemplateResolver``.
+
+    Args:
+        yaml_dict (dict): The dict whose templates are rendered
+        full_dict (dict): The whole config holding ``yaml_dict``, whose
+                          top-level keys templates may reference. Defaults
+                          to ``yaml_dict``.
+        parent: Unused; kept for backward compatibility
+    Returns:
+        The ``TemplateResolver``, describing any templates left unrendered
+    """
+
+    resolver = TemplateResolver(yaml_dict if full_dict is None else full_dict)
+    return resolver.resolve(yaml_dict)
 
 
 ##########
@@ -299,67 +689,206 @@ def cfg_to_json_str(cfg):
     return json.dumps(cfg, sort_keys=False, indent=4) + "\n"
 
 
+def cfg_to_json_stream(cfg, stream):
+    """
+    Writes the contents of a config file as JSON to a stream, as it is encoded
+
+    Args:
+        cfg    (dict): The config
+        stream       : A file object to write to
+    """
+
+    json.dump(cfg, stream, sort_keys=False, indent=4)
+    stream.write("\n")
+
+
 ##########
 # SHELL
 ##########
-def load_shell_as_ini_config(file_name, return_string=1):
+# A variable assignment, optionally exported
+_SHELL_ASSIGNMENT = re.compile(r"(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)=")
+# A comment starting a section, as written by cfg_to_shell_str
+_SHELL_SECTION = re.compile(r"#[ \t]*\[([^\]]+)\][ \t]*")
+# The index of an element of a bash array
+_SHELL_ARRAY_INDEX = re.compile(r"\[[0-9]+\]=")
+# Characters that end an unquoted word
+_SHELL_WORD_END = " \t\n;()"
+# What separates the tokens of arrays, of a statement, and statements
+_SHELL_BLANKS = re.compile(r"(?:[ \t\n]+|\\\n|#[^\n]*)*")
+_SHELL_BLANKS_IN_LINE = re.compile(r"(?:[ \t]+|\\\n)*")
+_SHELL_SEPARATORS = re.compile(r"(?:[ \t\n;]+|\\\n)*")
+# Runs of characters that stand for themselves, unquoted, in an array and in double quotes
+_SHELL_PLAIN = re.compile(r"[^ \t\n;()\\'\"$`]+")
+_SHELL_PLAIN_IN_ARRAY = re.compile(r"[^ \t\n;()\\'\"$`*?\[]+")
+_SHELL_PLAIN_IN_DQUOTES = re.compile(r'[^"\\$`]+')
+
+
+def _shell_error(text, pos, msg):
+    """Returns the error for something that cannot be parsed at a position of a shell script"""
+    return ValueError(f"line {text.count(chr(10), 0, pos) + 1}: {msg}")
+
+
+def _shell_word(text, pos, in_array=False):
     """
-    Loads shell config file with embedded structure in comments
+    Reads a shell word, removing its quotes, backslashes and line continuations
+
+    Args:
+        text     (str): The shell script
+        pos      (int): Where the word starts
+        in_array (bool): Whether the word is an element of an array, which is also expanded as a
+                         file name pattern when unquoted
+    Returns:
+        A tuple of the word, whether any of it was quoted, and where it ends
+    Raises:
+        ValueError: If the word is not terminated or would be expanded by the shell
     """
+    plain = _SHELL_PLAIN_IN_ARRAY if in_array else _SHELL_PLAIN
+    chars = []
+    quoted = False
+    if text.startswith("~", pos):
+        raise _shell_error(text, pos, "tilde expansion is not supported")
+    while pos < len(text) and text[pos] not in _SHELL_WORD_END:
+        char = text[pos]
+        match = plain.match(text, pos)
+        if match:
+            chars.append(match.group())
+            pos = match.end()
+        elif char == "\\":
+            if not text.startswith("\n", pos + 1):
+                chars.append(text[pos + 1 : pos + 2])
+            pos += 2
+        elif char == "'":
+            end = text.find("'", pos + 1)
+            if end < 0:
+                raise _shell_error(text, pos, "unterminated single quote")
+            chars.append(text[pos + 1 : end])
+            quoted = True
+            pos = end + 1
+        elif char == '"':
+            quoted = True
+            pos += 1
+            while not text.startswith('"', pos):
+                if pos >= len(text):
+                    raise _shell_error(text, pos, "unterminated double quote")
+                match = _SHELL_PLAIN_IN_DQUOTES.match(text, pos)
+                if match:
+                    chars.append(match.group())
+                    pos = match.end()
+                    continue
+                char = text[pos]
+                if char == "\\" and text[pos + 1 : pos + 2] in ("$", "`", '"', "\\", "\n"):
+                    if text[pos + 1] != "\n":
+                        chars.append(text[pos + 1])
+                    pos += 2
+                    continue
+                if char in "$`":
+                    raise _shell_error(text, pos, "expansions are not supported")
+                chars.append(char)
+                pos += 1
+            pos += 1
+        else:
+            raise _shell_error(text, pos, "expansions are not supported")
+    return "".join(chars), quoted, pos
 
-    # read contents and replace comments as sections
-    with open(file_name, "r") as file:
-        cfg = file.read()
-        cfg = cfg.replace("# [", "[")
-        cfg = cfg.replace("\\\n", " ")
 
-    # write content to temp file and load it as ini
-    temp_file = os.path.join(os.getcwd(), "_temp." + str(os.getpid()) + ".ini")
-    with open(temp_file, "w") as file:
-        file.write(cfg)
+def _shell_value(word, return_string):
+    """Converts a word with str_to_type, unless it has quotes of its own that it would strip"""
+    if word.strip("\"'") != word:
+        return word
+    return str_to_type(word, return_string)
 
-    # load it as a structured ini file
-    try:
-        cfg = load_ini_config(temp_file, return_string)
-    finally:
-        os.remove(temp_file)
 
-    return cfg
+def _skip_shell_blanks(text, pos, newlines=True):
+    """Returns where the next token starts, skipping blanks, comments and line continuations"""
+    blanks = _SHELL_BLANKS if newlines else _SHELL_BLANKS_IN_LINE
+    return blanks.match(text, pos).end()
 
 
-def load_shell_config(config_file, return_string=0):
-    """Loads old-style shell config files.
-    We source the config script in a subshell and get the variables it sets
+def parse_shell_config(text, return_string=0):
+    """
+    Parses the variable assignments of a shell config script without running it
+
+    Scalar values and bash arrays are read with their quotes, backslashes and line continuations
+    removed, and converted with ``str_to_type`` unless they start or end with a quote; an unquoted
+    empty value is ``None``. Comments of the form ``# [section]``, as written by
+    ``cfg_to_shell_str``, put the variables after them in that section; variables before the
+    first section are at the top of the dictionary.
 
     Args:
-         config_file: Path to config file script
+        text          (str): The contents of the shell script
+        return_string (int): How to convert the values (see ``str_to_type``)
     Returns:
-         Dictionary that should be equivalent to one obtained from parsing a YAML file.
+        A dictionary of the variables set, by section
+    Raises:
+        ValueError: If the script does anything but assign values to variables, such as running
+                    commands or expanding variables
     """
 
-    # First try to load it as a structured shell config file
-    try:
-        cfg = load_shell_as_ini_config(config_file, return_string)
-        return cfg
-    except:
-        pass
+    cfg = {}
+    section = cfg
+    pos = 0
+    while pos < len(text):
+        pos = _SHELL_SEPARATORS.match(text, pos).end()
+        if pos == len(text):
+            break
+        if text[pos] == "#":
+            end = text.find("\n", pos)
+            end = len(text) if end < 0 else end
+            match = _SHELL_SECTION.fullmatch(text, pos, end)
+            if match:
+                section = cfg.setdefault(match.group(1), {})
+            pos = end
+            continue
 
-    # Save env vars before and after sourcing the scipt and then
-    # do a diff to get variables specifically defined/updated in the script
-    # Method sounds brittle but seems to work ok so far
-    pid = os.getpid()
-    code = dedent(
-        f"""      #!/bin/bash
-      t1="./t1.{pid}"
-      t2="./t2.{pid}"
-      (set -o posix; set) > $t1
-      {{ . {config_file}; set +x; }} &>/dev/null
-      (set -o posix; set) > $t2
-      diff $t1 $t2 | grep "> " | cut -c 3-
-      rm -rf $t1 $t2
+        match = _SHELL_ASSIGNMENT.match(text, pos)
+        if not match:
+            raise _shell_error(text, pos, "only variable assignments are supported")
+        pos = match.end()
+        if text.startswith("(", pos):
+            value = []
+            pos = _skip_shell_blanks(text, pos + 1)
+            while not text.startswith(")", pos):
+                if pos >= len(text):
+                    raise _shell_error(text, pos, "unterminated array")
+                # str_to_list drops the indices of arrays too
+                index = _SHELL_ARRAY_INDEX.match(text, pos)
+                word, quoted, end = _shell_word(text, index.end() if index else pos, True)
+                if end == pos:
+                    raise _shell_error(text, pos, f"unexpected {text[pos]!r} in array")
+                value.append(_shell_value(word, return_string))
+                pos = _skip_shell_blanks(text, end)
+            pos += 1
+        else:
+            word, quoted, pos = _shell_word(text, pos)
+            value = _shell_value(word, return_string) if word or quoted else None
+        section[match.group(1)] = value
+
+        # the assignment has to end the statement
+        pos = _skip_shell_blanks(text, pos, newlines=False)
+        if pos < len(text) and text[pos] not in "\n;#":
+            raise _shell_error(text, pos, "only variable assignments are supported")
+    return cfg
+
+
+def _source_shell_config(config_file, return_string=0):
+    """
+    Sources a shell config script in a bash subshell and returns the variables it sets
     """
+
+    # Save the variables before and after sourcing the scipt and then do a diff
+    # to get variables specifically defined/updated in the script
+    code = dedent(
+        f"""
+        t1=$(mktemp)
+        t2=$(mktemp)
+        (set -o posix; set) > $t1
+        {{ . {shlex.quote(os.path.abspath(config_file))}; set +x; }} &>/dev/null
+        (set -o posix; set) > $t2
+        diff $t1 $t2 | grep "> " | cut -c 3-
+        rm -f $t1 $t2
+        """
     )
-    (_, config_str, _) = run_command(code)
+    (_, config_str, _) = run_command(f"bash -c {shlex.quote(code)}")
     lines = config_str.splitlines()
 
     # build the dictionary
@@ -372,33 +901,74 @@ def load_shell_config(config_file, return_string=0):
     return cfg
 
 
+def load_shell_config(config_file, return_string=0, subshell=True):
+    """Loads old-style shell config files, such as the ``var_defns.sh`` of older experiments.
+
+    The script is parsed with ``parse_shell_config``, without running it. Scripts that do more
+    than assign values (e.g., expand variables or substitute commands) can only be loaded by
+    sourcing them in a bash subshell and getting the variables they set, which is done unless
+    ``subshell`` is unset.
+
+    Args:
+         config_file: Path to config file script
+         return_string (int): How to convert the values (see ``str_to_type``)
+         subshell (bool): Whether to source scripts that cannot be parsed in a subshell
+    Returns:
+         Dictionary that should be equivalent to one obtained from parsing a YAML file.
+    Raises:
+         ValueError: If the script cannot be parsed and ``subshell`` is not set
+    """
+
+    with open(config_file, "r") as f:
+        text = f.read()
+    try:
+        return parse_shell_config(text, return_string)
+    except ValueError as e:
+        if not subshell:
+            raise ValueError(f"Unable to parse shell config file {config_file}, {e}") from e
+    return _source_shell_config(config_file, return_string)
+
+
 def cfg_to_shell_str(cfg, kname=None):
     """
     Gets contents of config file as shell script string
     """
 
-    shell_str = ""
+    stream = io.StringIO()
+    cfg_to_shell_stream(cfg, stream, kname)
+    return stream.getvalue()
+
+
+def cfg_to_shell_stream(cfg, stream, kname=None):
+    """
+    Writes the contents of a config file as a shell script to a stream, as the config is walked
+
+    Args:
+        cfg    (dict): The config
+        stream       : A file object to write to
+        kname  (str) : The name of the section the config is in, if any
+    """
+
     for k, v in cfg.items():
         if isinstance(v, dict):
             if kname:
                 n_kname = f"{kname}.{k}"
             else:
                 n_kname = f"{k}"
-            shell_str += f"# [{n_kname}]\n"
-            shell_str += cfg_to_shell_str(v, n_kname)
-            shell_str += "\n"
+            stream.write(f"# [{n_kname}]\n")
+            cfg_to_shell_stream(v, stream, n_kname)
+            stream.write("\n")
             continue
         # others
         v1 = list_to_str(v)
         if isinstance(v, list):
-            shell_str += f"{k}={v1}\n"
+            stream.write(f"{k}={v1}\n")
         else:
             # replace some problematic chars
             v1 = v1.replace("'", '"')
             v1 = v1.replace("\n", " ")
             # end problematic
-            shell_str += f"{k}='{v1}'\n"
-    return shell_str
+            stream.write(f"{k}='{v1}'\n")
 
 
 ##########
@@ -446,28 +1016,45 @@ def cfg_to_ini_str(cfg, kname=None):
     Gets contents of config file as INI string
     """
 
-    ini_str = ""
+    stream = io.StringIO()
+    cfg_to_ini_stream(cfg, stream, kname)
+    return stream.getvalue()
+
+
+def cfg_to_ini_stream(cfg, stream, kname=None):
+    """
+    Writes the contents of a config file as INI to a stream, as the config is walked
+
+    Args:
+        cfg    (dict): The config
+        stream       : A file object to write to
+        kname  (str) : The name of the section the config is in, if any
+    """
+
     for k, v in cfg.items():
         if isinstance(v, dict):
             if kname:
                 n_kname = f"{kname}.{k}"
             else:
                 n_kname = f"{k}"
-            ini_str += f"[{n_kname}]\n"
-            ini_str += cfg_to_ini_str(v, n_kname)
-            ini_str += "\n"
+            stream.write(f"[{n_kname}]\n")
+            cfg_to_ini_stream(v, stream, n_kname)
+            stream.write("\n")
             continue
         v1 = list_to_str(v, True)
         if isinstance(v, list):
-            ini_str += f"{k}={v1}\n"
+            stream.write(f"{k}={v1}\n")
         else:
-            ini_str += f"{k}='{v1}'\n"
-    return ini_str
+            stream.write(f"{k}='{v1}'\n")
 
 
 ##########
 # XML
 ##########
+# Names that XML elements can have
+_XML_TAG = re.compile(r"[^\W\d][\w.-]*")
+
+
 def xml_to_dict(root, return_string):
     """
     Converts an XML tree to dictionary
@@ -515,12 +1102,57 @@ def cfg_to_xml_str(cfg):
     Gets contents of config file as a XML string
     """
 
-    root = dict_to_xml(cfg, "root")
-    r = ET.tostring(root, encoding="unicode")
-    r = minidom.parseString(r)
-    r = r.toprettyxml(indent="  ")
-    r = r.replace("&quot;", '"')
-    return r
+    stream = io.StringIO()
+    cfg_to_xml_stream(cfg, stream)
+    return stream.getvalue()
+
+
+def _xml_tags(cfg):
+    """Yields the tags of all the elements a config is written as"""
+    for k, v in cfg.items():
+        yield k
+        if isinstance(v, dict):
+            yield from _xml_tags(v)
+
+
+def _write_xml_element(cfg, stream, tag, indent):
+    """Writes a (nested) config as an XML element with the given tag and indentation"""
+    if not cfg:
+        stream.write(f"{indent}<{tag}/>\n")
+        return
+    stream.write(f"{indent}<{tag}>\n")
+    for k, v in cfg.items():
+        if isinstance(v, dict):
+            _write_xml_element(v, stream, k, f"{indent}  ")
+            continue
+        text = list_to_str(v, True)
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        if text:
+            stream.write(f"{indent}  <{k}>{text}</{k}>\n")
+        else:
+            stream.write(f"{indent}  <{k}/>\n")
+    stream.write(f"{indent}</{tag}>\n")
+
+
+def cfg_to_xml_stream(cfg, stream):
+    """
+    Writes the contents of a config file as XML to a stream, as the config is walked
+
+    The XML is indented by two spaces per level, and the text of elements is escaped except for
+    double quotes, as ``minidom`` pretty-printed it.
+
+    Args:
+        cfg    (dict): The config
+        stream       : A file object to write to
+    Raises:
+        ValueError: If a key of the config is not a valid XML tag
+    """
+
+    for tag in _xml_tags(cfg):
+        if not _XML_TAG.fullmatch(str(tag)):
+            raise ValueError(f"Not a valid XML tag: {tag}")
+    stream.write('<?xml version="1.0" ?>\n')
+    _write_xml_element(cfg, stream, "root", "")
 
 
 ##################
@@ -750,17 +1382,17 @@ def cfg_main():
         if args.flatten:
             cfg = flatten_dict(cfg)
 
-        # convert to string and print
+        # write it out as it is converted
         if args.out_type in ["shell", "sh"]:
-            print(cfg_to_shell_str(cfg), end="")
+            cfg_to_shell_stream(cfg, sys.stdout)
         elif args.out_type == "ini":
-            print(cfg_to_ini_str(cfg), end="")
+            cfg_to_ini_stream(cfg, sys.stdout)
         elif args.out_type == "json":
-            print(cfg_to_json_str(cfg), end="")
+            cfg_to_json_stream(cfg, sys.stdout)
         elif args.out_type in ["yaml", "yml"]:
-            print(cfg_to_yaml_str(cfg), end="")
+            cfg_to_yaml_stream(cfg, sys.stdout)
         elif args.out_type == "xml":
-            print(cfg_to_xml_str(cfg), end="")
+            cfg_to_xml_stream(cfg, sys.stdout)
         else:
             parser.print_help()
             parser.exit()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Checks experiment configs against the valid values of their variables, as listed in
+``valid_param_vals.yaml``.
+"""
+
+import functools
+import os
+from textwrap import dedent
+
+from .config_parser import load_config_file
+
+# Prefix of the keys in valid_param_vals.yaml; the rest of the key is the variable's name
+VALID_VALS_PREFIX = "valid_vals_"
+
+
+class ConfigSchema:
+    """
+    The valid values of config variables, compiled for checking whole configs
+
+    Each list of valid values is turned into a set once, so checking a value does not depend on
+    how many valid values there are, and a config is checked in a single walk over it that
+    collects every invalid value instead of stopping at the first one.
+
+    Args:
+        valid_vals (dict): The contents of ``valid_param_vals.yaml``
+    """
+
+    def __init__(self, valid_vals):
+        self.valid_vals = {}
+        self.allowed = {}
+        for key, values in valid_vals.items():
+            if not key.startswith(VALID_VALS_PREFIX):
+                continue
+            name = key[len(VALID_VALS_PREFIX):]
+            self.valid_vals[name] = values
+            try:
+                self.allowed[name] = frozenset(values)
+            except TypeError:
+                self.allowed[name] = values
+
+    def allows(self, name, value):
+        """
+        Returns whether a value is one of the valid values of a variable
+
+        Args:
+            name  (str): The name of the variable
+            value      : A value of the variable
+        Returns:
+            bool: Whether the value is valid
+        """
+        try:
+            return value in self.allowed[name]
+        except TypeError:
+            # An unhashable value cannot equal any of the valid values
+            return False
+
+    def _collect(self, cfg, found):
+        """Gathers the values of the checked variables in a nested config"""
+        for key, value in cfg.items():
+            if isinstance(value, dict):
+                self._collect(value, found)
+            elif key in self.allowed:
+                found[key] = value
+
+    def validate(self, cfg):
+        """
+        Checks the values of the variables in a config
+
+        As in ``flatten_dict(cfg)``, only the last value is checked when a variable appears in
+        more than one section. Unset (``None`` or empty) variables are not checked, and each
+        element of a list is checked.
+
+        Args:
+            cfg (dict): The (nested) experiment config
+        Returns:
+            list: A message for each variable with an invalid value; empty if all are valid
+        """
+        found = {}
+        self._collect(cfg, found)
+
+        errors = []
+        for name, value in found.items():
+            if value is None or value == "":
+                continue
+            if isinstance(value, list):
+                if not all(self.allows(name, ele) for ele in value):
+                    errors.append(dedent(f"""
+                        The variable
+                            {name} = {value}
+                        in the user's configuration has at least one invalid value.  Possible values are:
+                            {name} = {self.valid_vals[name]}"""
+                    ))
+            elif not self.allows(name, value):
+                errors.append(dedent(f"""
+                    The variable
+                        {name} = {value}
+                    in the user's configuration does not have a valid value.  Possible values are:
+                        {name} = {self.valid_vals[name]}"""
+                ))
+        return errors
+
+
+def load_config_schema(valid_vals_fp):
+    """
+    Returns the compiled schema for a file of valid values. It is compiled once per process and
+    compiled again only if the file changes.
+
+    Args:
+        valid_vals_fp (str): Path to the file of valid values (``valid_param_vals.yaml``)
+    Returns:
+        ConfigSchema: The compiled schema
+    """
+    valid_vals_fp = os.path.abspath(valid_vals_fp)
+    return _compile_schema(valid_vals_fp, os.stat(valid_vals_fp).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_schema(valid_vals_fp, mtime_ns):  # pylint: disable=unused-argument
+    """Compiles the schema for a version (modification time) of a file of valid values"""
+    return ConfigSchema(load_config_file(valid_vals_fp))
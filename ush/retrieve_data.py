@@ -8,6 +8,10 @@ Several supported data streams are included in ``parm/data_locations.yml``, whic
 When using this script to pull from disk, the user is required to provide the path to the data location, which can include Python templates. The file names follow those included in the ``--config`` file by default or can be user-supplied via the ``--file_name`` flag. That flag
 takes a YAML-formatted string that follows the same conventions outlined in the ``parm/data_locations.yml`` file for naming files.
 
+A manifest of the retrieved files, with their sources, sizes, modification times and, for downloads, checksums, is kept next to the summary file in each output directory. When the script is run again, files that are unchanged since they were recorded are not retrieved again.
+
+Data for a series of cycles, e.g. for a retrospective run, can be retrieved in one run with the ``--cycle_dates START END INCR`` flag. Files needed by more than one cycle are retrieved once, each HPSS archive is read once for all cycles, and a summary file is written for each cycle.
+
 To see usage for this script:
 
   .. code-block::
@@ -18,76 +22,583 @@ To see usage for this script:
 
 import argparse
 import datetime as dt
+import errno
+import fcntl
+import fnmatch
+import functools
 import glob
+import hashlib
+import http.client
 import logging
 import os
 import shutil
+import string
 import subprocess
 import sys
 import glob
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from textwrap import dedent
 import time
 import urllib.request
-from copy import deepcopy
+from copy import copy, deepcopy
+from urllib.parse import urljoin, urlparse
 
 import yaml
 
 
-def clean_up_output_dir(expected_subdir, local_archive, output_path, source_paths):
+# HTTP status codes that indicate a server is throttling or temporarily
+# unable to serve a request. Only these responses are retried with an
+# exponential backoff; any other failure is reported right away.
+RETRY_STATUS_CODES = (429, 503)
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 2
 
-    """Removes expected subdirectories and ``existing_archive`` files on disk once all files have been extracted and put into the specified output location.
-    
-    Args: 
-        expected_subdir      : Expected subdirectories
-        local_archive   (str): File name
-        output_path     (str): Path to a location on disk. Path is expected to exist.
-        source_paths    (str): 
-    
-    Returns: 
-        unavailable (dict): A dictionary of unavailable files
+# Size of the buffer used to stream downloads to disk.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Name of the manifest of retrieved files kept in each output directory.
+MANIFEST_NAME = "retrieve_data_manifest.yaml"
+
+
+class HostLimiter:
+
+    """Bounds the number of simultaneous requests made to any one host.
+
+    Each host gets its own semaphore the first time it is seen, so requests
+    to different hosts never wait on one another.
+
+    Args:
+        max_per_host (int): Maximum number of concurrent requests per host
     """
 
-    unavailable = {}
-    expand_source_paths = []
-    logging.debug(f"Cleaning up local paths: {source_paths}")
-    for p in source_paths:
-        expand_source_paths.extend(glob.glob(p.lstrip("/")))
-
-    # Check to make sure the files exist on disk
-    for file_path in expand_source_paths:
-        local_file_path = os.path.join(os.getcwd(), file_path.lstrip("/"))
-        logging.debug(f"Moving {local_file_path} to {output_path}")
-        if not os.path.exists(local_file_path):
-            logging.info(f"File does not exist: {local_file_path}")
-            unavailable["hpss"] = expand_source_paths
+    def __init__(self, max_per_host):
+        self.max_per_host = max(1, max_per_host)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def slot(self, url):
+        """Returns the semaphore guarding the host of the given URL.
+
+        Args:
+            url (str): URL that will be requested
+        Returns:
+            A ``threading.BoundedSemaphore`` to be used as a context manager
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+
+def backoff_delay(attempt):
+
+    """Returns the number of seconds to wait before retry number ``attempt``
+    (counting from zero) of a throttled request."""
+
+    return BACKOFF_SECONDS * 2 ** attempt
+
+
+class ConnectionPool:
+
+    """Keeps idle keep-alive HTTP(S) connections for reuse, keyed by scheme, host and port, so 
+    that retrieving many files from the same server pays for one TCP+TLS handshake per 
+    connection instead of one per file.
+
+    A connection is used by one thread at a time. It is checked out of the pool for a request 
+    and returned once its response body has been read in full; connections the server asked to 
+    close are discarded. Proxies set in the environment (``https_proxy``, ``http_proxy``, 
+    ``no_proxy``) are honored.
+
+    Args:
+        timeout (float): Socket timeout in seconds
+    """
+
+    def __init__(self, timeout=15):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def _connect(self, scheme, netloc):
+        """Returns a new connection to the host, tunneled through a proxy if one is set."""
+        conn_class = (
+            http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        )
+        host = netloc.rsplit("@", 1)[-1]
+        proxy = urllib.request.getproxies().get(scheme)
+        if proxy and not urllib.request.proxy_bypass(host.split(":")[0]):
+            proxy = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+            conn = conn_class(proxy.hostname, proxy.port, timeout=self.timeout)
+            conn.set_tunnel(host)
+            return conn
+        return conn_class(host, timeout=self.timeout)
+
+    def _checkout(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*key), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    @contextmanager
+    def open(self, method, url, headers=None, max_redirects=5):
+        """
+        Sends a request and yields the response. Redirects are followed. The connection goes 
+        back to the pool on exit if the response was read in full.
+
+        Args:
+            method        (str) : HTTP method, e.g. ``GET`` or ``HEAD``
+            url           (str) : URL to request
+            headers       (dict): Extra request headers
+            max_redirects (int) : Maximum number of redirects to follow
+
+        Yields:
+            An ``http.client.HTTPResponse``
+        """
+        headers = dict(headers or {})
+        for _ in range(max_redirects + 1):
+            parsed = urlparse(url)
+            key = (parsed.scheme, parsed.netloc)
+            path = parsed.path or "/"
+            if parsed.query:
+                path = f"{path}?{parsed.query}"
+            conn, reused = self._checkout(key)
+            try:
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection; try
+                # once more on a fresh one.
+                conn = self._connect(*key)
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                resp.read()
+                self._release(key, conn, resp)
+                url = urljoin(url, resp.getheader("Location"))
+                continue
+
+            try:
+                yield resp
+            finally:
+                self._release(key, conn, resp)
+            return
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def _release(self, key, conn, resp):
+        if resp.isclosed() and not resp.will_close:
+            self._checkin(key, conn)
         else:
-            file_name = os.path.basename(file_path)
-            expected_output_loc = os.path.join(output_path, file_name)
-            if not local_file_path == expected_output_loc:
-                logging.info(f"Moving {local_file_path} to " f"{expected_output_loc}")
-                shutil.move(local_file_path, expected_output_loc)
-
-    # Clean up directories from inside archive, if they exist
-    if os.path.exists(expected_subdir) and expected_subdir != "./":
-        logging.info(f"Removing {expected_subdir}")
-        os.removedirs(expected_subdir)
-
-    # If an archive exists on disk, remove it
-    if os.path.exists(local_archive):
-        os.remove(local_archive)
-    return unavailable
+            conn.close()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+# Connections are shared by every download in this process.
+HTTP_POOL = ConnectionPool()
 
 
-def copy_file(source, destination, copy_cmd):
+class DataCache:
 
+    """A shared, size-bounded, content-addressed cache of retrieved files.
+
+    Each file is stored once under a key derived from the data store and the rendered source 
+    path or URL, so experiments that need the same external model files share a single 
+    transfer. Files are placed into the output directory with a hard link (falling back to a 
+    symbolic link across file systems) or a symbolic link. When the cache grows past 
+    ``max_size`` bytes, the least recently used files are removed. When a file was last used 
+    is kept in the time of an empty file under ``used``, since the times of the cached file 
+    itself are those of the files hard-linked to it in output directories.
+
+    Populating a key holds an exclusive ``flock`` on a per-key lock file, so concurrent 
+    processes that need the same file wait for the first one to retrieve it instead of 
+    transferring it again. Files enter the cache with an atomic rename.
+
+    Args:
+        cache_dir  (str): Directory holding the cache. Created if it does not exist.
+        max_size   (int): Maximum total size of the cached files, in bytes. No limit if ``None``.
+        link       (str): ``"hardlink"`` or ``"symlink"``
     """
-    Copies a file from a source and places it in the destination location.
+
+    def __init__(self, cache_dir, max_size=None, link="hardlink"):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self.link = link
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        self.locks_dir = os.path.join(self.cache_dir, "locks")
+        self.used_dir = os.path.join(self.cache_dir, "used")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+
+    @staticmethod
+    def key(data_store, source):
+        """Returns the cache key for a file from a data store."""
+        return hashlib.sha256(f"{data_store}\n{source}".encode("utf-8")).hexdigest()
+
+    def object_path(self, key):
+        """Returns the location of a cached file."""
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def used_path(self, key):
+        """Returns the location of the file whose time is when a cached file was last used."""
+        return os.path.join(self.used_dir, key[:2], key)
+
+    def mark_used(self, key):
+        """Marks a cached file as used now."""
+        used = self.used_path(key)
+        os.makedirs(os.path.dirname(used), exist_ok=True)
+        with open(used, "a"):
+            pass
+        os.utime(used)
+
+    @contextmanager
+    def locked(self, name):
+        """Holds an exclusive lock on the named lock file."""
+        with open(os.path.join(self.locks_dir, f"{name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def place(self, key, dest_path):
+        """
+        Links a cached file into place and marks it as recently used.
+
+        Returns:
+            True if the file was in the cache
+        """
+        obj = self.object_path(key)
+        if not os.path.exists(obj):
+            return False
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        linked = False
+        if self.link == "hardlink":
+            try:
+                os.link(obj, dest_path)
+                linked = True
+            except OSError as err:
+                if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        if not linked:
+            os.symlink(obj, dest_path)
+        self.mark_used(key)
+        return True
+
+    def store(self, key, file_path):
+        """Adds a retrieved file to the cache without copying it when possible."""
+        obj = self.object_path(key)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(obj), prefix=".tmp.")
+        os.close(fd)
+        try:
+            os.remove(tmp_path)
+            try:
+                os.link(os.path.realpath(file_path), tmp_path)
+            except OSError:
+                shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, obj)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.mark_used(key)
+
+    def provide(self, data_store, source, dest_path, retrieve):
+        """
+        Places a file from the cache, or retrieves it with ``retrieve`` and adds it to the cache.
+
+        Args:
+            data_store (str)     : Name of the data store
+            source     (str)     : Rendered path or URL of the file in the data store
+            dest_path  (str)     : Where the file should be placed
+            retrieve   (callable): Retrieves the file to ``dest_path``, returning True on success
+
+        Returns:
+            True if the file is in place
+        """
+        key = self.key(data_store, source)
+        with self.locked(key):
+            if self.place(key, dest_path):
+                logging.info(f"Using cached copy of {source}")
+                return True
+            if not retrieve():
+                return False
+            self.store(key, dest_path)
+        self.evict()
+        return True
+
+    def evict(self):
+        """Removes the least recently used files until the cache fits within ``max_size``."""
+        if self.max_size is None:
+            return
+        with self.locked("evict"):
+            entries = []
+            for root, _, files in os.walk(self.objects_dir):
+                for name in files:
+                    if name.startswith(".tmp."):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    try:
+                        used = os.stat(self.used_path(name)).st_mtime
+                    except FileNotFoundError:
+                        used = stat.st_mtime
+                    entries.append((used, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                logging.info(f"Evicting {path} from the cache")
+                for evicted in (path, self.used_path(os.path.basename(path))):
+                    try:
+                        os.remove(evicted)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+
+class Retrieved:
+
+    """Keeps track of the files retrieved by this process, so that a file requested by more 
+    than one cycle of a ``--cycle_dates`` run is only fetched once. Later requests are copied 
+    from the first output path that received the file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def add(self, source, target_path, input_loc):
+
+        """Records that a file has been retrieved into a directory.
+
+        Args:
+          source          : Hashable key identifying the requested file
+          target_path (str): Directory the file was placed in
+          input_loc   (str): Path or URL of the file
+        """
+
+        local_path = os.path.join(target_path, os.path.basename(urlparse(input_loc).path))
+        if os.path.exists(local_path):
+            with self._lock:
+                self._files.setdefault(source, local_path)
+
+    def place(self, source, target_path):
+
+        """Places a copy of a previously retrieved file in a directory.
+
+        Args:
+          source          : Hashable key identifying the requested file
+          target_path (str): Directory in which to place the file
+
+        Returns:
+          ``True`` if the file had been retrieved before and is now in ``target_path``
+        """
+
+        with self._lock:
+            local_path = self._files.get(source)
+        if local_path is None or not os.path.exists(local_path):
+            return False
+        dest_path = os.path.join(target_path, os.path.basename(local_path))
+        if os.path.abspath(dest_path) != os.path.abspath(local_path):
+            logging.info(f"Copying previously retrieved {local_path} to {dest_path}")
+            shutil.copyfile(local_path, dest_path)
+        return True
+
+
+class Manifest:
+
+    """Records the files retrieved into each output directory in a manifest file next to the 
+    summary file, so that a rerun can skip the files that are already in place.
+
+    Each entry holds the file name, its source, the size and modification time of the 
+    retrieved file and, for downloads, a SHA-256 checksum computed while the file was streamed 
+    to disk. For files copied from disk, the size and modification time of the source are kept 
+    too, so a changed source is retrieved again.
+
+    Entries are appended to the manifest as soon as each file is in place, so the work done by 
+    a run that fails part way through is not lost. When a file appears more than once, the last 
+    entry is used.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _load(self, directory):
+        # Caller holds the lock
+        if directory not in self._entries:
+            entries = {}
+            path = os.path.join(directory, MANIFEST_NAME)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r") as manifest:
+                        records = yaml.load(manifest, Loader=yaml.SafeLoader) or []
+                except yaml.YAMLError as err:
+                    logging.warning(f"Ignoring unreadable manifest {path}: {err}")
+                    records = []
+                entries = {record["name"]: record for record in records}
+            self._entries[directory] = entries
+        return self._entries[directory]
+
+    @staticmethod
+    def _source_stat(source, method):
+        if method != "disk":
+            return {}
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        return {"source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+    def recorded(self, file_path):
+
+        """Checks whether a file has an entry in the manifest.
+
+        Args:
+          file_path (str): Path of the retrieved file
+
+        Returns:
+          ``True`` if the file was recorded as complete by an earlier retrieval
+        """
+
+        directory, name = os.path.split(file_path)
+        with self._lock:
+            return name in self._load(directory)
+
+    def matches(self, file_path, source, method):
+
+        """Checks whether a file is already in place, as recorded in the manifest.
+
+        Args:
+          file_path (str): Path of the retrieved file
+          source    (str): Rendered path or URL the file is retrieved from
+          method    (str): Retrieval method. Disk sources are checked for changes.
+
+        Returns:
+          ``True`` if the manifest entry for the file has the same source, and the file and 
+          any disk source are unchanged since it was recorded
+        """
+
+        directory, name = os.path.split(file_path)
+        with self._lock:
+            entry = self._load(directory).get(name)
+        if entry is None or entry.get("source") != source:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime) != (entry.get("size"), entry.get("mtime")):
+            return False
+        source_stat = self._source_stat(source, method)
+        return source_stat is not None and all(
+            entry.get(field) == value for field, value in source_stat.items()
+        )
+
+    def record(self, file_path, source, method, checksum=None):
+
+        """Adds an entry for a file that has been put in place.
+
+        Args:
+          file_path (str): Path of the retrieved file
+          source    (str): Rendered path or URL the file was retrieved from
+          method    (str): Retrieval method
+          checksum  (str): SHA-256 checksum of the file, if known
+        """
+
+        directory, name = os.path.split(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        entry = {
+            "name": name,
+            "source": source,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            **(self._source_stat(source, method) or {}),
+        }
+        if checksum is not None:
+            entry["sha256"] = checksum
+        line = yaml.safe_dump(
+            [entry], default_flow_style=None, sort_keys=False, width=float("inf")
+        )
+        with self._lock:
+            self._load(directory)[name] = entry
+            with open(os.path.join(directory, MANIFEST_NAME), "a") as manifest:
+                manifest.write(line)
+
+
+def copy_contents(source, dest_path):
+
+    """
+    Copies the contents of a file in-process. ``os.copy_file_range`` lets the kernel copy the 
+    data, or share it with a reflink on file systems that support them, without passing it 
+    through Python; ``shutil.copyfile`` is used where it is not available.
+
+    Args:
+        source    (str): Path of the file to copy
+        dest_path (str): Path of the new file
+    """
+
+    if hasattr(os, "copy_file_range"):
+        with open(source, "rb") as fsrc, open(dest_path, "wb") as fdst:
+            copied = 0
+            try:
+                while True:
+                    nbytes = os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1024**3)
+                    if not nbytes:
+                        return
+                    copied += nbytes
+            except OSError as err:
+                # Not supported between these file systems or by this
+                # kernel; copy through user space instead.
+                if copied or err.errno not in (
+                    errno.EXDEV,
+                    errno.ENOSYS,
+                    errno.EINVAL,
+                    errno.EOPNOTSUPP,
+                    errno.EPERM,
+                ):
+                    raise
+    shutil.copyfile(source, dest_path)
+
+
+def copy_file(source, destination, mode="copy"):
+
+    """
+    Copies a file from a source and places it in the destination location, without starting a 
+    subprocess. The file is written under a temporary name and renamed into place, so an 
+    interrupted copy never leaves a partial file behind.
     Assumes destination exists.
 
     Args: 
-        source      (str): Directory where file currently resides
-        destination (str): Directory that the file should be moved to
-        copy_cmd    (str): Copy command (e.g., ``cp``, ``ln -sf``)
+        source      (str): Path of the file to copy
+        destination (str): Directory that the file should be placed in
+        mode        (str): ``"copy"``, ``"symlink"`` or ``"hardlink"``. Hard links fall back to 
+                           a copy across file systems.
 
     Returns: 
         A boolean value reflecting whether the copy was successful (True) or unsuccessful (False)
@@ -97,69 +608,324 @@ def copy_file(source, destination, copy_cmd):
         logging.info(f"File does not exist on disk \n {source} \n try using: --input_file_path <your_path>")
         return False
 
-    # Using subprocess here because system copy is much faster than
-    # python copy options.
-    cmd = f"{copy_cmd} {source} {destination}"
-    logging.info(f"Running command: \n {cmd}")
+    dest_path = os.path.join(destination, os.path.basename(source))
+    tmp_path = os.path.join(
+        destination, f".{os.path.basename(source)}.tmp.{os.getpid()}.{threading.get_ident()}"
+    )
+    logging.info(f"Placing file ({mode}): \n {source} -> {dest_path}")
     try:
-        subprocess.run(
-            cmd,
-            check=True,
-            shell=True,
-        )
-    except subprocess.CalledProcessError as err:
+        if mode == "symlink":
+            os.symlink(source, tmp_path)
+        else:
+            linked = False
+            if mode == "hardlink":
+                try:
+                    os.link(source, tmp_path)
+                    linked = True
+                except OSError as err:
+                    if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                        raise
+                    logging.debug(f"Could not hard link {source}, copying instead: {err}")
+            if not linked:
+                copy_contents(source, tmp_path)
+                shutil.copymode(source, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except OSError as err:
         logging.info(err)
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
         return False
     return True
 
-def check_file(url):
+
+@contextmanager
+def open_with_backoff(pool, method, url, headers=None):
+
+    """
+    Opens a request on a pooled connection, retrying with an exponential backoff while the 
+    server answers that it is throttling requests (HTTP 429 or 503).
+
+    Args:
+        pool    (ConnectionPool): Pool of connections to use
+        method  (str)           : HTTP method
+        url     (str)           : URL to request
+        headers (dict)          : Extra request headers
+
+    Yields:
+        The first response that is not throttled, or the last one once ``MAX_RETRIES`` is reached
+    """
+
+    for attempt in range(MAX_RETRIES + 1):
+        with pool.open(method, url, headers=headers) as resp:
+            if resp.status not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                yield resp
+                return
+            resp.read()
+        delay = backoff_delay(attempt)
+        logging.warning(f"Server returned {resp.status} for {url}, retrying in {delay} s")
+        time.sleep(delay)
+
+
+def check_file(url, pool=None):
 
     """
-    Checks that a file exists at the expected URL. 
+    Checks that a file exists at the expected URL with a ``HEAD`` request on a pooled 
+    connection. Requests that are throttled by the server (HTTP 429 or 503) are retried with an 
+    exponential backoff.
 
     Args:
-        url: URL for file to be downloaded
+        url               : URL for file to be downloaded
+        pool (ConnectionPool): Pool of connections to reuse. Defaults to ``HTTP_POOL``.
 
     Return:
         Boolean value (True if ``status_code == 200`` or False otherwise)
     """
-    status_code = urllib.request.urlopen(url).getcode()
-    return status_code == 200
+    pool = pool or HTTP_POOL
+    try:
+        with open_with_backoff(pool, "HEAD", url) as resp:
+            resp.read()
+            return resp.status == 200
+    except (http.client.HTTPException, OSError) as err:
+        logging.info(f"Could not reach {url}: {err}")
+        return False
 
-def download_file(url):
+
+def download_file(url, target_path=".", pool=None, checksums=None):
 
     """
     Download a file from a URL source, and place it in a target location on disk.
 
+    The response body is streamed to disk in ``CHUNK_SIZE`` pieces over a pooled keep-alive 
+    connection. A partial file left by an earlier attempt is resumed with a ``Range`` request. 
+    Requests that are throttled by the server (HTTP 429 or 503) are retried with an exponential 
+    backoff, and a dropped connection is retried once, resuming where it stopped.
+
     Args:
-      url: URL for file to be downloaded
+      url         (str)           : URL for file to be downloaded
+      target_path (str)           : Directory in which to place the file
+      pool        (ConnectionPool): Pool of connections to reuse. Defaults to ``HTTP_POOL``.
+      checksums   (dict)          : When given, the SHA-256 checksum of the file, computed as it 
+                                    is streamed to disk, is stored here under its path
 
     Returns:
       Boolean value reflecting whether the copy was successful (True) or unsuccessful (False)
     """
 
-    # wget flags:
-    # -c continue previous attempt
-    # -T timeout seconds
-    # -t number of tries
-    cmd = f"wget -q -c -T 15 -t 2 {url}"
-    logging.debug(f"Running command: \n {cmd}")
+    pool = pool or HTTP_POOL
+    file_path = os.path.join(target_path, os.path.basename(urlparse(url).path))
+    logging.debug(f"Downloading {url} to {file_path}")
+
+    for attempt in range(2):
+        offset = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with open_with_backoff(pool, "GET", url, headers=headers) as resp:
+                if resp.status == 416 and offset:
+                    # The partial file is already complete
+                    resp.read()
+                    return True
+                if resp.status not in (200, 206):
+                    logging.info(f"Download failed with status {resp.status}: {url}")
+                    resp.read()
+                    return False
+                mode = "ab" if resp.status == 206 else "wb"
+                expected = resp.length
+                digest = None
+                if checksums is not None:
+                    digest = hashlib.sha256()
+                    if mode == "ab":
+                        # Only the part kept from an earlier attempt is
+                        # read back.
+                        with open(file_path, "rb") as partial:
+                            for block in iter(lambda: partial.read(CHUNK_SIZE), b""):
+                                digest.update(block)
+                with open(file_path, mode) as out_file:
+                    written = stream_to_file(resp, out_file, digest)
+                if expected is not None and written != expected:
+                    raise http.client.IncompleteRead(b"", expected - written)
+                if digest is not None:
+                    checksums[file_path] = digest.hexdigest()
+                return True
+        except (http.client.HTTPException, OSError) as err:
+            if attempt:
+                logging.info(f"Download failed: {url}\n {err}")
+                return False
+            logging.warning(f"Connection to {urlparse(url).netloc} failed, retrying: {err}")
+    return False
+
+
+def parse_grib_index(index_text):
+
+    """
+    Parses the contents of a GRIB2 ``.idx`` sidecar file, as written by ``wgrib2 -s``. Each line 
+    looks like ``1:0:d=2022062512:PRES:surface:anl:``.
+
+    Args:
+        index_text (str): Contents of the index file
+
+    Returns:
+        A list of ``(offset, variable, level)`` tuples in file order
+    """
+
+    records = []
+    for line in index_text.splitlines():
+        fields = line.split(":")
+        if len(fields) < 5:
+            continue
+        records.append((int(fields[1]), fields[3], fields[4]))
+    return records
+
+
+def grib_byte_ranges(records, variables=None, levels=None):
+
+    """
+    Computes the byte ranges of the GRIB2 messages matching a variable and level filter, merging 
+    ranges that are adjacent in the file.
+
+    A message extends to the start of the next message at a different offset; the last message 
+    extends to the end of the file. Sub-messages that share an offset (e.g., the two wind 
+    components of a ``UGRD``/``VGRD`` pair) are fetched together.
+
+    Args:
+        records   (list): ``(offset, variable, level)`` tuples from ``parse_grib_index``
+        variables (list): Variable names to keep, e.g. ``TMP``. All variables if empty.
+        levels    (list): Level descriptions to keep, e.g. ``500 mb``. All levels if empty.
+
+    Returns:
+        A list of ``(start, end)`` inclusive byte ranges. ``end`` is ``None`` for a range that 
+        runs to the end of the file.
+    """
+
+    offsets = sorted({offset for offset, _, _ in records})
+    next_offset = dict(zip(offsets, offsets[1:] + [None]))
+
+    starts = sorted(
+        {
+            offset
+            for offset, variable, level in records
+            if (not variables or variable in variables) and (not levels or level in levels)
+        }
+    )
+
+    ranges = []
+    for start in starts:
+        stop = next_offset[start]
+        end = None if stop is None else stop - 1
+        if ranges and ranges[-1][1] is not None and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def download_grib_subset(
+    url, target_path, variables=None, levels=None, pool=None, checksums=None
+):
+
+    """
+    Downloads only the GRIB2 messages of a remote file that match a variable and level filter. 
+    The ``.idx`` file next to the GRIB2 file is used to find the byte ranges of the messages, 
+    which are then fetched with one ``Range`` request per merged range and written to a single 
+    file.
+
+    Falls back to downloading the whole file when no index is available.
+
+    Args:
+      url         (str)           : URL of the GRIB2 file
+      target_path (str)           : Directory in which to place the file
+      variables   (list)          : Variable names to keep
+      levels      (list)          : Level descriptions to keep
+      pool        (ConnectionPool): Pool of connections to reuse. Defaults to ``HTTP_POOL``.
+      checksums   (dict)          : When given, the SHA-256 checksum of the file written is 
+                                    stored here under its path
+
+    Returns:
+      Boolean value reflecting whether the download was successful (True) or unsuccessful (False)
+    """
+
+    pool = pool or HTTP_POOL
     try:
-        subprocess.run(
-            cmd,
-            check=True,
-            shell=True,
-        )
-    except subprocess.CalledProcessError as err:
-        logging.info(err)
+        with open_with_backoff(pool, "GET", f"{url}.idx") as resp:
+            index_text = resp.read().decode("utf-8", errors="replace")
+            status = resp.status
+    except (http.client.HTTPException, OSError) as err:
+        logging.info(f"Could not fetch index for {url}: {err}")
+        status = None
+    if status != 200:
+        logging.info(f"No index available for {url}, downloading the whole file")
+        return download_file(url, target_path, pool=pool, checksums=checksums)
+
+    ranges = grib_byte_ranges(parse_grib_index(index_text), variables, levels)
+    if not ranges:
+        logging.info(f"No messages in {url} match variables={variables} levels={levels}")
         return False
-    except:
-        logging.error("Command failed!")
-        raise
+    logging.debug(f"Byte ranges to fetch from {url}: {ranges}")
 
+    file_path = os.path.join(target_path, os.path.basename(urlparse(url).path))
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "wb") as out_file:
+            for start, end in ranges:
+                byte_range = f"bytes={start}-{'' if end is None else end}"
+                with open_with_backoff(
+                    pool, "GET", url, headers={"Range": byte_range}
+                ) as resp:
+                    if resp.status == 200:
+                        # The server ignored the range and sent the
+                        # whole file.
+                        out_file.seek(0)
+                        out_file.truncate()
+                        digest = hashlib.sha256()
+                        stream_to_file(resp, out_file, digest)
+                        break
+                    if resp.status != 206:
+                        resp.read()
+                        raise http.client.HTTPException(
+                            f"status {resp.status} for {byte_range}"
+                        )
+                    expected = resp.length
+                    written = stream_to_file(resp, out_file, digest)
+                    if expected is not None and written != expected:
+                        raise http.client.IncompleteRead(b"", expected - written)
+    except (http.client.HTTPException, OSError) as err:
+        logging.info(f"Download failed: {url}\n {err}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return False
+    if checksums is not None:
+        checksums[file_path] = digest.hexdigest()
     return True
 
 
+def stream_to_file(resp, out_file, digest=None):
+
+    """
+    Copies a response body to an open file in ``CHUNK_SIZE`` pieces through a single reused 
+    buffer.
+
+    Args:
+        resp     (http.client.HTTPResponse): Response to read
+        out_file (file)                    : File opened for binary writing
+        digest   (hashlib hash)            : Updated with every piece written, if given
+
+    Returns:
+        The number of bytes written
+    """
+
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    written = 0
+    while True:
+        nbytes = resp.readinto(buf)
+        if not nbytes:
+            break
+        out_file.write(view[:nbytes])
+        if digest is not None:
+            digest.update(view[:nbytes])
+        written += nbytes
+    return written
+
+
 def arg_list_to_range(args):
 
     """
@@ -192,34 +958,18 @@ def arg_list_to_range(args):
     return args
 
 
-def fill_template(template_str, cycle_date, templates_only=False, **kwargs):
+@functools.lru_cache(maxsize=64)
+def cycle_fields(cycle_date):
 
-    """Fills in the provided template string with date time information, and returns the 
-    resulting string.
+    """Computes the date and time fields available to templates for a cycle. The result is 
+    cached, so each cycle is only formatted once per process.
 
     Args:
-      template_str         : A string containing Python templates
-      cycle_date           : A datetime object that will be used to fill in date and time 
-                             information
-      templates_only (bool): When ``True``, this function will only return the templates 
-                             available.
-
-    Keyword Args:
-      ens_group (int): A number associated with a bin where ensemble members are stored in 
-                       archive files.
-      fcst_hr   (int): An integer forecast hour. String formatting should be included in the 
-                       ``template_str``.
-      mem       (int): A single ensemble member. Should be a positive integer value.
+      cycle_date: A datetime object for the cycle
 
     Returns:
-      Filled template string
+      A dict of template field names and their values for the cycle
     """
- 
-    # Parse keyword args
-    ens_group = kwargs.get("ens_group")
-    fcst_hr = kwargs.get("fcst_hr", 0)
-    mem = kwargs.get("mem", "")
-    # -----
 
     cycle_hour = cycle_date.strftime("%H")
 
@@ -235,15 +985,12 @@ def fill_template(template_str, cycle_date, templates_only=False, **kwargs):
     # Integer division is intentional here.
     hh_even = f"{int(cycle_hour) // 2 * 2:02d}"
 
-    format_values = dict(
+    return dict(
         bin6=bin6,
-        ens_group=ens_group,
-        fcst_hr=fcst_hr,
         dd=cycle_date.strftime("%d"),
         hh=cycle_hour,
         hh_even=hh_even,
         jjj=cycle_date.strftime("%j"),
-        mem=mem,
         min=cycle_date.strftime("%M"),
         mm=cycle_date.strftime("%m"),
         yy=cycle_date.strftime("%y"),
@@ -253,9 +1000,143 @@ def fill_template(template_str, cycle_date, templates_only=False, **kwargs):
         yyyymmddhh=cycle_date.strftime("%Y%m%d%H"),
     )
 
+
+class Template:
+
+    """A template string that is parsed once and can then be filled for many cycles, members 
+    and forecast hours. Rendering gives the same result as ``str.format`` with the fields 
+    listed by ``fill_template(..., templates_only=True)``.
+
+    Args:
+      template_str (str): A string containing Python templates
+    """
+
+    # Fields that vary within a cycle, along with their defaults
+    RUN_FIELDS = {"ens_group": None, "fcst_hr": 0, "mem": ""}
+
+    _formatter = string.Formatter()
+
+    def __init__(self, template_str):
+        self.template_str = template_str
+        self.parts = []
+        self.simple = True
+        for literal, field, spec, conversion in self._formatter.parse(template_str):
+            if field is not None and (
+                not field.isidentifier() or "{" in spec or conversion not in (None, "s")
+            ):
+                # Nested or indexed fields are left to str.format
+                self.simple = False
+            self.parts.append((literal, field, spec))
+        self.fields = {field for _, field, _ in self.parts if field is not None}
+        self.varies = self.fields & set(self.RUN_FIELDS)
+
+    def _fill(self, values):
+        if not self.simple:
+            return self.template_str.format(**values)
+        pieces = []
+        for literal, field, spec in self.parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(format(values[field], spec))
+        return "".join(pieces)
+
+    def render(self, cycle_date, **kwargs):
+
+        """Fills in the template for a single set of values.
+
+        Args:
+          cycle_date: A datetime object for the cycle
+
+        Keyword Args:
+          Any of the fields in ``RUN_FIELDS``
+
+        Returns:
+          Filled template string
+        """
+
+        if not self.fields:
+            return self.template_str
+        values = dict(cycle_fields(cycle_date), **self.RUN_FIELDS)
+        values.update(kwargs)
+        return self._fill(values)
+
+    def render_all(self, cycle_date, members=None, fcst_hrs=None, **kwargs):
+
+        """Fills in the template for every combination of ensemble member and forecast hour, 
+        with forecast hours varying fastest.
+
+        Args:
+          cycle_date      : A datetime object for the cycle
+          members   (list): Ensemble members. Defaults to a single, empty member.
+          fcst_hrs  (list): Forecast hours. Defaults to a single forecast hour of 0.
+
+        Keyword Args:
+          ens_group (int): Passed through to the template
+
+        Returns:
+          A list of filled template strings, one per member and forecast hour
+        """
+
+        members = [self.RUN_FIELDS["mem"]] if members is None else members
+        fcst_hrs = [self.RUN_FIELDS["fcst_hr"]] if fcst_hrs is None else fcst_hrs
+        count = len(members) * len(fcst_hrs)
+        if not self.varies - set(kwargs):
+            # Nothing left that differs between members and forecast
+            # hours, so fill once and repeat.
+            return [self.render(cycle_date, **kwargs)] * count
+
+        values = dict(cycle_fields(cycle_date), **self.RUN_FIELDS)
+        values.update(kwargs)
+        rendered = []
+        for mem in members:
+            values["mem"] = mem
+            for fcst_hr in fcst_hrs:
+                values["fcst_hr"] = fcst_hr
+                rendered.append(self._fill(values))
+        return rendered
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(template_str):
+
+    """Returns the parsed ``Template`` for a template string, reusing it across calls.
+
+    Args:
+      template_str (str): A string containing Python templates
+
+    Returns:
+      A Template object
+    """
+
+    return Template(template_str)
+
+
+def fill_template(template_str, cycle_date, templates_only=False, **kwargs):
+
+    """Fills in the provided template string with date time information, and returns the 
+    resulting string.
+
+    Args:
+      template_str         : A string containing Python templates
+      cycle_date           : A datetime object that will be used to fill in date and time 
+                             information
+      templates_only (bool): When ``True``, this function will only return the templates 
+                             available.
+
+    Keyword Args:
+      ens_group (int): A number associated with a bin where ensemble members are stored in 
+                       archive files.
+      fcst_hr   (int): An integer forecast hour. String formatting should be included in the 
+                       ``template_str``.
+      mem       (int): A single ensemble member. Should be a positive integer value.
+
+    Returns:
+      Filled template string
+    """
+
     if templates_only:
-        return f'{",".join((format_values.keys()))}'
-    return template_str.format(**format_values)
+        return ",".join(sorted(set(cycle_fields(cycle_date)) | set(Template.RUN_FIELDS)))
+    return compile_template(template_str).render(cycle_date, **kwargs)
 
 
 def create_target_path(target_path):
@@ -280,6 +1161,9 @@ def find_archive_files(paths, file_names, cycle_date, ens_group):
     names, and a cycle date, check HPSS via hsi to make sure at least
     one set exists. Return a dict of the paths of the existing archive, along with
     the item in set of paths that was found.
+
+    Each HPSS directory is listed once per process with ``hpss_listing``, no matter how many 
+    candidate archives it holds.
     
     Args:
         paths       (list): Archive paths
@@ -308,9 +1192,8 @@ def find_archive_files(paths, file_names, cycle_date, ens_group):
             # set exists at this date.
             file_path = os.path.join(archive_path, archive_file_name)
             file_path = fill_template(file_path, cycle_date, ens_group=ens_group)
-            file_path = hsi_single_file(file_path)
 
-            if file_path:
+            if hpss_file_exists(file_path):
                 existing_archives[n_fp] = file_path
 
         if existing_archives:
@@ -362,6 +1245,170 @@ def get_file_templates(cla, known_data_info, data_store, use_cla_tmpl=False):
     return file_templates
 
 
+def retrieve_file(
+    cla,
+    input_loc,
+    target_path,
+    method,
+    limiter=None,
+    grib_filter=None,
+    cache=None,
+    data_store=None,
+    retrieved=None,
+    manifest=None,
+):
+
+    # pylint: disable=too-many-arguments
+
+    """Retrieves a single file from disk or from a URL, consulting the data cache first when 
+    one is given. A file recorded in the manifest of its output directory that has not changed 
+    since is not retrieved again.
+
+    Args:
+      cla         (str)        : Command line arguments (Namespace object)
+      input_loc   (str)        : Path or URL of the file to be retrieved
+      target_path (str)        : Directory in which to place the file
+      method      (str)        : Choice of ``"disk"`` or ``"download"``
+      limiter     (HostLimiter): Bounds the concurrent requests made to the host of a URL
+      grib_filter (dict)       : ``variables`` and ``levels`` lists. When either is set, only 
+                                 the matching GRIB2 messages of a download are fetched.
+      cache       (DataCache)  : Shared cache of retrieved files
+      data_store  (str)        : Name of the data store, used in the cache key
+      retrieved   (Retrieved)  : Files already retrieved by this process. A file that has 
+                                 been retrieved for an earlier cycle is copied from there.
+      manifest    (Manifest)   : Manifests of the files in the output directories
+
+    Returns:
+      A boolean value reflecting whether the retrieval was successful
+    """
+
+    subset = grib_filter and (grib_filter.get("variables") or grib_filter.get("levels"))
+    source = input_loc
+    if subset:
+        variables, levels = grib_filter.get("variables"), grib_filter.get("levels")
+        source = f"{input_loc} variables={variables} levels={levels}"
+    dest_path = os.path.join(target_path, os.path.basename(urlparse(input_loc).path))
+    checksums = {}
+
+    def fetch():
+        if cla.dry_run:
+            print(f"  {input_loc} -> {target_path}")
+            return True
+        logging.info(f"Getting file: {input_loc}")
+        logging.debug(f"Target path: {target_path}")
+        if method == "disk":
+            if cla.symlink:
+                return copy_file(input_loc, target_path, "symlink")
+            if cla.hardlink:
+                return copy_file(input_loc, target_path, "hardlink")
+            return copy_file(input_loc, target_path)
+
+        with (limiter or HostLimiter(1)).slot(input_loc):
+            if cla.check_file:
+                return check_file(input_loc)
+            if subset:
+                return download_grib_subset(
+                    input_loc,
+                    target_path,
+                    variables=grib_filter.get("variables"),
+                    levels=grib_filter.get("levels"),
+                    checksums=checksums,
+                )
+            return download_file(input_loc, target_path, checksums=checksums)
+
+    # Only single files that are copied or downloaded can be reused
+    if (
+        cla.check_file
+        or cla.dry_run
+        or (method == "disk" and cla.symlink)
+        or "*" in input_loc
+    ):
+        return fetch()
+
+    if manifest is not None:
+        if manifest.matches(dest_path, source, method):
+            logging.info(f"Already retrieved, skipping: {dest_path}")
+            return True
+        if method == "download" and manifest.recorded(dest_path) and os.path.exists(dest_path):
+            # A complete file from an earlier run that has changed since.
+            # Start over instead of resuming it as a partial download.
+            logging.info(f"Retrieving changed file again: {dest_path}")
+            os.remove(dest_path)
+
+    if retrieved is not None and retrieved.place(source, target_path):
+        success = True
+    elif cache is not None:
+        success = cache.provide(data_store or method, source, dest_path, fetch)
+    else:
+        success = fetch()
+
+    if success:
+        if retrieved is not None:
+            retrieved.add(source, target_path, input_loc)
+        if manifest is not None:
+            manifest.record(dest_path, source, method, checksums.get(dest_path))
+    return success
+
+
+def retrieve_fcst_hr(cla, locs_files, fcst_hr, mem, target_path, method, **kwargs):
+
+    """Retrieves all files for a single forecast hour and ensemble member, trying each 
+    location/template combination in order until one provides every file.
+
+    Args:
+      cla         (str)        : Command line arguments (Namespace object)
+      locs_files  (list)       : Pairs of locations and file templates from 
+                                 ``pair_locs_with_files``
+      fcst_hr     (int)        : Forecast hour
+      mem         (int)        : Ensemble member
+      target_path (str)        : Directory in which to place the files
+      method      (str)        : Choice of ``"disk"`` or ``"download"``
+
+    Keyword Args:
+      Passed on to ``retrieve_file``
+
+    Returns:
+      unavailable (list): Locations of files that could not be retrieved from any location. 
+                          Empty if one location provided all files.
+    """
+
+    logging.debug(f"Looking for fhr = {fcst_hr}")
+    unavailable = []
+    for loc, templates in locs_files:
+
+        templates = templates if isinstance(templates, list) else [templates]
+
+        logging.debug(f"Looking for files like {templates}")
+        logging.debug(f"They should be here: {loc}")
+
+        missing = []
+        template_loc = loc
+        for tmpl_num, template in enumerate(templates):
+            if isinstance(loc, list) and len(loc) == len(templates):
+                template_loc = loc[tmpl_num]
+            input_loc = os.path.join(template_loc, template)
+            input_loc = fill_template(
+                input_loc,
+                cla.cycle_date,
+                fcst_hr=fcst_hr,
+                mem=mem,
+            )
+            retrieved = retrieve_file(cla, input_loc, target_path, method, **kwargs)
+            logging.debug(f"Retrieved status: {retrieved}")
+            if not retrieved:
+                missing.append(input_loc)
+
+        if not missing:
+            # Start on the next fcst hour if all files were
+            # found from a loc/template combo
+            return []
+        unavailable.extend(missing)
+        logging.debug(f"Some files were not retrieved: {missing}")
+        logging.debug("Will check other locations for missing files")
+
+    return unavailable
+
+
 def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs):
 
     # pylint: disable=too-many-locals
@@ -369,6 +1416,10 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
     """Copies files from disk locations or downloads files from a URL, depending on the option 
     specified by the user.
 
+    Every member and forecast hour is retrieved concurrently on a pool of ``cla.workers`` 
+    threads, with no more than ``cla.max_host_connections`` requests in flight to any one host. 
+    Files are placed by absolute path, so the current working directory is never changed.
+
     This function expects that the output directory exists and is writeable.
 
     Args:
@@ -382,6 +1433,12 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
     Keyword Args:
       members     (list): A list of integers corresponding to the ensemble members
       check_all   (bool): Flag that indicates whether all URLs should be checked for all files
+      grib_filter (dict): ``variables`` and ``levels`` lists selecting the GRIB2 messages to 
+                          download
+      cache  (DataCache): Shared cache of retrieved files
+      data_store   (str): Name of the data store, used in the cache key
+      retrieved (Retrieved): Files retrieved for earlier cycles
+      manifest   (Manifest): Manifests of the files already in the output directories
 
     Returns:
       unavailable (list): A list of locations/files that were unretrievable
@@ -391,6 +1448,14 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
     members = cla.members if isinstance(cla.members, list) else [members]
 
     check_all = kwargs.get("check_all", False)
+    retrieve_kwargs = {
+        "grib_filter": kwargs.get("grib_filter"),
+        "cache": kwargs.get("cache"),
+        "data_store": kwargs.get("data_store", method),
+    }
+
+    retrieve_kwargs["retrieved"] = kwargs.get("retrieved")
+    retrieve_kwargs["manifest"] = kwargs.get("manifest")
 
     logging.info(f"Getting files named like {file_templates}")
 
@@ -402,74 +1467,43 @@ def get_requested_files(cla, file_templates, input_locs, method="disk", **kwargs
 
     input_locs = input_locs if isinstance(input_locs, list) else [input_locs]
 
-    orig_path = os.getcwd()
     unavailable = []
 
     locs_files = pair_locs_with_files(input_locs, file_templates, check_all)
+
+    if method == "download":
+        retrieve_kwargs["limiter"] = HostLimiter(cla.max_host_connections)
+
+    target_paths = {}
     for mem in members:
         target_path = fill_template(cla.output_path, cla.cycle_date, mem=mem)
-        target_path = create_target_path(target_path)
-
-        logging.info(f"Retrieved files will be placed here: \n {target_path}")
-        os.chdir(target_path)
-
-        for fcst_hr in cla.fcst_hrs:
-            logging.debug(f"Looking for fhr = {fcst_hr}")
-            for loc, templates in locs_files:
-
-                templates = templates if isinstance(templates, list) else [templates]
-
-                logging.debug(f"Looking for files like {templates}")
-                logging.debug(f"They should be here: {loc}")
-
-                template_loc = loc
-                for tmpl_num, template in enumerate(templates):
-                    if isinstance(loc, list) and len(loc) == len(templates):
-                        template_loc = loc[tmpl_num]
-                    input_loc = os.path.join(template_loc, template)
-                    input_loc = fill_template(
-                        input_loc,
-                        cla.cycle_date,
-                        fcst_hr=fcst_hr,
-                        mem=mem,
-                    )
-                    logging.info(f"Getting file: {input_loc}")
-                    logging.debug(f"Target path: {target_path}")
-                    if method == "disk":
-                        if cla.symlink:
-                            retrieved = copy_file(input_loc, target_path, "ln -sf")
-                        else:
-                            retrieved = copy_file(input_loc, target_path, "cp")
-
-                    elif method == "download":
-
-                        if cla.check_file:
-                            retrieved = check_file(input_loc)
-
-                        else:
-                            retrieved = download_file(input_loc)
-                        # Wait a bit before trying the next download.
-                        # Seems to reduce the occurrence of timeouts
-                        # when downloading from AWS
-                        time.sleep(5)
-
-                    logging.debug(f"Retrieved status: {retrieved}")
-                    if not retrieved:
-                        unavailable.append(input_loc)
-
-                if not unavailable:
-                    # Start on the next fcst hour if all files were
-                    # found from a loc/template combo
-                    break
-                else:
-                    logging.debug(f"Some files were not retrieved: {unavailable}")
-                    logging.debug("Will check other locations for missing files")
+        target_paths[mem] = create_target_path(target_path)
+        logging.info(f"Retrieved files for member {mem} will be placed here: \n {target_path}")
+
+    with ThreadPoolExecutor(max_workers=max(1, cla.workers)) as pool:
+        futures = [
+            pool.submit(
+                retrieve_fcst_hr,
+                cla,
+                locs_files,
+                fcst_hr,
+                mem,
+                target_paths[mem],
+                method,
+                **retrieve_kwargs,
+            )
+            for mem in members
+            for fcst_hr in cla.fcst_hrs
+        ]
+        # Collect results in submission order so the report does
+        # not depend on which retrieval finished first.
+        for future in futures:
+            unavailable.extend(future.result())
 
-    os.chdir(orig_path)
     return unavailable
 
 
-def hsi_single_file(file_path, mode="ls"):
+def hsi_single_file(file_path, mode="ls", cwd=None):
 
     """Calls ``hsi`` as a subprocess for Python and returns information about whether the 
     ``file_path`` was found.
@@ -478,6 +1512,7 @@ def hsi_single_file(file_path, mode="ls"):
         file_path   (str): File path on HPSS
         mode        (str): The ``hsi`` command to run. ``ls`` is default. May also pass ``get`` 
                            to retrieve the file path.
+        cwd         (str): Directory in which to run ``hsi``. ``get`` places the file here.
     """
     cmd = f"hsi {mode} {file_path}"
 
@@ -487,6 +1522,7 @@ def hsi_single_file(file_path, mode="ls"):
             cmd,
             check=True,
             shell=True,
+            cwd=cwd,
         )
     except subprocess.CalledProcessError:
         logging.warning(f"{file_path} is not available!")
@@ -495,35 +1531,77 @@ def hsi_single_file(file_path, mode="ls"):
     return file_path
 
 
-def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1):
+# Names found in each HPSS directory, shared by every lookup in this process.
+_HPSS_LISTINGS = {}
 
-    # pylint: disable=too-many-locals
 
-    """This function interacts with the "hpss" protocol in a provided data store specs file to 
-    download a set of files requested by the user. Depending on the type of archive file (``zip`` 
-    or ``tar``), it will either pull the entire file and unzip it or attempt to pull individual 
-    files from a tar file.
+def hpss_listing(directory):
+
+    """Lists an HPSS directory with a single ``hsi ls`` call. The result is kept for the rest 
+    of the process, so checking any number of candidate archives in the same directory costs one 
+    call.
+
+    Args:
+        directory (str): Directory on HPSS
+
+    Returns:
+        A set of the names in the directory. Empty if the directory is not available.
+    """
+
+    if directory not in _HPSS_LISTINGS:
+        cmd = ["hsi", "-P", "ls", "-1", directory]
+        logging.info(f"Running command \n {' '.join(cmd)}")
+        proc = subprocess.run(cmd, check=False, capture_output=True, text=True)
+        names = set()
+        if proc.returncode == 0:
+            # hsi writes some listings to stderr, so look at both.
+            for line in (proc.stdout + proc.stderr).splitlines():
+                line = line.strip()
+                if line and not line.endswith(":"):
+                    names.add(os.path.basename(line.rstrip("/")))
+        else:
+            logging.warning(f"{directory} is not available!")
+        _HPSS_LISTINGS[directory] = names
+    return _HPSS_LISTINGS[directory]
+
+
+def hpss_file_exists(file_path):
+
+    """Returns True if the file is listed in its HPSS directory."""
+
+    return os.path.basename(file_path) in hpss_listing(os.path.dirname(file_path))
+
+
+def plan_hpss_retrieval(cla, file_names, store_specs, cache=None, manifest=None):
+
+    # pylint: disable=too-many-locals
 
-    It cleans up the local disk after files are deemed available in order to remove any empty 
-    subdirectories that may still be present.
+    """Plans the retrieval of every requested file from HPSS across all ensemble groups, members 
+    and forecast hours, grouping the files by the archive that holds them so that each archive 
+    is read once.
 
-    This function exepcts that the output directory exists and is writable.
+    A requested file may live in any of the ``archive_internal_dir`` options, so every option is 
+    requested from each archive of the set found for its ensemble group.
 
     Args:
         cla          (str): Command line arguments (Namespace object)
         file_names  (list): List of file names
         store_specs (dict): Data-store specifications (specs) file
-        members     (list): A list of integers corresponding to the ensemble members
-        ens_group    (int): A number associated with a bin where ensemble members are stored in 
-                            archive files
+        cache  (DataCache): Shared cache of retrieved files. Files already in the cache are 
+                            linked into place and left out of the plan.
+        manifest (Manifest): Manifests of the output directories. Files already in place are 
+                             left out of the plan.
 
     Returns:
-        A Python set of unavailable files
-
-    Raises:
-        Exception: If there is an error running the archive extraction command
+        plan (dict): A dictionary with keys
+
+          * ``archives``: archive path -> list of paths to extract from it
+          * ``wanted``: one entry per requested file with its ``output_path``, the 
+            ``candidates`` paths inside the archive, its ``source`` and its ``cache_key``
+          * ``cached``: entries that were placed from the cache
+          * ``present``: entries that were already in place according to the manifest
+          * ``missing_archives``: archive options that were not found for an ensemble group
     """
-    members = [-1] if members == -1 else members
 
     archive_paths = store_specs["archive_path"]
     archive_paths = (
@@ -538,131 +1616,287 @@ def hpss_requested_files(cla, file_names, store_specs, members=-1, ens_group=-1)
     if isinstance(archive_file_names, dict):
         archive_file_names = archive_file_names[cla.file_set]
 
-    unavailable = {}
-    existing_archives = {}
+    archive_internal_dirs = store_specs.get("archive_internal_dir", [""])
+    if isinstance(archive_internal_dirs, dict):
+        archive_internal_dirs = archive_internal_dirs.get(cla.file_set, [""])
 
     logging.debug(
         f"Will try to look for: " f" {list(zip(archive_paths, archive_file_names))}"
     )
-
-    existing_archives, which_archive = find_archive_files(
-        archive_paths,
-        archive_file_names,
-        cla.cycle_date,
-        ens_group=ens_group,
-    )
-
-    logging.debug(f"Found existing archives: {existing_archives}")
-
-    if not existing_archives:
-        logging.warning("No archive files were found!")
-        unavailable["archive"] = list(zip(archive_paths, archive_file_names))
-        return unavailable
-
     logging.info(f"Files in archive are named: {file_names}")
 
-    archive_internal_dirs = store_specs.get("archive_internal_dir", [""])
-    if isinstance(archive_internal_dirs, dict):
-        archive_internal_dirs = archive_internal_dirs.get(cla.file_set, [""])
-
-    # which_archive matters for choosing the correct file names within,
-    # but we can safely just try all options for the
-    # archive_internal_dir
-    logging.debug(f"Checking archive number {which_archive} in list.")
+    plan = {
+        "archives": {},
+        "wanted": [],
+        "cached": [],
+        "present": [],
+        "missing_archives": [],
+    }
+    for ens_group, members in get_ens_groups(cla.members).items():
+        existing_archives, which_archive = find_archive_files(
+            archive_paths,
+            archive_file_names,
+            cla.cycle_date,
+            ens_group=ens_group,
+        )
+        if not existing_archives:
+            logging.warning(f"No archive files were found for ensemble group {ens_group}!")
+            plan["missing_archives"].extend(zip(archive_paths, archive_file_names))
+            continue
+        logging.debug(f"Using archive number {which_archive} in list.")
+
+        archives = list(existing_archives.values())
+        # Files are placed in the output path by name, whichever
+        # internal directory they came from, so they are cached by
+        # archive and name.
+        archive_id = " ".join(sorted(archives))
 
-    for archive_internal_dir_tmpl in archive_internal_dirs:
         for mem in members:
-            archive_internal_dir = fill_template(
-                archive_internal_dir_tmpl,
-                cla.cycle_date,
-                mem=mem,
-            )
-
             output_path = fill_template(cla.output_path, cla.cycle_date, mem=mem)
-            logging.info(f"Will place files in {os.path.abspath(output_path)}")
-            logging.debug(f"CWD: {os.getcwd()}")
-
-            if mem != -1:
-                archive_internal_dir = fill_template(
-                    archive_internal_dir_tmpl,
-                    cla.cycle_date,
-                    mem=mem,
-                )
-                output_path = create_target_path(output_path)
-                logging.info(f"Will place files in {os.path.abspath(output_path)}")
-
-            source_paths = []
             for fcst_hr in cla.fcst_hrs:
                 for file_name in file_names:
-                    source_paths.append(
+                    candidates = [
                         fill_template(
-                            os.path.join(archive_internal_dir, file_name),
+                            os.path.join(internal_dir, file_name),
                             cla.cycle_date,
                             fcst_hr=fcst_hr,
                             mem=mem,
                             ens_group=ens_group,
                         )
-                    )
+                        for internal_dir in archive_internal_dirs
+                    ]
+                    name = os.path.basename(candidates[0])
+                    wanted = {
+                        "output_path": output_path,
+                        "candidates": candidates,
+                        "source": f"{archive_id}:{name}",
+                        "cache_key": None,
+                    }
+                    dest_path = os.path.join(output_path, name)
+                    if (
+                        manifest is not None
+                        and "*" not in name
+                        and manifest.matches(dest_path, wanted["source"], "hpss")
+                    ):
+                        logging.info(f"Already retrieved, skipping: {dest_path}")
+                        plan["present"].append(wanted)
+                        continue
+                    if cache is not None and "*" not in name:
+                        wanted["cache_key"] = cache.key("hpss", wanted["source"])
+                        create_target_path(output_path)
+                        if cache.place(wanted["cache_key"], dest_path):
+                            logging.info(f"Using cached copy of {name}")
+                            plan["cached"].append(wanted)
+                            continue
+                    plan["wanted"].append(wanted)
+                    for archive in archives:
+                        extract = plan["archives"].setdefault(archive, {})
+                        extract.update(dict.fromkeys(candidates))
+
+    plan["archives"] = {
+        archive: list(paths) for archive, paths in plan["archives"].items()
+    }
+    return plan
+
+
+def print_hpss_plan(plan):
+
+    """Prints the archives that would be read and the files that would be extracted from each 
+    of them.
 
-            expected = set(source_paths)
-            unavailable = {}
-            for existing_archive in existing_archives.values():
-                if store_specs.get("archive_format", "tar") == "zip":
+    Args:
+        plan (dict): A plan from ``plan_hpss_retrieval``
+    """
 
-                    # Get the entire file from HPSS
-                    existing_archive = hsi_single_file(existing_archive, mode="get")
+    print(f"HPSS retrieval plan: {len(plan['archives'])} archive(s)")
+    for archive, paths in plan["archives"].items():
+        print(f"  {archive} ({len(paths)} paths)")
+        for path in paths:
+            print(f"    {path}")
+    if plan["cached"]:
+        print(f"  {len(plan['cached'])} file(s) already in the cache")
+    if plan["present"]:
+        print(f"  {len(plan['present'])} file(s) already in the output path")
+    for archive_path, archive_file_name in plan["missing_archives"]:
+        print(f"  Not found: {os.path.join(archive_path, str(archive_file_name))}")
 
-                    # Grab only the necessary files from the archive
-                    cmd = f'unzip -o {os.path.basename(existing_archive)} {" ".join(source_paths)}'
 
-                else:
-                    cmd = f'htar -xvf {existing_archive} {" ".join(source_paths)}'
+def extract_archive(archive, paths, extract_dir, store_specs):
 
-                logging.info(f"Running command \n {cmd}")
+    """Extracts paths from an HPSS archive into a directory with a single ``htar`` call, or 
+    with ``hsi get`` and ``unzip`` for zip archives.
 
-                try:
-                    r = subprocess.run(
-                        cmd,
-                        check=False,
-                        shell=True,
-                    )
-                except:
-                    if r.returncode == 11:
-                        # Continue if files missing from archive; we will check later if this is
-                        # an acceptable condition
-                        logging.warning("One or more files not found in zip archive")
-                        pass
-                    else:
-                        raise Exception("Error running archive extraction command")
-
-                # Check that files exist and Remove any data transfer artifacts.
-                # Returns {'hpss': []}, turn that into a new dict of
-                # sets.
-                unavailable[existing_archive] = set(
-                    clean_up_output_dir(
-                        expected_subdir=archive_internal_dir,
-                        local_archive=os.path.basename(existing_archive),
-                        output_path=output_path,
-                        source_paths=source_paths,
-                    ).get("hpss", [])
-                )
+    Args:
+        archive      (str): Archive path on HPSS
+        paths       (list): Paths to extract from the archive
+        extract_dir  (str): Directory to extract into. Created if it does not exist.
+        store_specs (dict): Data-store specifications (specs) file
+    """
 
-            # Once we go through all the archives, the union of all
-            # "unavailable" files should equal the "expected" list of
-            # files since clean_up_output_dir only reports on those that
-            # are missing from one of the files attempted. If any
-            # additional files are reported as unavailable, then
-            # something has gone wrong.
-            unavailable = set.union(*unavailable.values())
-
-    # Break loop if unexpected files were found or if files were found
-    # A successful file found does not equal the expected file list and 
-    # returns an empty set function.
-    if not expected == unavailable:
-        return unavailable - expected
-    
-    # If this loop has completed successfully without returning early, then all files have been found
-    return {}
+    os.makedirs(extract_dir, exist_ok=True)
+    if store_specs.get("archive_format", "tar") == "zip":
+
+        # Get the entire file from HPSS
+        hsi_single_file(archive, mode="get", cwd=extract_dir)
+
+        # Grab only the necessary files from the archive
+        cmd = ["unzip", "-o", os.path.basename(archive), *paths]
+
+    else:
+        cmd = ["htar", "-xvf", archive, *paths]
+
+    logging.info(f"Running command \n {' '.join(cmd)}")
+    proc = subprocess.run(cmd, check=False, cwd=extract_dir)
+    if proc.returncode != 0:
+        # Not every candidate path exists in every archive; the files
+        # are checked once all archives are extracted.
+        logging.warning(
+            f"{cmd[0]} returned {proc.returncode} for {archive}; "
+            "one or more paths were not found"
+        )
+
+
+def hpss_requested_files(cla, file_names, store_specs, cache=None):
+
+    """Retrieves the requested files for a single cycle from HPSS. See ``hpss_requested_cycles``.
+
+    Args:
+        cla          (str): Command line arguments (Namespace object)
+        file_names  (list): List of file names
+        store_specs (dict): Data-store specifications (specs) file
+        cache  (DataCache): Shared cache of retrieved files
+
+    Returns:
+        unavailable (list): Archives that were not found and files that were not in any archive
+    """
+
+    return hpss_requested_cycles([cla], file_names, store_specs, cache=cache)[
+        cla.cycle_date
+    ]
+
+
+def hpss_requested_cycles(clas, file_names, store_specs, cache=None, manifest=None):
+
+    # pylint: disable=too-many-locals
+
+    """This function interacts with the "hpss" protocol in a provided data store specs file to 
+    download a set of files requested by the user. Depending on the type of archive file (``zip`` 
+    or ``tar``), it will either pull the entire file and unzip it or attempt to pull individual 
+    files from a tar file.
+
+    The files needed by all cycles, ensemble groups, members and forecast hours are planned up 
+    front with ``plan_hpss_retrieval``, so that each archive is read with a single ``htar`` (or 
+    ``hsi get``) call, even when it holds files for several cycles. Up to ``--workers`` archives 
+    are extracted at once, each into its own directory under a staging directory next to the 
+    output, from which each file is moved into place; the staging directory is then removed.
+
+    Args:
+        clas        (list): Command line arguments (Namespace objects), one per cycle
+        file_names  (list): List of file names
+        store_specs (dict): Data-store specifications (specs) file
+        cache  (DataCache): Shared cache of retrieved files. Cached files are linked into place 
+                            and left out of the extraction; extracted files are added to it.
+        manifest (Manifest): Manifests of the output directories. Files already in place are 
+                             left out of the extraction; extracted files are recorded in them.
+
+    Returns:
+        unavailable (dict): For each cycle date, the archives that were not found and the files 
+                            that were not in any archive
+    """
+
+    plan = {
+        "archives": {},
+        "wanted": [],
+        "cached": [],
+        "present": [],
+        "missing_archives": [],
+    }
+    unavailable = {}
+    for cla in clas:
+        cycle_plan = plan_hpss_retrieval(
+            cla, file_names, store_specs, cache=cache, manifest=manifest
+        )
+        for archive, paths in cycle_plan["archives"].items():
+            extract = plan["archives"].setdefault(archive, {})
+            extract.update(dict.fromkeys(paths))
+        for wanted in cycle_plan["wanted"]:
+            wanted["cycle_date"] = cla.cycle_date
+        plan["wanted"].extend(cycle_plan["wanted"])
+        plan["cached"].extend(cycle_plan["cached"])
+        plan["present"].extend(cycle_plan["present"])
+        plan["missing_archives"].extend(cycle_plan["missing_archives"])
+        unavailable[cla.cycle_date] = list(cycle_plan["missing_archives"])
+    plan["archives"] = {
+        archive: list(paths) for archive, paths in plan["archives"].items()
+    }
+
+    if clas[0].dry_run:
+        print_hpss_plan(plan)
+        return {cla.cycle_date: [] for cla in clas}
+
+    if not plan["wanted"]:
+        return unavailable
+
+    workers = max(1, clas[0].workers)
+    staging_dir = tempfile.mkdtemp(
+        prefix=".hpss_staging.",
+        dir=create_target_path(plan["wanted"][0]["output_path"]),
+    )
+    extract_dirs = [
+        os.path.join(staging_dir, str(num)) for num in range(len(plan["archives"]))
+    ]
+    try:
+        # Each archive is extracted into its own directory, so archives
+        # can be read at the same time.
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(extract_archive, archive, paths, extract_dir, store_specs)
+                for (archive, paths), extract_dir in zip(
+                    plan["archives"].items(), extract_dirs
+                )
+            ]
+            for future in futures:
+                future.result()
+
+        placed = {}
+        for wanted in plan["wanted"]:
+            found = []
+            for candidate in wanted["candidates"]:
+                for extract_dir in extract_dirs:
+                    pattern = os.path.join(extract_dir, candidate.lstrip("/"))
+                    found = sorted(
+                        set(glob.glob(pattern))
+                        | {path for path in placed if fnmatch.fnmatch(path, pattern)}
+                    )
+                    if found:
+                        break
+                if found:
+                    break
+            if not found:
+                logging.info(f"File does not exist in any archive: {wanted['candidates']}")
+                unavailable[wanted["cycle_date"]].append(wanted["candidates"][0])
+                continue
+
+            output_path = create_target_path(wanted["output_path"])
+            for local_path in found:
+                dest_path = os.path.join(output_path, os.path.basename(local_path))
+                if local_path in placed:
+                    shutil.copyfile(placed[local_path], dest_path)
+                else:
+                    logging.info(f"Moving {local_path} to {dest_path}")
+                    shutil.move(local_path, dest_path)
+                    placed[local_path] = dest_path
+                if wanted["cache_key"] is not None:
+                    with cache.locked(wanted["cache_key"]):
+                        cache.store(wanted["cache_key"], dest_path)
+                if manifest is not None and "*" not in wanted["source"]:
+                    manifest.record(dest_path, wanted["source"], "hpss")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if cache is not None:
+        cache.evict()
+    return unavailable
 
 
 def load_str(arg):
@@ -802,7 +2036,9 @@ def _write_summary_file(cla, data_store, file_templates) -> None:
             tmpl = tmpl if isinstance(tmpl, list) else [tmpl]
             for t in tmpl:
                 files.extend(
-                    [fill_template(t, cla.cycle_date, fcst_hr=fh, mem=mem) for fh in cla.fcst_hrs]
+                    compile_template(t).render_all(
+                        cla.cycle_date, members=[mem], fcst_hrs=cla.fcst_hrs
+                    )
                 )
         output_path = fill_template(cla.output_path, cla.cycle_date, mem=mem)
         summary_fp = os.path.join(output_path, cla.summary_file)
@@ -904,10 +2140,22 @@ def main(argv):
         logging.info(msg)
         logging.info(f"Checking provided disk location {cla.input_file_path}")
 
-    unavailable = {}
+    cache = None
+    if cla.cache_dir and not (cla.check_file or cla.dry_run):
+        max_size = None
+        if cla.cache_max_size is not None:
+            max_size = int(cla.cache_max_size * 1024**3)
+        cache = DataCache(cla.cache_dir, max_size=max_size, link=cla.cache_link)
+
+    # Each cycle is retrieved with its own copy of the arguments. Cycles
+    # that are not complete after one data store are tried in the next.
+    pending = [cycle_args(cla, cycle_date) for cycle_date in cla.cycle_dates]
+    retrieved = Retrieved() if len(pending) > 1 else None
+    manifest = None if (cla.check_file or cla.dry_run) else Manifest()
     for data_store in cla.data_stores:
         logging.info(f"Checking {data_store} for {cla.data_type}")
         store_specs = known_data_info.get(data_store, {})
+        unavailable = {run.cycle_date: [] for run in pending}
 
         if data_store == "disk":
             file_templates = get_file_templates(
@@ -918,13 +2166,18 @@ def main(argv):
             )
 
             logging.debug(f"User supplied file names are: {file_templates}")
-            unavailable = get_requested_files(
-                cla,
-                check_all=known_data_info.get("check_all", False),
-                file_templates=file_templates,
-                input_locs=cla.input_file_path,
-                method="disk",
-            )
+            for run in pending:
+                unavailable[run.cycle_date] = get_requested_files(
+                    run,
+                    check_all=known_data_info.get("check_all", False),
+                    file_templates=file_templates,
+                    input_locs=cla.input_file_path,
+                    method="disk",
+                    cache=cache,
+                    data_store=data_store,
+                    retrieved=retrieved,
+                    manifest=manifest,
+                )
 
         elif not store_specs:
             msg = f"No information is available for {data_store}."
@@ -939,41 +2192,74 @@ def main(argv):
             )
 
             if store_specs.get("protocol") == "download":
-                unavailable = get_requested_files(
-                    cla,
-                    check_all=known_data_info.get("check_all", False),
-                    file_templates=file_templates,
-                    input_locs=store_specs["url"],
-                    method="download",
-                    members=cla.members,
-                )
+                for run in pending:
+                    unavailable[run.cycle_date] = get_requested_files(
+                        run,
+                        check_all=known_data_info.get("check_all", False),
+                        file_templates=file_templates,
+                        input_locs=store_specs["url"],
+                        method="download",
+                        members=cla.members,
+                        grib_filter={
+                            "variables": store_specs.get("variables"),
+                            "levels": store_specs.get("levels"),
+                        },
+                        cache=cache,
+                        data_store=data_store,
+                        retrieved=retrieved,
+                        manifest=manifest,
+                    )
 
             if store_specs.get("protocol") == "htar":
-                ens_groups = get_ens_groups(cla.members)
-                for ens_group, members in ens_groups.items():
-                    unavailable = hpss_requested_files(
-                        cla,
-                        file_templates,
-                        store_specs,
-                        members=members,
-                        ens_group=ens_group,
-                    )
+                unavailable = hpss_requested_cycles(
+                    pending,
+                    file_templates,
+                    store_specs,
+                    cache=cache,
+                    manifest=manifest,
+                )
+
+        for run in pending:
+            if not unavailable[run.cycle_date]:
+                # All files are found for this cycle.
+                # Write a variable definitions file for the data, if requested
+                if cla.summary_file and not (cla.check_file or cla.dry_run):
+                    _write_summary_file(run, data_store, file_templates)
+            else:
+                logging.debug(
+                    f"Some unavailable files for {run.cycle_date:%Y%m%d%H}: "
+                    f"{unavailable[run.cycle_date]}"
+                )
 
-        if not unavailable:
+        pending = [run for run in pending if unavailable[run.cycle_date]]
+        if not pending:
             # All files are found. Stop looking!
-            # Write a variable definitions file for the data, if requested
-            if cla.summary_file and not cla.check_file:
-                _write_summary_file(cla, data_store, file_templates)
             break
 
-        logging.debug(f"Some unavailable files: {unavailable}")
         logging.warning(f"Requested files are unavailable from {data_store}")
 
-    if unavailable:
+    if pending:
         logging.error("Could not find any of the requested files.")
         sys.exit(1)
 
 
+def cycle_args(cla, cycle_date):
+
+    """Returns a copy of the command line arguments for a single cycle.
+
+    Args:
+        cla (Namespace): Command line arguments
+        cycle_date     : A datetime object for the cycle
+
+    Returns:
+        A copy of ``cla`` with its ``cycle_date`` set
+    """
+
+    run = copy(cla)
+    run.cycle_date = cycle_date
+    return run
+
+
 def get_ens_groups(members):
 
     """Gets ensemble groups with the corresponding list of ensemble members in that group.
@@ -1047,6 +2333,17 @@ def parse_args(argv):
         default="1999123100",
         type=to_datetime,
     )
+    parser.add_argument(
+        "--cycle_dates",
+        help="Retrieve data for several cycles in one run, given as START \
+        END INCR, where START and END are cycle dates in the same format \
+        as --cycle_date and INCR is the number of hours between cycles. \
+        Overrides --cycle_date. The output path must include a template \
+        that differs between the cycles, e.g. {yyyymmddhh}, since a \
+        summary file is written for each cycle.",
+        nargs=3,
+        metavar=("START", "END", "INCR"),
+    )
     parser.add_argument(
         "--data_stores",
         help="List of priority data_stores. Tries first list item \
@@ -1095,6 +2392,12 @@ def parse_args(argv):
         action="store_true",
         help="Symlink data files when source is disk",
     )
+    parser.add_argument(
+        "--hardlink",
+        action="store_true",
+        help="Hard link data files when source is disk. Files on a \
+        different file system are copied instead.",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -1134,6 +2437,46 @@ def parse_args(argv):
         help="Name of the summary file to be written to the output \
         directory",
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of files (or HPSS archives) to retrieve at the same \
+        time, across all ensemble members and forecast hours. default=4",
+        default=4,
+        type=int,
+    )
+    parser.add_argument(
+        "--max_host_connections",
+        help="Maximum number of simultaneous downloads from any one host. \
+        default=4",
+        default=4,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="A directory holding a cache of retrieved files that is shared \
+        between experiments. Files found in the cache are linked into \
+        the output path instead of being retrieved again.",
+    )
+    parser.add_argument(
+        "--cache_max_size",
+        help="Maximum size of the cache in GB. The least recently used \
+        files are removed when it grows larger. default=no limit",
+        type=float,
+    )
+    parser.add_argument(
+        "--cache_link",
+        choices=("hardlink", "symlink"),
+        default="hardlink",
+        help="How cached files are placed in the output path. Hard links \
+        fall back to symbolic links across file systems. default=hardlink",
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Print the files that would be retrieved without retrieving \
+        them. For the hpss data store, prints the plan of archives to \
+        read and the files to extract from each.",
+    )
     parser.add_argument(
         "--check_file",
         action="store_true",
@@ -1151,6 +2494,32 @@ def parse_args(argv):
     if args.members:
         args.members = arg_list_to_range(args.members)
 
+    if args.cycle_dates:
+        start, end, incr = args.cycle_dates
+        start, end, incr = to_datetime(start), to_datetime(end), int(incr)
+        if incr <= 0 or end < start:
+            raise argparse.ArgumentTypeError(
+                f"Invalid --cycle_dates {' '.join(args.cycle_dates)}; END must not be "
+                "before START and INCR must be a positive number of hours"
+            )
+        args.cycle_dates = []
+        while start <= end:
+            args.cycle_dates.append(start)
+            start += dt.timedelta(hours=incr)
+        args.cycle_date = args.cycle_dates[0]
+        mem = args.members[0] if args.members else ""
+        output_paths = {
+            fill_template(args.output_path, cycle_date, mem=mem)
+            for cycle_date in args.cycle_dates
+        }
+        if len(output_paths) < len(args.cycle_dates):
+            raise argparse.ArgumentTypeError(
+                "--output_path must include a template that differs between "
+                "each of the --cycle_dates, e.g. {yyyymmddhh}"
+            )
+    else:
+        args.cycle_dates = [args.cycle_date]
+
     # Check required arguments for various conditions
     if not args.ics_or_lbcs and args.file_set in ["anl", "fcst"]:
         raise argparse.ArgumentTypeError(f"--ics_or_lbcs is a required " \
@@ -25,6 +25,7 @@ from python_utils import (
     check_for_preexist_dir_file,
     flatten_dict,
     check_structure_dict,
+    load_config_schema,
     update_dict,
     import_vars,
     get_env_var,
@@ -44,6 +45,7 @@ from set_predef_grid_params import set_predef_grid_params
 from set_gridparams_ESGgrid import set_gridparams_ESGgrid
 from set_gridparams_GFDLgrid import set_gridparams_GFDLgrid
 from link_fix import link_fix
+from create_var_defns_sh_files import create_var_defns_sh_files
 
 def load_config_for_setup(ushdir, default_config, user_config):
     """Updates a Python dictionary in place with experiment configuration settings from the 
@@ -166,13 +168,17 @@ def load_config_for_setup(ushdir, default_config, user_config):
         cfg_wflow['rocoto']['tasks']['taskgroups'] = taskgroups
 
     # Extend yaml here on just the rocoto section to include the
-    # appropriate groups of tasks
+    # appropriate groups of tasks. The taskgroups must be rendered before
+    # they are loaded below, so this pass cannot wait for the one on the
+    # whole config.
     extend_yaml(cfg_wflow)
 
 
     # Put the entries expanded under taskgroups in tasks
     rocoto_tasks = cfg_wflow["rocoto"]["tasks"]
-    cfg_wflow["rocoto"]["tasks"] = yaml.load(rocoto_tasks.pop("taskgroups"),Loader=yaml.SafeLoader)
+    cfg_wflow["rocoto"]["tasks"] = yaml.load(
+        rocoto_tasks.pop("taskgroups"), Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    )
 
     # Update wflow config from user one more time to make sure any of
     # the "null" settings are removed, i.e., tasks turned off.
@@ -354,7 +360,7 @@ def set_srw_paths(ushdir, expt_config):
     )
 
 
-def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
+def setup(USHdir, user_config_fn="config.yaml", debug: bool = False, incremental: bool = False):
     """Validates user-provided configuration settings and derives
     a secondary set of parameters needed to configure a Rocoto-based SRW App
     workflow. The secondary parameters are derived from a set of required
@@ -371,6 +377,9 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
         user_config_fn  (str): The name of a user-provided configuration YAML (usually 
                                ``config.yaml``)
         debug          (bool): Enable extra output for debugging
+        incremental    (bool): Keep an existing ``EXPTDIR`` in place, whatever
+                               ``PREEXISTING_DIR_METHOD`` is, so that the experiment can be
+                               regenerated into it
 
     Returns:
         None
@@ -456,32 +465,41 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     expt_subdir = workflow_config.get("EXPT_SUBDIR", "")
     exptdir = workflow_config.get("EXPTDIR")
 
-    # Update some paths that include EXPTDIR and EXPT_BASEDIR
+    # Update some paths that include EXPTDIR and EXPT_BASEDIR, and the
+    # templates that reference the paths set by set_srw_paths. Templates
+    # are compiled once per process, so this pass only walks the config.
     extend_yaml(expt_config)
     preexisting_dir_method = workflow_config.get("PREEXISTING_DIR_METHOD", "")
-    try:
-        check_for_preexist_dir_file(exptdir, preexisting_dir_method)
-    except ValueError:
-        logger.exception(
+    if incremental and os.path.isdir(exptdir):
+        log_info(
             f"""
-            Check that the following values are valid:
-            EXPTDIR {exptdir}
-            PREEXISTING_DIR_METHOD {preexisting_dir_method}
-            """
+            Regenerating the experiment in the existing experiment directory:
+              EXPTDIR = '{exptdir}'"""
         )
-        raise
-    except FileExistsError:
-        errmsg = dedent(
-            f"""
-            EXPTDIR ({exptdir}) already exists, and PREEXISTING_DIR_METHOD = {preexisting_dir_method}
+    else:
+        try:
+            check_for_preexist_dir_file(exptdir, preexisting_dir_method)
+        except ValueError:
+            logger.exception(
+                f"""
+                Check that the following values are valid:
+                EXPTDIR {exptdir}
+                PREEXISTING_DIR_METHOD {preexisting_dir_method}
+                """
+            )
+            raise
+        except FileExistsError:
+            errmsg = dedent(
+                f"""
+                EXPTDIR ({exptdir}) already exists, and PREEXISTING_DIR_METHOD = {preexisting_dir_method}
 
-            To ignore this error, delete the directory, or set 
-            PREEXISTING_DIR_METHOD = delete, or
-            PREEXISTING_DIR_METHOD = rename
-            in your config file.
-            """
-        )
-        raise FileExistsError(errmsg) from None
+                To ignore this error, delete the directory, or set 
+                PREEXISTING_DIR_METHOD = delete, or
+                PREEXISTING_DIR_METHOD = rename
+                in your config file.
+                """
+            )
+            raise FileExistsError(errmsg) from None
 
     #
     # -----------------------------------------------------------------------
@@ -1497,11 +1515,18 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     # -----------------------------------------------------------------------
     #
 
-    extend_yaml(expt_config)
+    # Sections and values have been added since the last pass, so the
+    # whole config is scanned again. The templates left after converting
+    # lists are then rendered with the same resolver.
+    resolver = extend_yaml(expt_config)
     for sect, sect_keys in expt_config.items():
         for k, v in sect_keys.items():
             expt_config[sect][k] = str_to_list(v)
-    extend_yaml(expt_config)
+    resolver.retry()
+    for cycle in resolver.cycles:
+        logger.warning(f"Templates reference each other: {' -> '.join(cycle)}")
+    if resolver.undefined:
+        logging.debug(f"Templates left unrendered:\n{resolver.report()}")
 
     # print content of var_defns if DEBUG=True
     all_lines = cfg_to_yaml_str(expt_config)
@@ -1533,6 +1558,8 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     for dates in ("DATE_FIRST_CYCL", "DATE_LAST_CYCL"):
         var_defns_cfg["workflow"][dates] = date_to_str(var_defns_cfg["workflow"][dates])
     var_defns_cfg.dump(global_var_defns_fp)
+    # Shell versions of its sections, which source_yaml sources instead of running uw
+    create_var_defns_sh_files(global_var_defns_fp)
 
 
     #
@@ -1543,31 +1570,12 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     # -----------------------------------------------------------------------
     #
 
-    # loop through the flattened expt_config and check validity of params
-    cfg_v = load_config_file(os.path.join(USHdir, "valid_param_vals.yaml"))
-    for k, v in flatten_dict(expt_config).items():
-        if v is None or v == "":
-            continue
-        vkey = "valid_vals_" + k
-        if (vkey in cfg_v):
-            if (type(v) == list):
-                if not(all(ele in cfg_v[vkey] for ele in v)):
-                    raise Exception(
-                        dedent(f"""
-                        The variable
-                            {k} = {v}
-                        in the user's configuration has at least one invalid value.  Possible values are:
-                            {k} = {cfg_v[vkey]}"""
-                    ))
-            else:
-                if not (v in cfg_v[vkey]):
-                    raise Exception(
-                        dedent(f"""
-                        The variable
-                            {k} = {v}
-                        in the user's configuration does not have a valid value.  Possible values are:
-                            {k} = {cfg_v[vkey]}"""
-                    ))
+    # check the values of all the params against their valid values, and
+    # report every invalid one at once
+    schema = load_config_schema(os.path.join(USHdir, "valid_param_vals.yaml"))
+    errors = schema.validate(expt_config)
+    if errors:
+        raise Exception("\n".join(errors))
 
     return expt_config
 